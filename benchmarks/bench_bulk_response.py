@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Measures what the ES 0.90 bulk response monkeypatch costs.
+
+Sends bulk requests through an `Elasticsearch` whose transport decodes
+a canned bulk response with a lot of items, the way the real transport
+would, and prints the time per request for:
+
+1. the unpatched ``Elasticsearch.bulk``
+2. the patched one against a 1.x cluster, which leaves the response
+   alone
+3. the patched one against a 0.90 cluster, which normalizes every
+   item
+
+This doesn't need an Elasticsearch cluster. Run it with::
+
+    python benchmarks/bench_bulk_response.py
+
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elasticsearch import Elasticsearch  # noqa
+from elasticsearch.serializer import JSONSerializer  # noqa
+
+# Keep the unpatched bulk around before elasticutils patches it.
+unpatched_bulk = Elasticsearch.bulk
+
+from elasticutils import monkeypatch  # noqa
+
+# Importing elasticutils doesn't patch; get_es() does. Patch here so
+# the version check is what's measured.
+monkeypatch.monkeypatch_es()
+
+
+NUM_ITEMS = 5000
+REPEAT = 20
+
+# Items are padded to this many bytes so that 0.90 and 1.x responses
+# are the same size and only the normalizing differs.
+ITEM_SIZE = 100
+
+
+def make_payload(version):
+    items = []
+    for i in range(NUM_ITEMS):
+        item = {'_index': 'bench', '_type': 'doc', '_id': str(i),
+                '_version': 1, '_pad': ''}
+        if version.startswith('0.90'):
+            item['ok'] = True
+        else:
+            item['status'] = 201
+        item['_pad'] = 'x' * (ITEM_SIZE - len(json.dumps(item)))
+        items.append({'index': item})
+    return json.dumps({'took': 30, 'items': items})
+
+
+class FakeTransport(object):
+    def __init__(self, hosts, version='1.2.1', **kwargs):
+        self.serializer = JSONSerializer()
+        self.version = version
+        self.payload = make_payload(version)
+
+    def perform_request(self, method, url, params=None, body=None):
+        if url == '/':
+            return 200, {'version': {'number': self.version}}
+        return 200, self.serializer.loads(self.payload)
+
+
+def run(label, bulk, version):
+    es = Elasticsearch(transport_class=FakeTransport, version=version)
+    body = [{'index': {'_id': 1}}, {'id': 1}]
+    bulk(es, body)
+
+    elapsed = min(timeit.repeat(lambda: bulk(es, body), number=REPEAT,
+                                repeat=3))
+    print('%-26s %8.2f ms per response' % (label, elapsed / REPEAT * 1000))
+
+
+def main():
+    print('%d items per bulk response' % NUM_ITEMS)
+    print('patched: %s' % (Elasticsearch.bulk is not unpatched_bulk))
+    print('payload bytes: 1.x %d, 0.90 %d' % (
+        len(make_payload('1.2.1')), len(make_payload('0.90.13'))))
+    run('unpatched', unpatched_bulk, '1.2.1')
+    run('patched, 1.x cluster', Elasticsearch.bulk, '1.2.1')
+    run('patched, 0.90 cluster', Elasticsearch.bulk, '0.90.13')
+
+
+if __name__ == '__main__':
+    main()
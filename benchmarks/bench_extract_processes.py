@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Measures document extraction speed with different numbers of processes.
+
+Builds a list of objects with an HTML body and runs them through
+``Indexable.get_indexable_documents()`` with an ``extract_document``
+that strips tags and normalizes whitespace, which is CPU-bound. It
+prints documents per second in the calling process and with 1 up to
+the number of cores in child processes, and the speedup over the
+calling process.
+
+This doesn't need an Elasticsearch cluster. Run it with::
+
+    python benchmarks/bench_extract_processes.py
+
+"""
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elasticutils import Indexable  # noqa
+
+
+NUM_OBJECTS = 2000
+CHUNK_SIZE = 100
+PARAGRAPHS = 50
+
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'\s+')
+
+
+class Post(object):
+    def __init__(self, id, body):
+        self.id = id
+        self.body = body
+
+
+class PostIndexable(Indexable):
+    @classmethod
+    def get_indexable(cls):
+        body = ''.join(
+            '<p class="para">Paragraph <b>%d</b> with   <a href="#">a link'
+            '</a> and\n some <i>text</i>.</p>\n' % i
+            for i in range(PARAGRAPHS))
+        return [Post(i, body) for i in range(NUM_OBJECTS)]
+
+    @classmethod
+    def extract_document(cls, obj_id, obj=None):
+        text = SPACE_RE.sub(' ', TAG_RE.sub(' ', obj.body)).strip()
+        words = text.lower().split()
+        return {
+            'id': obj.id,
+            'body': text,
+            'words': len(words),
+            'unique_words': len(set(words)),
+        }
+
+
+def run(processes):
+    start = time.time()
+    count = sum(1 for doc in PostIndexable.get_indexable_documents(
+        chunk_size=CHUNK_SIZE, processes=processes))
+    return count / (time.time() - start)
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    print('%d objects, %d per chunk, %d cores' % (
+        NUM_OBJECTS, CHUNK_SIZE, cores))
+
+    baseline = run(None)
+    print('%-14s %9.0f docs/s' % ('in process', baseline))
+    for processes in range(1, cores + 1):
+        rate = run(processes)
+        print('%-14s %9.0f docs/s  %5.2fx' % (
+            '%d processes' % processes, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
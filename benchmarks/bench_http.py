@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""Compares HTTP throughput for different ``get_es`` connection settings.
+
+Starts a local fake Elasticsearch that answers every request with a
+search-sized JSON response after sleeping for the time it'd take to
+transfer the request and response bodies over the network. New
+connections pay a simulated round trip for connection setup. Then
+several threads send bulk-sized requests through one `Elasticsearch`
+object built by :py:func:`elasticutils.get_es` with different
+settings and it prints requests per second for each.
+
+It runs two scenarios:
+
+1. latency-bound: every request gets its own link, so throughput
+   depends on how many requests are in flight, which depends on the
+   connection pool settings
+2. bandwidth-bound: requests share one link, so throughput depends
+   on how many bytes go over it, which depends on compression
+
+This doesn't need an Elasticsearch cluster. Run it with::
+
+    python benchmarks/bench_http.py
+
+"""
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from six.moves import socketserver
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elasticutils import get_es  # noqa
+from elasticutils.connection import gzip_compress  # noqa
+
+
+THREADS = 20
+REQUESTS_PER_THREAD = 10
+# Simulated round trip time in seconds.
+RTT = 0.02
+# Simulated link speed in bytes per second (100 Mbit/s).
+BANDWIDTH = 100 * 1000 * 1000 / 8
+SHARED_LINK = threading.Lock()
+
+
+class NoLink(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+RESPONSE = json.dumps({
+    'took': 1,
+    'hits': {
+        'total': 100,
+        'hits': [
+            {'_id': str(i), '_source': {'title': 'Document %d' % i,
+                                        'body': 'lorem ipsum ' * 200}}
+            for i in range(100)
+        ]
+    }
+}).encode('utf-8')
+
+REQUEST = '\n'.join(
+    json.dumps(line) for i in range(500)
+    for line in ({'index': {'_id': i}},
+                 {'title': 'Document %d' % i, 'body': 'lorem ipsum ' * 50})
+) + '\n'
+
+
+class FakeESHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # TCP handshake
+        time.sleep(RTT)
+        self.server.connections += 1
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['content-length']))
+        transferred = len(body)
+        if self.headers.get('content-encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+
+        data = RESPONSE
+        self.send_response(200)
+        if 'gzip' in self.headers.get('accept-encoding', ''):
+            data = gzip_compress(data)
+            self.send_header('content-encoding', 'gzip')
+        transferred += len(data)
+        time.sleep(RTT)
+        with self.server.link:
+            time.sleep(float(transferred) / BANDWIDTH)
+
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    link = NoLink()
+    connections = 0
+
+
+def run(label, server, **settings):
+    url = '127.0.0.1:%d' % server.server_address[1]
+    es = get_es(urls=[url], force_new=True, **settings)
+    server.connections = 0
+
+    def worker():
+        for i in range(REQUESTS_PER_THREAD):
+            es.transport.perform_request('POST', '/_bulk', body=REQUEST)
+            # Workers do other things between requests.
+            time.sleep(random.random() * RTT)
+
+    threads = [threading.Thread(target=worker) for i in range(THREADS)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+
+    print('%-40s %7.1f req/s  %4d connections opened' % (
+        label, THREADS * REQUESTS_PER_THREAD / duration,
+        server.connections))
+
+
+def main():
+    server = ThreadedHTTPServer(('127.0.0.1', 0), FakeESHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    print('%d threads, %d byte requests, %d byte responses' % (
+        THREADS, len(REQUEST), len(RESPONSE)))
+
+    print('\nLatency-bound')
+    server.link = NoLink()
+    run('defaults', server)
+    run('maxsize=%d, pool_block' % THREADS, server,
+        maxsize=THREADS, pool_block=True)
+    run('maxsize=%d, pool_block, keep_alive' % THREADS, server,
+        maxsize=THREADS, pool_block=True, keep_alive=True)
+
+    print('\nBandwidth-bound (shared %d Mbit/s link)' % (
+        BANDWIDTH * 8 / 1000 / 1000))
+    server.link = SHARED_LINK
+    run('maxsize=%d, pool_block' % THREADS, server,
+        maxsize=THREADS, pool_block=True)
+    run('maxsize=%d, pool_block, http_compress' % THREADS, server,
+        maxsize=THREADS, pool_block=True, http_compress=True)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Measures how long ``import elasticutils`` takes.
+
+Imports ``elasticutils`` and ``elasticutils.contrib.django`` in fresh
+interpreters with ``python -X importtime`` several times and prints the
+fastest total import time for each, the modules that took the longest
+and whether elasticsearch-py was imported.
+
+This needs Python 3.7 or later for ``-X importtime`` and Django for
+``elasticutils.contrib.django``. It doesn't need an Elasticsearch
+cluster. Run it with::
+
+    python benchmarks/bench_import.py
+
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['elasticutils', 'elasticutils.contrib.django']
+RUNS = 5
+TOP = 5
+
+
+def import_times(module):
+    """Imports a module in a fresh interpreter
+
+    :returns: ``(total, children, imported_es)`` where ``total`` is the
+        cumulative microseconds for ``module``, ``children`` is a list
+        of ``(microseconds, name)`` for the modules it imported
+        directly and ``imported_es`` is whether elasticsearch-py was
+        imported
+
+    """
+    code = ('import sys, {0}; '
+            'print("elasticsearch" in sys.modules)'.format(module))
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(err)
+
+    # Lines are in the order imports finish, children first and
+    # indented two more spaces than their parent.
+    children = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() != module:
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative_us), name.strip()))
+        elif depth == 0:
+            return int(cumulative_us), children, out.strip() == 'True'
+    raise RuntimeError('{0} not in -X importtime output'.format(module))
+
+
+def main():
+    for module in MODULES:
+        runs = [import_times(module) for i in range(RUNS)]
+        total, children, imported_es = min(runs)
+
+        print('%s: %.1f ms (elasticsearch-py %s)' % (
+            module, total / 1000.0,
+            'imported' if imported_es else 'not imported'))
+        for us, name in sorted(children, reverse=True)[:TOP]:
+            print('    %-40s %7.1f ms' % (name, us / 1000.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Measures what ``S.only()`` and ``S.defer()`` save on the client side.
+
+Builds a fake search response with documents that have a large text
+blob and compares the payload size and the time it takes to decode it
+and run it through ``to_python`` and ``ObjectSearchResults`` with the
+full ``_source`` versus a filtered one.
+
+This doesn't need an Elasticsearch cluster. Run it with::
+
+    python benchmarks/bench_source_filtering.py
+
+"""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from elasticsearch.serializer import JSONSerializer  # noqa
+
+from elasticutils import S  # noqa
+
+
+NUM_HITS = 100
+BLOB_SIZE = 20000
+REPEAT = 20
+
+
+def make_response(fields=None):
+    hits = []
+    for i in range(NUM_HITS):
+        source = {
+            'id': i,
+            'title': 'Document %d' % i,
+            'created': '2014-01-01T12:00:00',
+            'tags': ['a', 'b', 'c'],
+            'body': 'lorem ipsum ' * (BLOB_SIZE // 12),
+        }
+        if fields is not None:
+            source = dict((k, v) for k, v in source.items() if k in fields)
+        hits.append({
+            '_index': 'bench', '_type': 'doc', '_id': str(i),
+            '_score': 1.0, '_source': source
+        })
+    return {'took': 1, 'hits': {'total': NUM_HITS, 'hits': hits}}
+
+
+def run(label, response):
+    s = S()
+    s.build_search()
+    serializer = JSONSerializer()
+    payload = serializer.dumps(response)
+
+    def decode():
+        return serializer.loads(payload)
+
+    def build_results(resp):
+        results = s.to_python(resp['hits']['hits'])
+        s.get_results_class()(None, resp, results, s.fields)
+
+    decode_time = min(timeit.repeat(decode, number=REPEAT, repeat=3))
+
+    # to_python converts in place, so each run gets its own freshly
+    # decoded response. Decoding happens outside the timed part.
+    results_time = None
+    for i in range(3):
+        responses = [decode() for j in range(REPEAT)]
+        start = time.time()
+        for resp in responses:
+            build_results(resp)
+        elapsed = time.time() - start
+        if results_time is None or elapsed < results_time:
+            results_time = elapsed
+
+    print('%-26s %9d bytes  decode %7.3f ms  results %7.3f ms' % (
+        label, len(payload),
+        decode_time / REPEAT * 1000,
+        results_time / REPEAT * 1000))
+
+
+def main():
+    print('%d hits per page, %d byte body field' % (NUM_HITS, BLOB_SIZE))
+    run('full _source', make_response())
+    run("only('id', 'title', ...)", make_response(['id', 'title', 'created']))
+    run("defer('body')", make_response(['id', 'title', 'created', 'tags']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,23 @@
+import contextlib
 import copy
+import functools
 import logging
+import threading
+import time
 from datetime import datetime
 
 import six
 from six import string_types
 
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk_index
-
 from elasticutils._version import __version__  # noqa
 from elasticutils import monkeypatch
-
-
-monkeypatch.monkeypatch_es()
+from elasticutils.bulk import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_BYTES, DEFAULT_MAX_RETRIES,
+    BulkSummary, _item, bulk_send, get_bulk_indexer)
+from elasticutils.fingerprint import fingerprint
+from elasticutils.hedging import hedged_search
+from elasticutils.pipeline import process_map
+from elasticutils.utils import chunked
 
 
 log = logging.getLogger('elasticutils')
@@ -82,6 +87,17 @@ class BadSearch(ElasticUtilsError):
     pass
 
 
+class ReindexError(ElasticUtilsError):
+    """Raise when documents fail to index during a rebuild.
+
+    The :py:class:`elasticutils.bulk.BulkSummary` is in ``summary``.
+
+    """
+    def __init__(self, msg, summary=None):
+        super(ReindexError, self).__init__(msg)
+        self.summary = summary
+
+
 def _build_key(urls, timeout, **settings):
     # Order the settings by key and then turn it into a string with
     # repr. There are a lot of edge cases here, but the worst that
@@ -106,7 +122,9 @@ def _build_key(urls, timeout, **settings):
 _cached_elasticsearch = {}
 
 
-def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
+def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False,
+           http_compress=False, maxsize=None, pool_block=False,
+           keep_alive=False, **settings):
     """Create an elasticsearch `Elasticsearch` object and return it.
 
     This will aggressively re-use `Elasticsearch` objects with the
@@ -126,6 +144,17 @@ def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
     :arg timeout: int; the timeout in seconds, defaults to 5
     :arg force_new: Forces get_es() to generate a new Elasticsearch
         object rather than pulling it from cache.
+    :arg http_compress: bool; gzip request bodies and ask for
+        gzipped responses, defaults to False
+    :arg maxsize: int; the maximum number of connections to keep open
+        to each host. Set this to at least the number of threads
+        sharing the Elasticsearch object. Defaults to the
+        elasticsearch-py default of 10.
+    :arg pool_block: bool; make threads wait for a free connection
+        rather than opening throwaway connections when all
+        ``maxsize`` connections are in use, defaults to False
+    :arg keep_alive: bool; enable TCP keep-alive on pooled
+        connections, defaults to False
     :arg settings: other settings to pass into Elasticsearch
         constructor; See
         `<http://elasticsearch-py.readthedocs.org/>`_ for more details.
@@ -143,6 +172,9 @@ def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
         es = get_es(urls=['localhost:9200'], timeout=10,
                     max_retries=3)
 
+        # Compressed and tuned for 20 worker threads
+        es = get_es(http_compress=True, maxsize=20, pool_block=True)
+
     """
     # Cheap way of de-None-ifying things
     urls = urls or DEFAULT_URLS
@@ -151,11 +183,24 @@ def get_es(urls=None, timeout=DEFAULT_TIMEOUT, force_new=False, **settings):
     if 'hosts' in settings:
         raise DeprecationWarning('"hosts" is deprecated in favor of "urls".')
 
+    if maxsize is not None:
+        settings['maxsize'] = maxsize
+    if http_compress or pool_block or keep_alive:
+        from elasticutils.connection import HttpConnection
+        settings.setdefault('connection_class', HttpConnection)
+        settings.update(http_compress=http_compress, pool_block=pool_block,
+                        keep_alive=keep_alive)
+
     if not force_new:
         key = _build_key(urls, timeout, **settings)
         if key in _cached_elasticsearch:
             return _cached_elasticsearch[key]
 
+    # elasticsearch-py takes a while to import, so it's imported when
+    # the first Elasticsearch is built rather than with elasticutils.
+    from elasticsearch import Elasticsearch
+    monkeypatch.monkeypatch_es()
+
     es = Elasticsearch(urls, timeout=timeout, **settings)
 
     if not force_new:
@@ -594,6 +639,48 @@ class S(PythonMixin):
         """
         return self._clone(next_step=('doctypes', doctypes))
 
+    def routing(self, *values):
+        """
+        Return a new S instance that searches only the shards for the
+        specified routing values.
+
+        If you index documents with a routing value (for example, a
+        tenant id), then searching with the same routing value only
+        hits the shard that holds those documents rather than
+        fanning out to all shards::
+
+            s = S().routing(tenant_id).filter(tenant=tenant_id)
+
+        .. Note::
+
+           Routing only picks the shards. You still need to filter if
+           multiple routing values live on the same shard.
+
+        .. Note::
+
+           Calling this again will overwrite previous ``.routing()``
+           calls.
+
+        """
+        return self._clone(next_step=('routing', values))
+
+    def preference(self, value):
+        """
+        Return a new S instance with the specified search preference.
+
+        :arg value: the Elasticsearch ``preference`` value. For
+            example, ``'_local'``, ``'_primary'`` or a custom string
+            like a user session id so that searches for the same
+            session hit the same shard copies and their warm caches.
+
+        .. Note::
+
+           Calling this again will overwrite previous ``.preference()``
+           calls.
+
+        """
+        return self._clone(next_step=('preference', value))
+
     def explain(self, value=True):
         """
         Return a new S instance with explain set.
@@ -660,6 +747,66 @@ class S(PythonMixin):
         """
         return self._clone(next_step=('values_dict', fields))
 
+    def only(self, *fields):
+        """Return a new S instance that only fetches the specified
+        fields of ``_source``.
+
+        :arg fields: the ``_source`` fields to return. Wildcards like
+            ``'user.*'`` work, too.
+
+        This uses ``_source`` filtering, so unlike
+        :py:meth:`elasticutils.S.values_list` and
+        :py:meth:`elasticutils.S.values_dict`, the fields don't have
+        to be stored and results are still returned as mapping type
+        instances. Other fields aren't sent over the wire at all.
+
+        For example, to get just the title and id of each result:
+
+        >>> s = S().query(title__match='trucks').only('id', 'title')
+
+        If you pass in ``None``, it will clear the fields, like
+        :py:meth:`elasticutils.S.defer` and
+        :py:meth:`elasticutils.S.highlight`.
+
+        .. Note::
+
+           Calling this again will overwrite previous ``.only()``
+           calls.
+
+        .. Note::
+
+           ``_source`` filtering needs Elasticsearch 1.0 or later.
+
+        """
+        return self._clone(next_step=('only', fields))
+
+    def defer(self, *fields):
+        """Return a new S instance that doesn't fetch the specified
+        fields of ``_source``.
+
+        :arg fields: the ``_source`` fields to leave out. Wildcards
+            like ``'user.*'`` work, too.
+
+        This is handy for leaving large fields like text blobs out of
+        list pages:
+
+        >>> s = S().query(title__match='trucks').defer('body')
+
+        If you pass in ``None``, it will clear the deferred fields,
+        like :py:meth:`elasticutils.S.only`.
+
+        .. Note::
+
+           Calling this multiple times adds to the set of deferred
+           fields.
+
+        .. Note::
+
+           ``_source`` filtering needs Elasticsearch 1.0 or later.
+
+        """
+        return self._clone(next_step=('defer', fields))
+
     def order_by(self, *fields):
         """
         Return a new S instance with results ordered as specified
@@ -779,6 +926,46 @@ class S(PythonMixin):
         """
         return self._clone(next_step=('query_raw', query))
 
+    def more_like_this(self, like, fields=None, **params):
+        """
+        Return a new S instance that finds documents like some others.
+
+        :arg like: an id, a document or a list of them. Documents in
+            the index can be given as dicts like ``{'_id': 1, '_type':
+            'doc'}``; other dicts are taken as documents that aren't in
+            the index.
+        :arg fields: the fields to compare; defaults to all of them
+        :arg params: other ``more_like_this`` query parameters like
+            ``min_term_freq`` and ``max_query_terms``
+
+        This adds a ``more_like_this`` query that's combined with the
+        rest of the query with AND, so unlike `MLT` the search works
+        like any other: filters, slicing, caching, timeouts and so on
+        all apply. The documents in ``like`` are left out of the
+        results.
+
+        Example::
+
+            S().filter(product='firefox').more_like_this(
+                2034, fields=['summary'], min_term_freq=1)[:5]
+
+
+        .. Note::
+
+           This needs Elasticsearch 1.3 or later, and 1.5 or later
+           for documents that aren't in the index.
+
+           Calling this again will overwrite previous
+           ``.more_like_this()`` calls.
+
+        """
+        if isinstance(like, (list, tuple)):
+            like = list(like)
+        else:
+            like = [like]
+        return self._clone(
+            next_step=('more_like_this', (like, fields, params)))
+
     def filter(self, *filters, **kw):
         """
         Return a new S instance with filter args combined with
@@ -1016,6 +1203,34 @@ class S(PythonMixin):
         """
         return self._clone(next_step=('search_type', search_type))
 
+    def trim_response(self, value=True):
+        """Return a new S instance that trims the search response.
+
+        :arg value: ``True`` to ask Elasticsearch to return only the
+            parts of the response the results class uses, a string
+            with an explicit ``filter_path`` or ``False`` to turn
+            trimming off
+
+        With trimming on, Elasticsearch leaves out the parts of the
+        response that the results class doesn't use. For example,
+        with :py:meth:`elasticutils.S.values_list` each hit only has
+        its ``_id`` and ``fields``, and :py:meth:`elasticutils.S.count`
+        only gets back ``hits.total``. Metadata like ``es_meta.score``
+        and ``es_meta.type`` isn't returned unless something asks for
+        it.
+
+        For example::
+
+            s = S().query(title__match='trucks').trim_response()
+
+        .. Note::
+
+           This uses the ``filter_path`` parameter which requires
+           Elasticsearch 1.6 or later.
+
+        """
+        return self._clone(next_step=('trim_response', value))
+
     def suggest(self, name, term, **kwargs):
         """Set suggestion options.
 
@@ -1025,6 +1240,11 @@ class S(PythonMixin):
         Additional keyword options:
 
         * ``field`` -- The field to base suggestions upon, defaults to _all
+        * ``type`` -- The suggester to use: ``term`` (the default),
+          ``phrase`` or ``completion``
+
+        Any other keyword options are passed to the suggester, for
+        example ``size`` or ``fuzzy``.
 
         Results will have a ``_suggestions`` property containing the
         suggestions for all terms.
@@ -1038,6 +1258,48 @@ class S(PythonMixin):
         """
         return self._clone(next_step=('suggest', (name, term, kwargs)))
 
+    def hedge(self, delay=None, percentile=95, preference=None, stats=None):
+        """Return a new S instance that hedges its search requests.
+
+        :arg delay: seconds to wait for the first request before
+            sending the hedge request. If None, uses the
+            ``percentile`` of recently recorded search latencies.
+        :arg percentile: the latency percentile to use as the delay
+            when ``delay`` is None
+        :arg preference: the Elasticsearch ``preference`` to use for
+            the hedge request so that it's served by a different
+            shard copy; defaults to a random string
+        :arg stats: the :py:class:`elasticutils.hedging.HedgeStats`
+            to record latencies and hedge outcomes in; defaults to
+            ``elasticutils.hedging.hedge_stats``
+
+        If the search hasn't returned after the delay, the same
+        search is sent again with a different preference. The first
+        response wins and the other one is discarded.
+
+        Searches with a :py:meth:`preference` aren't hedged.
+
+        For example::
+
+            s = S().query(title__match='trucks').hedge(percentile=99)
+
+        Call ``.hedge(False)`` to turn hedging off.
+
+        .. Note::
+
+           Calling this again will overwrite previous ``.hedge()``
+           calls.
+
+        """
+        if delay is False:
+            return self._clone(next_step=('hedge', None))
+        return self._clone(next_step=('hedge', {
+            'delay': delay,
+            'percentile': percentile,
+            'preference': preference,
+            'stats': stats
+        }))
+
     def extra(self, **kw):
         """
         Return a new S instance with extra args combined with existing
@@ -1080,6 +1342,7 @@ class S(PythonMixin):
         filters_raw = None
         queries = []
         query_raw = None
+        more_like_this = None
         sort = []
         dict_fields = set()
         list_fields = set()
@@ -1092,6 +1355,12 @@ class S(PythonMixin):
         explain = False
         as_list = as_dict = False
         search_type = None
+        hedge = None
+        routing = None
+        preference = None
+        only_fields = []
+        defer_fields = []
+        trim = False
 
         for action, value in self.steps:
             if action == 'order_by':
@@ -1119,6 +1388,8 @@ class S(PythonMixin):
                 queries.append(value)
             elif action == 'query_raw':
                 query_raw = value
+            elif action == 'more_like_this':
+                more_like_this = value
             elif action == 'demote':
                 # value here is a tuple of (negative_boost, query)
                 demote = value
@@ -1141,6 +1412,25 @@ class S(PythonMixin):
                 search_type = value
             elif action == 'suggest':
                 suggestions[value[0]] = (value[1], value[2])
+            elif action == 'hedge':
+                hedge = value
+            elif action == 'routing':
+                routing = value
+            elif action == 'preference':
+                preference = value
+            elif action == 'trim_response':
+                trim = value
+            elif action == 'only':
+                if value == (None,):
+                    only_fields = []
+                else:
+                    only_fields = list(value)
+            elif action == 'defer':
+                if value == (None,):
+                    defer_fields = []
+                else:
+                    defer_fields.extend(
+                        f for f in value if f not in defer_fields)
             elif action in ('es', 'indexes', 'doctypes', 'boost'):
                 # Ignore these--we use these elsewhere, but want to
                 # make sure lack of handling it here doesn't throw an
@@ -1168,6 +1458,10 @@ class S(PythonMixin):
         else:
             pq = self._process_queries(queries)
 
+            if more_like_this is not None:
+                mlt = _mlt_query(*more_like_this)
+                pq = {'bool': {'must': [mlt, pq]}} if pq else mlt
+
             if demote is not None:
                 qs['query'] = {
                     'boosting': {
@@ -1188,6 +1482,13 @@ class S(PythonMixin):
         else:
             fields = set()
 
+        if only_fields or defer_fields:
+            source = qs['_source'] = {}
+            if only_fields:
+                source['include'] = only_fields
+            if defer_fields:
+                source['exclude'] = defer_fields
+
         if facets:
             qs['facets'] = facets
             # Hunt for `facet_filter` shells and update those. We use
@@ -1214,16 +1515,15 @@ class S(PythonMixin):
         if explain:
             qs['explain'] = True
 
-        for suggestion, (term, kwargs) in six.iteritems(suggestions):
-            qs.setdefault('suggest', {})[suggestion] = {
-                'text': term,
-                'term': {
-                    'field': kwargs.get('field', '_all'),
-                },
-            }
+        if suggestions:
+            qs['suggest'] = _suggest_body(suggestions)
 
         self.fields, self.as_list, self.as_dict = fields, as_list, as_dict
         self.search_type = search_type
+        self.hedge_options = hedge
+        self.search_routing = routing
+        self.search_preference = preference
+        self.response_filter = trim
         return qs
 
     def _build_highlight(self, fields, options):
@@ -1410,6 +1710,31 @@ class S(PythonMixin):
 
         return {}
 
+    def get_filter_path(self, qs):
+        """Returns the ``filter_path`` to use for a trimmed response.
+
+        :arg qs: the search body from ``build_search()``
+
+        :returns: comma-separated string of response paths
+
+        """
+        hit_paths = list(self.get_results_class().hit_paths)
+        if qs.get('fields') == ['*']:
+            # Results without stored fields fall back to _id and
+            # _type.
+            hit_paths.append('_type')
+        if qs.get('explain'):
+            hit_paths.append('_explanation')
+        if 'highlight' in qs:
+            hit_paths.append('highlight')
+
+        paths = ['took', 'hits.total']
+        paths.extend('hits.hits.' + path for path in hit_paths)
+        for section in ('facets', 'suggest'):
+            if section in qs:
+                paths.append(section)
+        return ','.join(paths)
+
     def get_results_class(self):
         """Returns the results class to use
 
@@ -1504,13 +1829,31 @@ class S(PythonMixin):
         extra_search_kwargs = {}
         if self.search_type:
             extra_search_kwargs['search_type'] = self.search_type
+        if self.search_routing:
+            extra_search_kwargs['routing'] = ','.join(
+                six.text_type(val) for val in self.search_routing)
+        if self.search_preference is not None:
+            extra_search_kwargs['preference'] = self.search_preference
+
+        if self.response_filter:
+            filter_path = self.response_filter
+            if filter_path is True:
+                filter_path = self.get_filter_path(qs)
+            # Not every version of elasticsearch-py knows about
+            # filter_path, so we pass it as a raw parameter.
+            extra_search_kwargs['params'] = {'filter_path': filter_path}
+
+        search_kwargs = dict(body=qs,
+                             index=self.get_indexes(),
+                             doc_type=self.get_doctypes(),
+                             **extra_search_kwargs)
+
+        if self.hedge_options:
+            hits = hedged_search(es, search_kwargs, **self.hedge_options)
+        else:
+            hits = es.search(**search_kwargs)
 
-        hits = es.search(body=qs,
-                         index=self.get_indexes(),
-                         doc_type=self.get_doctypes(),
-                         **extra_search_kwargs)
-
-        log.debug('[%s] %s' % (hits['took'], qs))
+        log.debug('[%s] %s' % (hits.get('took'), qs))
         return hits
 
     def count(self):
@@ -1527,8 +1870,12 @@ class S(PythonMixin):
         """
         if self._results_cache is not None:
             return self._results_cache.count
-        else:
-            return self[:0].raw()['hits']['total']
+
+        s = self[:0]
+        s.build_search()
+        if s.response_filter:
+            s = s.trim_response('hits.total')
+        return s.raw()['hits']['total']
 
     def __len__(self):
         """Executes search and returns the number of results you'd get.
@@ -1644,6 +1991,63 @@ class S(PythonMixin):
         """
         return self._do_search().response.get('suggest', {})
 
+    def suggest_only(self):
+        """
+        Returns suggestions without doing a search.
+
+        This sends only the ``suggest()`` clauses to the Elasticsearch
+        suggest API, so no queries, filters or facets are run and no
+        hits are fetched or converted.
+
+        :returns: dict of suggestion name -> list of suggested texts,
+            best first. For term suggestions with several terms, the
+            suggestions for each term follow one another.
+
+        >>> s = S().suggest('title', 'fire', field='title_complete',
+        ...                 type='completion')
+        >>> titles = s.suggest_only()['title']
+
+        Use :py:meth:`elasticutils.S.suggestions` if you need scores
+        and frequencies.
+
+        .. Note::
+
+           Suggestions are only supported since Elasticsearch 0.90.
+           Completion suggestions need Elasticsearch 0.90.3 or later.
+
+        """
+        suggestions = {}
+        routing = None
+        preference = None
+        for action, value in self.steps:
+            if action == 'suggest':
+                suggestions[value[0]] = (value[1], value[2])
+            elif action == 'routing':
+                routing = value
+            elif action == 'preference':
+                preference = value
+
+        if not suggestions:
+            return {}
+
+        params = {}
+        if routing:
+            params['routing'] = ','.join(
+                six.text_type(val) for val in routing)
+        if preference is not None:
+            params['preference'] = preference
+
+        body = _suggest_body(suggestions)
+        response = self.get_es().suggest(
+            body=body, index=self.get_indexes(), params=params)
+        log.debug('[suggest] {0}'.format(body))
+
+        return dict(
+            (name, [option['text']
+                    for entry in response.get(name, [])
+                    for option in entry.get('options', [])])
+            for name in suggestions)
+
 
 class MLT(PythonMixin):
     """Represents a lazy Elasticsearch More Like This API request.
@@ -1768,6 +2172,198 @@ class MLT(PythonMixin):
         return self._results_cache
 
 
+def _suggest_body(suggestions):
+    """Returns the suggest clauses for suggestions
+
+    :arg suggestions: dict of name -> ``(text, kwargs)`` where
+        ``kwargs`` are the ones passed to :py:meth:`S.suggest`
+
+    """
+    body = {}
+    for name, (text, kwargs) in six.iteritems(suggestions):
+        options = dict(kwargs)
+        suggester = options.pop('type', 'term')
+        options.setdefault('field', '_all')
+        body[name] = {'text': text, suggester: options}
+    return body
+
+
+def _mlt_query(like, fields=None, params=None):
+    """Returns a more_like_this query
+
+    :arg like: list of ids, of documents in the index like
+        ``{'_id': 1, '_type': 'doc'}`` or of documents that aren't in
+        the index as dicts of field -> value
+    :arg fields: fields to compare; all of them if None
+    :arg params: other more_like_this parameters like
+        ``min_term_freq``
+
+    """
+    docs = []
+    for item in like:
+        if not isinstance(item, dict):
+            docs.append({'_id': item})
+        elif '_id' in item:
+            docs.append(item)
+        else:
+            docs.append({'doc': item})
+
+    if all(list(doc) == ['_id'] for doc in docs):
+        query = {'ids': [doc['_id'] for doc in docs]}
+    else:
+        query = {'docs': docs}
+    if fields:
+        query['fields'] = list(fields)
+    query.update(params or {})
+    return {'more_like_this': query}
+
+
+class BatchMLT(PythonMixin):
+    """Represents lazy More Like This requests for several documents.
+
+    It sends one multi-search request with a ``more_like_this`` query
+    for each id instead of one More Like This API request per id.
+
+    For example:
+
+    >>> mlt = BatchMLT([2034, 2035], index='addons_index', doctype='addon')
+    >>> related = mlt[2034]
+    >>> counts = dict((id_, len(results)) for id_, results in mlt.items())
+
+    .. Note::
+
+       This needs Elasticsearch 1.3 or later for the ``ids``
+       parameter of the ``more_like_this`` query.
+
+    """
+    def __init__(self, ids, s=None, mlt_fields=None, index=None,
+                 doctype=None, es=None, **query_params):
+        """
+        When the BatchMLT is evaluated, it generates a
+        :py:class:`DictSearchResults` for each id.
+
+        :arg ids: The ids of the documents we want to find more like.
+        :arg s: An instance of an S. Its query is combined with each
+            ``more_like_this`` query and the rest of its search, like
+            filters and size, is used as is.
+        :arg mlt_fields: A list of fields to look at for more like this.
+        :arg index: The index to use. Falls back to the first index
+            listed in s.get_indexes().
+        :arg doctype: The doctype to use. Falls back to the first
+            doctype listed in s.get_doctypes().
+        :arg es: The `Elasticsearch` object to use. If you don't
+            provide one, then it will create one for you.
+        :arg query_params: The parameters you'd pass to `MLT`, like
+            ``min_term_freq``. ``search_size`` and ``search_from``
+            set the size and offset of each search; the rest go in
+            the ``more_like_this`` queries.
+
+        .. Note::
+
+           You must specify either an `s` or the `index` and `doctype`
+           arguments. Omitting them will result in a `ValueError`.
+
+        """
+        if s is None and (index is None or doctype is None):
+            raise ValueError(
+                'Either you must provide a valid s or index and doc_type')
+
+        self.s = s
+        if s is not None:
+            self.index = index or s.get_indexes()[0]
+            self.doctype = doctype or s.get_doctypes()[0]
+            self.type = s.type
+        else:
+            self.index = index
+            self.doctype = doctype
+            self.type = None
+
+        self.ids = list(ids)
+        self.mlt_fields = mlt_fields
+        self.es = es
+        self.query_params = query_params
+        self._results_cache = None
+
+    def __getitem__(self, id_):
+        return self._do_search()[id_]
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def items(self):
+        """Returns a list of ``(id, DictSearchResults)`` in id order"""
+        results = self._do_search()
+        return [(id_, results[id_]) for id_ in self.ids]
+
+    def get_es(self):
+        """Returns an `Elasticsearch`.
+
+        See :py:meth:`MLT.get_es`.
+
+        """
+        if self.s is not None:
+            return self.s.get_es()
+
+        return self.es or get_es()
+
+    def build_body(self):
+        """Returns the multi-search body as a list of dicts"""
+        params = dict(self.query_params)
+        mlt_fields = self.mlt_fields or params.pop('mlt_fields', None)
+
+        base = self.s.build_search() if self.s is not None else {}
+        if 'search_size' in params:
+            base['size'] = params.pop('search_size')
+        if 'search_from' in params:
+            base['from'] = params.pop('search_from')
+
+        header = {'index': self.index, 'type': self.doctype}
+        body = []
+        for id_ in self.ids:
+            search = dict(base)
+            query = _mlt_query([id_], mlt_fields, params)
+            if 'query' in base:
+                query = {'bool': {'must': [query, base['query']]}}
+            search['query'] = query
+            body.extend([header, search])
+        return body
+
+    def raw(self):
+        """
+        Builds the searches and passes them to `Elasticsearch`, then
+        returns the raw multi-search response.
+        """
+        if not self.ids:
+            return {'responses': []}
+
+        response = self.get_es().msearch(body=self.build_body())
+        log.debug(response)
+        return response
+
+    def _do_search(self):
+        """
+        Perform the multi-search, then convert the responses into a
+        dict of id -> DictSearchResults and return it.
+
+        :raises BadSearch: if the search for any of the ids failed
+        """
+        if self._results_cache is None:
+            results = {}
+            responses = self.raw()['responses']
+            for id_, response in zip(self.ids, responses):
+                if 'error' in response:
+                    raise BadSearch('More like {0} failed: {1}'.format(
+                        id_, response['error']))
+                hits = response.get('hits', {}).get('hits', [])
+                results[id_] = DictSearchResults(
+                    self.type, response, self.to_python(hits), None)
+            self._results_cache = results
+        return self._results_cache
+
+
 class SearchResults(object):
     """
     After executing a search, this is the class that manages the
@@ -1799,6 +2395,10 @@ class SearchResults(object):
 
     """
 
+    #: The parts of each hit this class uses. This is used to build
+    #: the ``filter_path`` when the response is trimmed.
+    hit_paths = ('_id', '_source', 'fields')
+
     def __init__(self, type, response, results, fields):
         self.type = type
         self.response = response
@@ -1833,6 +2433,8 @@ class DictSearchResults(SearchResults):
     SearchResults subclass that returns a results in the form of a
     dict.
     """
+    hit_paths = ('_id', 'fields')
+
     def set_objects(self, results):
         def listify(d):
             return dict([(key, val if isinstance(val, list) else [val])
@@ -1848,7 +2450,7 @@ class DictSearchResults(SearchResults):
             else:
                 # No fields and no source, so we just return _id and
                 # _type.
-                objs = [({'_id': r['_id'], '_type': r['_type']}, r)
+                objs = [({'_id': r['_id'], '_type': r.get('_type')}, r)
                         for r in results]
 
         else:
@@ -1863,6 +2465,8 @@ class ListSearchResults(SearchResults):
     SearchResults subclass that returns a results in the form of a
     tuple.
     """
+    hit_paths = ('_id', 'fields')
+
     def set_objects(self, results):
         def listify(values):
             return [(val if isinstance(val, list) else [val])
@@ -1878,7 +2482,7 @@ class ListSearchResults(SearchResults):
             else:
                 # No fields and no source, so we just return _id and
                 # _type.
-                objs = [((r['_id'], r['_type']), r) for r in results]
+                objs = [((r['_id'], r.get('_type')), r) for r in results]
         else:
             objs = []
 
@@ -2104,6 +2708,34 @@ class DefaultMappingType(MappingType):
     """This is the default mapping type for S."""
 
 
+# How long Indexable.get_write_indexes() trusts what it last saw
+# about an index being rebuilt, in seconds.
+REBUILD_CHECK_INTERVAL = 1.0
+
+# Maps alias -> (time checked, index being built or None)
+_rebuilding = {}
+_rebuilding_lock = threading.Lock()
+
+
+def _rebuild_alias(alias):
+    """Returns the alias that points at the index being built for alias"""
+    return '{0}_rebuilding'.format(alias)
+
+
+def _extract_documents(mapping_type, objs):
+    # Module-level so it can be pickled for process_map.
+    return mapping_type.extract_documents(objs)
+
+
+def _extract_chunks(mapping_type, chunks, processes=None):
+    """Yields the list of documents for each chunk of objects"""
+    if processes:
+        return process_map(
+            functools.partial(_extract_documents, mapping_type), chunks,
+            processes)
+    return (mapping_type.extract_documents(objs) for objs in chunks)
+
+
 class Indexable(object):
     """Mixin for mapping types with all the indexing hoo-hah.
 
@@ -2169,6 +2801,32 @@ class Indexable(object):
         """
         raise NotImplementedError
 
+    @classmethod
+    def extract_documents(cls, objs):
+        """Extracts the Elasticsearch index documents for a batch of objects
+
+        By default, this calls ``extract_document(obj.id, obj)`` for
+        each object and leaves out objects it fails for, logging the
+        exception.
+
+        Override this if extracting documents one at a time is
+        expensive, for example to fetch related data for the whole
+        batch in one query.
+
+        :arg objs: list of objects to extract from
+
+        :returns: list of documents
+
+        """
+        documents = []
+        for obj in objs:
+            try:
+                documents.append(cls.extract_document(obj.id, obj))
+            except Exception as exc:
+                log.exception('Unable to extract document {0}: {1}'.format(
+                    obj, repr(exc)))
+        return documents
+
     @classmethod
     def get_indexable(cls):
         """Returns an iterable of things to index.
@@ -2178,9 +2836,163 @@ class Indexable(object):
         """
         raise NotImplemented
 
+    @classmethod
+    def get_indexable_documents(cls, chunk_size=100, processes=None):
+        """Returns an iterable of documents for everything indexable.
+
+        By default, this passes what ``get_indexable()`` returns to
+        ``extract_documents()`` in chunks of ``chunk_size``. Override
+        this if ``get_indexable()`` returns something other than
+        objects.
+
+        :arg chunk_size: the number of objects per chunk
+        :arg processes: if set, chunks are extracted in that many
+            child processes with
+            :py:func:`elasticutils.pipeline.process_map`, which helps
+            when ``extract_document()`` is CPU-bound. The objects and
+            documents must be picklable. Documents still come out in
+            order. The processes are started when this is called.
+
+        :returns: iterable of documents
+
+        """
+        chunks = chunked(cls.get_indexable(), chunk_size)
+        # Not a generator function, so the processes are started now
+        # rather than by whichever thread first iterates the result.
+        return (document
+                for documents in _extract_chunks(cls, chunks, processes)
+                for document in documents)
+
+    @classmethod
+    def get_routing(cls, document):
+        """Returns the routing value for a document or None
+
+        If your index is routed (for example, by tenant id), override
+        this to return the routing value for the document. It's used
+        by ``index()`` and ``bulk_index()`` so that documents end up
+        on the shard that routed searches look at.
+
+        :arg document: the document as returned by
+            ``extract_document()``
+
+        :returns: routing value or None for default routing
+
+        """
+        return None
+
+    @classmethod
+    def get_version(cls, document):
+        """Returns the external version of a document or None
+
+        Override this to index documents with a version of your own,
+        usually a last modified timestamp as an integer that
+        ``extract_document()`` puts in the document. Elasticsearch only
+        writes a document if its version is greater than the one it
+        has, so when several processes index the same document, the
+        newest one wins no matter which gets there first.
+
+        For example::
+
+            @classmethod
+            def get_version(cls, document):
+                return int(calendar.timegm(
+                    document['updated_at'].utctimetuple()))
+
+        :arg document: the document as returned by
+            ``extract_document()``
+
+        :returns: integer version or None to not use versioning
+
+        """
+        return None
+
+    @classmethod
+    def get_bulk_indexer(cls):
+        """Returns the BulkIndexer to buffer writes with or None
+
+        By default, this returns the process-wide indexer set with
+        :py:func:`elasticutils.bulk.set_bulk_indexer`, if any. Override
+        this to buffer writes for this mapping type only, or to return
+        None to always write right away.
+
+        :returns: :py:class:`elasticutils.bulk.BulkIndexer` or None
+
+        """
+        return get_bulk_indexer()
+
+    @classmethod
+    def get_write_indexes(cls, es=None):
+        """Returns the list of indexes that writes go to.
+
+        This is ``[cls.get_index()]`` plus, while
+        :py:meth:`rebuild_index` is running in any process, the index
+        being built. ``index()``, ``bulk_index()`` and ``unindex()``
+        write to all of them when you don't specify an index.
+
+        :py:meth:`rebuild_index` points the ``<alias>_rebuilding``
+        alias at the index it builds. This looks that alias up at most
+        once every ``REBUILD_CHECK_INTERVAL`` seconds.
+
+        :arg es: The `Elasticsearch` to look the alias up with. If you
+            don't specify an `Elasticsearch`, it'll use
+            `cls.get_es()`.
+
+        :returns: list of index names
+
+        """
+        index = cls.get_index()
+        with _rebuilding_lock:
+            checked = _rebuilding.get(index)
+
+        if (checked is None or
+                time.time() - checked[0] >= REBUILD_CHECK_INTERVAL):
+            if es is None:
+                es = cls.get_es()
+            rebuild_alias = _rebuild_alias(index)
+            resp = es.indices.get_alias(name=rebuild_alias, ignore=404)
+            building = [
+                name for name, info in resp.items()
+                if isinstance(info, dict) and
+                rebuild_alias in info.get('aliases', {})
+            ]
+            checked = (time.time(), building[0] if building else None)
+            with _rebuilding_lock:
+                _rebuilding[index] = checked
+
+        if checked[1] is None:
+            return [index]
+        return [index, checked[1]]
+
+    @classmethod
+    def get_fingerprint_store(cls):
+        """Returns the store for document fingerprints or None
+
+        If this returns a store, ``bulk_index()`` skips documents
+        whose contents haven't changed since they were last indexed.
+        By default, this returns None and every document is sent.
+
+        For example:
+
+        .. code-block:: python
+
+            from elasticutils.fingerprint import SQLiteFingerprintStore
+
+            store = SQLiteFingerprintStore('/var/lib/myapp/fingerprints.db')
+
+            class MyMappingType(MappingType, Indexable):
+                @classmethod
+                def get_fingerprint_store(cls):
+                    return store
+
+        :returns: :py:class:`elasticutils.fingerprint.FingerprintStore`
+            or None
+
+        """
+        return None
+
     @classmethod
     def index(cls, document, id_=None, overwrite_existing=True, es=None,
-              index=None):
+              index=None, routing=None, version=None):
         """Adds or updates a document to the index
 
         :arg document: Python dict of key/value pairs representing
@@ -2207,30 +3019,86 @@ class Indexable(object):
         :arg index: The name of the index to use. If you don't specify one
             it'll use `cls.get_index()`.
 
+        :arg routing: The routing value to use. If you don't specify
+            one, it'll use `cls.get_routing(document)`.
+
+        :arg version: The external version of the document. If you
+            don't specify one, it'll use `cls.get_version(document)`.
+            If the index already has this version or a newer one, the
+            document isn't written.
+
         .. Note::
 
            If you need the documents available for searches
            immediately, make sure to refresh the index by calling
            ``refresh_index()``.
 
+        .. Note::
+
+           If ``cls.get_bulk_indexer()`` returns an indexer and you
+           don't specify ``es``, the document is queued and sent with
+           the next bulk request instead. Call ``flush()`` on the
+           indexer before refreshing.
+
         """
-        if es is None:
+        from elasticsearch.exceptions import ConflictError
+
+        bulk_indexer = cls.get_bulk_indexer() if es is None else None
+
+        if es is None and bulk_indexer is None:
             es = cls.get_es()
 
         if index is None:
-            index = cls.get_index()
-
-        kw = {}
-        if not overwrite_existing:
-            kw['op_type'] = 'create'
-        es.index(index=index, doc_type=cls.get_mapping_type_name(),
-                 body=document, id=id_, **kw)
+            indexes = cls.get_write_indexes(
+                es=es if bulk_indexer is None else bulk_indexer.es)
+        else:
+            indexes = [index]
+
+        if routing is None:
+            routing = cls.get_routing(document)
+
+        if version is None:
+            version = cls.get_version(document)
+
+        # The stored fingerprint no longer matches what's indexed.
+        store = cls.get_fingerprint_store()
+        if store is not None and id_ is not None:
+            store.delete_many([(indexes[0], cls.get_mapping_type_name(), id_)])
+
+        for index in indexes:
+            if bulk_indexer is not None:
+                bulk_indexer.index(
+                    index, cls.get_mapping_type_name(), document, id_=id_,
+                    routing=routing,
+                    op_type='index' if overwrite_existing else 'create',
+                    version=version)
+                continue
+
+            kw = {}
+            if not overwrite_existing:
+                kw['op_type'] = 'create'
+            if routing is not None:
+                kw['routing'] = routing
+            if version is not None:
+                kw['version'] = version
+                kw['version_type'] = 'external'
+            try:
+                es.index(index=index, doc_type=cls.get_mapping_type_name(),
+                         body=document, id=id_, **kw)
+            except ConflictError:
+                if version is None:
+                    raise
+                log.debug('Skipped {0} version {1}: {2} has a newer '
+                          'one'.format(id_, version, index))
 
     @classmethod
-    def bulk_index(cls, documents, id_field='id', es=None, index=None):
+    def bulk_index(cls, documents, id_field='id', es=None, index=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE,
+                   max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES, workers=1,
+                   max_retries=DEFAULT_MAX_RETRIES, skip_unchanged=True):
         """Adds or updates a batch of documents.
 
-        :arg documents: List of Python dicts representing individual
+        :arg documents: Iterable of Python dicts representing individual
             documents to be added to the index
 
             .. Note::
@@ -2246,6 +3114,40 @@ class Indexable(object):
         :arg index: The name of the index to use. If you don't specify one
             it'll use `cls.get_index()`.
 
+        :arg chunk_size: The maximum number of documents to send in
+            one bulk request. This defaults to 500.
+
+        :arg max_chunk_bytes: The maximum size of one bulk request in
+            bytes. This defaults to 10 MB.
+
+        :arg workers: The number of bulk requests to send at the same
+            time. This defaults to 1.
+
+        :arg max_retries: The number of times to retry documents that
+            Elasticsearch rejects because it's too busy (HTTP 429). The
+            wait between retries starts at half a second and doubles
+            every time.
+
+        :arg skip_unchanged: If ``cls.get_fingerprint_store()`` returns
+            a store, documents that haven't changed since they were
+            last indexed are skipped and counted in
+            ``summary.skipped``. Pass False to send them anyway.
+
+        :returns: :py:class:`elasticutils.bulk.BulkSummary` with the
+            result for each document. This doesn't raise an exception
+            if documents fail to index---check ``summary.errors``.
+
+        Each document is routed with `cls.get_routing(document)`.
+
+        Each document is indexed with the external version
+        `cls.get_version(document)` returns, if any. Documents the index
+        has the same or a newer version of aren't written; they're
+        counted in ``summary.conflicts`` rather than in
+        ``summary.errors``, so any number of processes can index at the
+        same time without older documents overwriting newer ones. Their
+        fingerprints are stored anyway so that they're skipped until
+        they change.
+
         .. Note::
 
            If you need the documents available for searches
@@ -2257,20 +3159,330 @@ class Indexable(object):
             es = cls.get_es()
 
         if index is None:
-            index = cls.get_index()
+            indexes = cls.get_write_indexes(es=es)
+        else:
+            indexes = [index]
+
+        doc_type = cls.get_mapping_type_name()
+        store = cls.get_fingerprint_store() if skip_unchanged else None
+        # key -> fingerprint for documents that were sent
+        sent = {}
+        skipped = [0]
+
+        def _changed(documents):
+            # Look fingerprints up a chunk at a time so that stores
+            # that make requests make one per chunk.
+            for chunk in chunked(documents, chunk_size):
+                fingerprints = dict(
+                    ((indexes[0], doc_type, d[id_field]), fingerprint(d))
+                    for d in chunk)
+                stored = store.get_many(es, fingerprints)
+                for d in chunk:
+                    key = (indexes[0], doc_type, d[id_field])
+                    if stored.get(key) == fingerprints[key]:
+                        skipped[0] += 1
+                        continue
+                    sent[key] = fingerprints[key]
+                    if store.field:
+                        d = dict(d, **{store.field: fingerprints[key]})
+                    yield d
+
+        def _to_actions(d):
+            meta = {'_id': d[id_field]}
+            routing = cls.get_routing(d)
+            if routing is not None:
+                meta['_routing'] = routing
+            version = cls.get_version(d)
+            if version is not None:
+                meta['_version'] = version
+                meta['_version_type'] = 'external'
+            if len(indexes) == 1:
+                yield {'index': meta}, d
+                return
+            for index in indexes:
+                yield {'index': dict(meta, _index=index)}, d
+
+        if store is not None:
+            documents = _changed(documents)
+
+        summary = bulk_send(
+            es,
+            (action for d in documents for action in _to_actions(d)),
+            index=indexes[0],
+            doc_type=doc_type,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            workers=workers,
+            max_retries=max_retries
+        )
+
+        if store is not None:
+            summary.skipped = skipped[0]
+            # Documents that conflicted weren't written, but the index
+            # has the same or a newer version, so sending them again
+            # won't change anything until they change.
+            failed = set(item['_id'] for item in summary.items
+                         if not item['ok'])
+            store.set_many(dict(
+                (key, value) for key, value in sent.items()
+                if key[2] not in failed))
+            log.info('Skipped {0} of {1} unchanged documents ({2:.0%})'.format(
+                summary.skipped, summary.skipped + len(sent),
+                summary.skip_ratio))
+
+        return summary
+
+    @classmethod
+    def update(cls, id_, doc, upsert=None, es=None, index=None,
+               routing=None):
+        """Updates some fields of a document
+
+        Only ``doc`` is sent and Elasticsearch merges it into the
+        document it has, so changing a counter doesn't need the rest
+        of the document.
+
+        :arg id_: the id of the document
+        :arg doc: Python dict with the fields to change
+
+        :arg upsert: the document to add if there's no document with
+            this id. If you don't specify one, updating a document that
+            doesn't exist raises `NotFoundError`.
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg index: The name of the index to use. If you don't specify one
+            it'll use `cls.get_write_indexes()`.
+
+        :arg routing: The routing value the document was indexed
+            with, if any.
+
+        If ``cls.get_bulk_indexer()`` returns an indexer and you don't
+        specify ``es``, the update is queued like with ``index()``.
+
+        """
+        bulk_indexer = cls.get_bulk_indexer() if es is None else None
+
+        if es is None and bulk_indexer is None:
+            es = cls.get_es()
+
+        if index is None:
+            indexes = cls.get_write_indexes(
+                es=es if bulk_indexer is None else bulk_indexer.es)
+        else:
+            indexes = [index]
+
+        doc_type = cls.get_mapping_type_name()
+
+        store = cls.get_fingerprint_store()
+        if store is not None:
+            store.delete_many([(indexes[0], doc_type, id_)])
+
+        body = {'doc': doc}
+        if upsert is not None:
+            body['upsert'] = upsert
 
-        documents = (dict(d, _id=d[id_field]) for d in documents)
+        for index in indexes:
+            if bulk_indexer is not None:
+                bulk_indexer.update(index, doc_type, id_, doc, upsert=upsert,
+                                    routing=routing)
+                continue
 
-        bulk_index(
+            kw = {}
+            if routing is not None:
+                kw['routing'] = routing
+            es.update(index=index, doc_type=doc_type, id=id_, body=body, **kw)
+
+    @classmethod
+    def bulk_update(cls, documents, id_field='id', upsert=False, es=None,
+                    index=None, routing=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES, workers=1,
+                    max_retries=DEFAULT_MAX_RETRIES):
+        """Updates some fields of a batch of documents.
+
+        :arg documents: Iterable of Python dicts with the id and the
+            fields to change, for example ``{'id': 5, 'votes': 10}``
+
+        :arg id_field: The name of the field with the document id.
+            This defaults to 'id'. It's not sent.
+
+        :arg upsert: If True, documents that don't exist are added
+            with the fields given. Otherwise they fail with a 404.
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg index: The name of the index to use. If you don't specify one
+            it'll use `cls.get_write_indexes()`.
+
+        :arg routing: The routing value the documents were indexed
+            with, if any.
+
+        See :py:meth:`bulk_index` for the other arguments.
+
+        :returns: :py:class:`elasticutils.bulk.BulkSummary` with the
+            result for each update
+
+        """
+        if es is None:
+            es = cls.get_es()
+
+        if index is None:
+            indexes = cls.get_write_indexes(es=es)
+        else:
+            indexes = [index]
+
+        doc_type = cls.get_mapping_type_name()
+        store = cls.get_fingerprint_store()
+
+        def _forget(documents):
+            for chunk in chunked(documents, chunk_size):
+                store.delete_many([(indexes[0], doc_type, d[id_field])
+                                   for d in chunk])
+                for d in chunk:
+                    yield d
+
+        if store is not None:
+            documents = _forget(documents)
+
+        def _to_actions(d):
+            meta = {'_id': d[id_field]}
+            if routing is not None:
+                meta['_routing'] = routing
+            body = {'doc': dict((k, v) for k, v in d.items()
+                                if k != id_field)}
+            if upsert:
+                body['doc_as_upsert'] = True
+            if len(indexes) == 1:
+                yield {'update': meta}, body
+                return
+            for index in indexes:
+                yield {'update': dict(meta, _index=index)}, body
+
+        return bulk_send(
             es,
-            documents,
-            index=index,
-            doc_type=cls.get_mapping_type_name(),
-            raise_on_error=True
+            (action for d in documents for action in _to_actions(d)),
+            index=indexes[0],
+            doc_type=doc_type,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            workers=workers,
+            max_retries=max_retries
         )
 
     @classmethod
-    def unindex(cls, id_, es=None, index=None):
+    def bulk_increment(cls, increments, es=None, index=None, routing=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                       max_retries=DEFAULT_MAX_RETRIES, max_conflicts=3):
+        """Adds to numeric fields of a batch of documents.
+
+        This doesn't use scripts, which Elasticsearch doesn't allow by
+        default. It reads the current values and versions with
+        multi-gets and sends partial updates with those versions. If a
+        document changed in between, it's read and updated again.
+
+        :arg increments: dict of document id -> dict of field name ->
+            amount to add, for example ``{5: {'votes': 1}}``. Fields
+            that are missing from a document count as 0.
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg index: The name of the index to use. If you don't specify one
+            it'll use `cls.get_write_indexes()`.
+
+        :arg routing: The routing value the documents were indexed
+            with, if any.
+
+        :arg max_conflicts: The number of times to try a document
+            again when it changed between reading and updating it.
+
+        See :py:meth:`bulk_index` for the other arguments.
+
+        :returns: :py:class:`elasticutils.bulk.BulkSummary` with the
+            result for each update. Documents that don't exist fail
+            with a 404.
+
+        .. Note::
+
+           Only top-level fields can be incremented.
+
+        .. Note::
+
+           This needs Elasticsearch 1.0 or later: it reads the
+           current values with a multi-get that asks for just the
+           incremented ``_source`` fields of each document.
+
+        """
+        if es is None:
+            es = cls.get_es()
+
+        if index is None:
+            indexes = cls.get_write_indexes(es=es)
+        else:
+            indexes = [index]
+
+        doc_type = cls.get_mapping_type_name()
+
+        store = cls.get_fingerprint_store()
+        if store is not None:
+            for id_list in chunked(list(increments), chunk_size):
+                store.delete_many([(indexes[0], doc_type, id_)
+                                   for id_ in id_list])
+
+        summary = BulkSummary()
+        for index in indexes:
+            pending = dict(increments)
+            for attempt in range(max_conflicts + 1):
+                actions = []
+                for id_list in chunked(list(pending), chunk_size):
+                    docs = [{'_id': id_, '_source': list(pending[id_])}
+                            for id_ in id_list]
+                    if routing is not None:
+                        for doc in docs:
+                            doc['_routing'] = routing
+                    resp = es.mget(index=index, doc_type=doc_type,
+                                   body={'docs': docs})
+
+                    # The response has the ids as strings, so go by
+                    # position.
+                    for id_, doc in zip(id_list, resp['docs']):
+                        meta = {'_id': id_}
+                        if routing is not None:
+                            meta['_routing'] = routing
+                        if not doc.get('found'):
+                            summary.add([_item(
+                                {'update': meta}, 404,
+                                'DocumentMissingException')])
+                            continue
+
+                        source = doc.get('_source') or {}
+                        meta['_version'] = doc['_version']
+                        actions.append(({'update': meta}, {'doc': dict(
+                            (field, (source.get(field) or 0) + amount)
+                            for field, amount in pending[id_].items())}))
+
+                result = bulk_send(
+                    es, actions, index=index, doc_type=doc_type,
+                    chunk_size=chunk_size, workers=workers,
+                    max_retries=max_retries)
+
+                pending = {}
+                items = []
+                for item in result.items:
+                    if item['status'] == 409 and attempt < max_conflicts:
+                        pending[item['_id']] = increments[item['_id']]
+                    else:
+                        items.append(item)
+                summary.add(items, retries=result.retries + len(pending),
+                            sent_bytes=result.sent_bytes)
+                if not pending:
+                    break
+
+        return summary
+
+    @classmethod
+    def unindex(cls, id_, es=None, index=None, routing=None):
         """Removes a particular item from the search index.
 
         :arg id_: The Elasticsearch id for the document to remove from
@@ -2282,14 +3494,187 @@ class Indexable(object):
         :arg index: The name of the index to use. If you don't specify one
             it'll use `cls.get_index()`.
 
+        :arg routing: The routing value the document was indexed
+            with. You must specify this if the document was indexed
+            with a routing value.
+
+        If ``cls.get_bulk_indexer()`` returns an indexer and you don't
+        specify ``es``, the delete is queued like with ``index()``.
+
+        """
+        bulk_indexer = cls.get_bulk_indexer() if es is None else None
+
+        if es is None and bulk_indexer is None:
+            es = cls.get_es()
+
+        if index is None:
+            indexes = cls.get_write_indexes(
+                es=es if bulk_indexer is None else bulk_indexer.es)
+        else:
+            indexes = [index]
+
+        store = cls.get_fingerprint_store()
+        if store is not None:
+            store.delete_many([(indexes[0], cls.get_mapping_type_name(), id_)])
+
+        for i, index in enumerate(indexes):
+            if bulk_indexer is not None:
+                bulk_indexer.delete(index, cls.get_mapping_type_name(), id_,
+                                    routing=routing)
+                continue
+
+            kw = {}
+            if routing is not None:
+                kw['routing'] = routing
+            if i > 0:
+                # The index being rebuilt may not have it yet.
+                kw['ignore'] = 404
+            es.delete(index=index, doc_type=cls.get_mapping_type_name(),
+                      id=id_, **kw)
+
+    @classmethod
+    def bulk_unindex(cls, ids, es=None, index=None, routing=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                     max_retries=DEFAULT_MAX_RETRIES):
+        """Removes a batch of items from the search index.
+
+        The deletes are sent with bulk requests. Documents that aren't
+        in the index count as removed.
+
+        :arg ids: Iterable of Elasticsearch ids of the documents to
+            remove from the index.
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg index: The name of the index to use. If you don't specify one
+            it'll use `cls.get_write_indexes()`.
+
+        :arg routing: The routing value the documents were indexed
+            with, if any.
+
+        :arg chunk_size: The maximum number of deletes to send in one
+            bulk request. This defaults to 500.
+
+        :arg workers: The number of bulk requests to send at the same
+            time. This defaults to 1.
+
+        :arg max_retries: The number of times to retry deletes that
+            Elasticsearch rejects because it's too busy.
+
+        :returns: :py:class:`elasticutils.bulk.BulkSummary` with the
+            result for each delete
+
         """
         if es is None:
             es = cls.get_es()
 
         if index is None:
-            index = cls.get_index()
+            indexes = cls.get_write_indexes(es=es)
+        else:
+            indexes = [index]
+
+        store = cls.get_fingerprint_store()
+        doc_type = cls.get_mapping_type_name()
+
+        def _forget(ids):
+            for id_list in chunked(ids, chunk_size):
+                store.delete_many([(indexes[0], doc_type, id_)
+                                   for id_ in id_list])
+                for id_ in id_list:
+                    yield id_
+
+        if store is not None:
+            ids = _forget(ids)
+
+        def _to_actions(id_):
+            meta = {'_id': id_}
+            if routing is not None:
+                meta['_routing'] = routing
+            if len(indexes) == 1:
+                yield {'delete': meta}, None
+                return
+            for index in indexes:
+                yield {'delete': dict(meta, _index=index)}, None
+
+        return bulk_send(
+            es,
+            (action for id_ in ids for action in _to_actions(id_)),
+            index=indexes[0],
+            doc_type=doc_type,
+            chunk_size=chunk_size,
+            workers=workers,
+            max_retries=max_retries,
+            ok_statuses=(404,)
+        )
+
+    @classmethod
+    def unindex_by_query(cls, query, es=None, index=None, routing=None):
+        """Removes all the documents that match a query.
+
+        This removes them with one delete-by-query request.
+
+        :arg query: an :py:class:`elasticutils.S` whose queries and
+            filters pick the documents to remove, or a query dict
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg index: The name of the index to use. If you don't specify one
+            it'll use `cls.get_write_indexes()`.
+
+        :arg routing: The routing value to restrict the delete to.
+
+        For example, to remove everything for a tenant:
+
+        .. code-block:: python
+
+            MyMappingType.unindex_by_query(
+                S(MyMappingType).filter(tenant_id=5), routing=5)
+
+        :returns: the Elasticsearch response
+
+        If ``cls.get_fingerprint_store()`` returns a store, all the
+        fingerprints for this mapping type are forgotten, so the next
+        ``bulk_index()`` sends every document once.
+
+        .. Note::
+
+           This works with Elasticsearch 0.90 and 1.x. Elasticsearch
+           2.0 moved delete-by-query to a plugin.
 
-        es.delete(index=index, doc_type=cls.get_mapping_type_name(), id=id_)
+        """
+        if es is None:
+            es = cls.get_es()
+
+        if index is None:
+            indexes = cls.get_write_indexes(es=es)
+        else:
+            indexes = [index]
+
+        if isinstance(query, S):
+            qs = query.build_search()
+            query = qs.get('query', {'match_all': {}})
+            if 'filter' in qs:
+                query = {'filtered': {'query': query, 'filter': qs['filter']}}
+
+        # ES 0.90 takes the bare query as the body.
+        if monkeypatch.get_server_version(es) >= (1, 0):
+            query = {'query': query}
+
+        doc_type = cls.get_mapping_type_name()
+        kw = {}
+        if routing is not None:
+            kw['routing'] = routing
+        resp = es.delete_by_query(
+            index=','.join(indexes), doc_type=doc_type, body=query, **kw)
+
+        # There's no telling which documents were deleted, so forget
+        # all the fingerprints for the doctype.
+        store = cls.get_fingerprint_store()
+        if store is not None:
+            store.clear(indexes[0], doc_type)
+        return resp
 
     @classmethod
     def refresh_index(cls, es=None, index=None):
@@ -2315,3 +3700,217 @@ class Indexable(object):
             index = cls.get_index()
 
         es.indices.refresh(index=index)
+
+    @classmethod
+    @contextlib.contextmanager
+    def reindex_mode(cls, es=None, index=None, optimize=False,
+                     max_num_segments=None):
+        """Context manager that tunes the index for a full reindex
+
+        While it's active, refreshing is turned off
+        (``refresh_interval`` is -1) and the index has no replicas, so
+        bulk indexing doesn't pay for either. On exit, the original
+        settings are restored and the index is refreshed. If
+        ``optimize`` is True and the block didn't raise an exception,
+        the index is optimized afterwards.
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg index: The name of the index to use. If you don't specify one
+            it'll use `cls.get_index()`.
+
+        :arg optimize: if True, merges segments after reindexing
+
+        :arg max_num_segments: the number of segments to merge down to
+            when optimizing; defaults to letting Elasticsearch decide
+
+        For example:
+
+        .. code-block:: python
+
+            with MyMappingType.reindex_mode(optimize=True):
+                MyMappingType.bulk_index(documents)
+
+        .. Note::
+
+           Until the replicas are rebuilt after the block, the index
+           has a single copy of each shard.
+
+        """
+        if es is None:
+            es = cls.get_es()
+
+        if index is None:
+            index = cls.get_index()
+
+        # The index name may be an alias, so keep the settings for each
+        # concrete index.
+        original = {}
+        resp = es.indices.get_settings(index=index, flat_settings=True)
+        for name, info in resp.items():
+            settings = info['settings']
+            original[name] = {
+                'index.refresh_interval': settings.get(
+                    'index.refresh_interval', '1s'),
+                'index.number_of_replicas': settings.get(
+                    'index.number_of_replicas', '1')
+            }
+
+        for name in original:
+            es.indices.put_settings(index=name, body={
+                'index.refresh_interval': '-1',
+                'index.number_of_replicas': '0'
+            })
+
+        try:
+            yield
+        finally:
+            bulk_indexer = cls.get_bulk_indexer()
+            if bulk_indexer is not None:
+                bulk_indexer.flush()
+
+            for name, settings in original.items():
+                es.indices.put_settings(index=name, body=settings)
+            es.indices.refresh(index=index)
+
+        if optimize:
+            kw = {}
+            if max_num_segments is not None:
+                kw['max_num_segments'] = max_num_segments
+            es.indices.optimize(index=index, **kw)
+
+    @classmethod
+    def rebuild_index(cls, es=None, settings=None,
+                      chunk_size=DEFAULT_CHUNK_SIZE, workers=4,
+                      delete_old=True, processes=None):
+        """Rebuilds the index in a new index and swaps it in.
+
+        ``cls.get_index()`` is treated as an alias. This creates a new
+        index named after it with a timestamp suffix, using
+        ``get_mapping()`` and ``settings``, and bulk indexes
+        ``get_indexable_documents()`` into it in
+        :py:meth:`reindex_mode`. Then it moves the alias from the old
+        index to the new one in one atomic step, so searches never see
+        a partial index.
+
+        While the rebuild runs, ``index()``, ``bulk_index()`` and
+        ``unindex()`` in every process write to both the old and the
+        new index. See :py:meth:`get_write_indexes`.
+
+        The documents are indexed without looking at the fingerprint
+        store, and the store forgets the fingerprints for this mapping
+        type once the alias is swapped, so it doesn't fill up with
+        entries for old indexes.
+
+        :arg es: The `Elasticsearch` to use. If you don't specify an
+            `Elasticsearch`, it'll use `cls.get_es()`.
+
+        :arg settings: settings for the new index, for example the
+            number of shards
+
+        :arg chunk_size: the number of documents per bulk request
+
+        :arg workers: the number of bulk requests to send at the same
+            time
+
+        :arg delete_old: if True, deletes the indexes the alias
+            pointed to after swapping it
+
+        :arg processes: the number of child processes to extract
+            documents in; see :py:meth:`get_indexable_documents`
+
+        :returns: the name of the new index
+
+        :raises ReindexError: if any documents failed to index. The
+            new index is deleted and the alias is left alone.
+
+        .. Note::
+
+           If ``cls.get_index()`` is an index rather than an alias, it
+           has to be deleted before the alias can take its name, so
+           searches fail for a moment the first time you rebuild.
+
+        """
+        if es is None:
+            es = cls.get_es()
+
+        alias = cls.get_index()
+        new_index = '{0}_{1}'.format(
+            alias, datetime.utcnow().strftime('%Y%m%d%H%M%S%f'))
+
+        body = {'mappings': {cls.get_mapping_type_name(): cls.get_mapping()}}
+        if settings:
+            body['settings'] = settings
+        es.indices.create(index=new_index, body=body)
+        log.info('Rebuilding {0} in {1}'.format(alias, new_index))
+
+        # Publish the new index so that writes in every process go to
+        # it too, and wait until they've all looked before reading
+        # the documents.
+        rebuild_alias = _rebuild_alias(alias)
+        es.indices.put_alias(index=new_index, name=rebuild_alias)
+        with _rebuilding_lock:
+            _rebuilding[alias] = (time.time(), new_index)
+        time.sleep(REBUILD_CHECK_INTERVAL)
+
+        try:
+            # Overrides of get_indexable_documents() may not take
+            # processes.
+            if processes:
+                documents = cls.get_indexable_documents(processes=processes)
+            else:
+                documents = cls.get_indexable_documents()
+
+            with cls.reindex_mode(es=es, index=new_index):
+                summary = cls.bulk_index(
+                    documents, es=es, index=new_index,
+                    chunk_size=chunk_size, workers=workers,
+                    skip_unchanged=False)
+
+            if summary.errors:
+                raise ReindexError(
+                    'Unable to index {0} documents into {1}'.format(
+                        len(summary.errors), new_index),
+                    summary=summary)
+
+            resp = es.indices.get_alias(name=alias, ignore=404)
+            old_indexes = [
+                name for name, info in resp.items()
+                if isinstance(info, dict) and alias in info.get('aliases', {})
+            ]
+            if not old_indexes and es.indices.exists(index=alias):
+                log.warning('Deleting index {0} to replace it with an '
+                            'alias'.format(alias))
+                es.indices.delete(index=alias)
+
+            actions = [{'remove': {'index': name, 'alias': alias}}
+                       for name in old_indexes]
+            actions.append({'add': {'index': new_index, 'alias': alias}})
+            actions.append(
+                {'remove': {'index': new_index, 'alias': rebuild_alias}})
+            es.indices.update_aliases(body={'actions': actions})
+        except Exception:
+            # Stop writes to the new index before deleting it so that
+            # they don't create it again.
+            es.indices.delete_alias(index=new_index, name=rebuild_alias,
+                                    ignore=404)
+            time.sleep(REBUILD_CHECK_INTERVAL)
+            es.indices.delete(index=new_index, ignore=404)
+            raise
+        finally:
+            with _rebuilding_lock:
+                _rebuilding.pop(alias, None)
+
+        store = cls.get_fingerprint_store()
+        if store is not None:
+            store.clear(alias, cls.get_mapping_type_name())
+
+        log.info('Rebuilt {0} in {1}: {2} documents'.format(
+            alias, new_index, summary.succeeded))
+
+        if delete_old:
+            for name in old_indexes:
+                es.indices.delete(index=name)
+
+        return new_index
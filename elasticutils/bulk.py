@@ -0,0 +1,594 @@
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+
+import six
+from six.moves import queue
+
+from elasticutils import monkeypatch
+
+
+log = logging.getLogger('elasticutils')
+
+
+#: Default maximum number of actions per bulk request.
+DEFAULT_CHUNK_SIZE = 500
+
+#: Default maximum size in bytes of a bulk request body.
+DEFAULT_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+
+#: Default number of times rejected items are retried.
+DEFAULT_MAX_RETRIES = 3
+
+#: Default seconds to wait before the first retry. This doubles with
+#: every retry.
+DEFAULT_INITIAL_BACKOFF = 0.5
+
+#: Default maximum seconds to wait between retries.
+DEFAULT_MAX_BACKOFF = 30
+
+
+class BulkSummary(object):
+    """Summary of a bulk operation
+
+    :property items: list of dicts, one per action, with ``op_type``,
+        ``_id``, ``status``, ``ok`` and ``error`` keys
+    :property retries: number of times items were retried
+    :property skipped: number of documents that weren't sent because
+        they hadn't changed
+    :property conflicts: number of externally versioned documents that
+        weren't written because the index has the same or a newer
+        version
+    :property sent_bytes: number of bytes of request bodies sent,
+        including retries
+
+    If the bulk operation used more than one sender, the items are
+    in the order their chunks finished, not the order they were sent.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = []
+        self.retries = 0
+        self.skipped = 0
+        self.sent_bytes = 0
+
+    def add(self, items, retries=0, sent_bytes=0):
+        with self._lock:
+            self.items.extend(items)
+            self.retries += retries
+            self.sent_bytes += sent_bytes
+
+    @property
+    def succeeded(self):
+        """Number of actions that succeeded."""
+        return len([item for item in self.items
+                    if item['ok'] and not item.get('conflict')])
+
+    @property
+    def conflicts(self):
+        """Number of versioned actions that lost to a newer version."""
+        return len([item for item in self.items if item.get('conflict')])
+
+    @property
+    def errors(self):
+        """List of items for actions that failed."""
+        return [item for item in self.items if not item['ok']]
+
+    @property
+    def skip_ratio(self):
+        """Fraction of documents that were skipped or had conflicts."""
+        total = len(self.items) + self.skipped
+        skipped = self.skipped + self.conflicts
+        return float(skipped) / total if total else 0.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return ('<BulkSummary succeeded={0} failed={1} retries={2} '
+                'skipped={3} conflicts={4}>'.format(
+                    self.succeeded, len(self.errors), self.retries,
+                    self.skipped, self.conflicts))
+
+
+def _is_rejected(status, info):
+    """Returns True if the item was rejected because ES was busy"""
+    return (status == 429 or
+            'EsRejectedExecution' in six.text_type(info.get('error', '')))
+
+
+def _is_retryable_error(exc):
+    from elasticsearch.exceptions import ConnectionError
+
+    return (isinstance(exc, ConnectionError) or
+            getattr(exc, 'status_code', None) == 429)
+
+
+def _item(action, status, error=None, ok_statuses=()):
+    op_type, meta = list(action.items())[0]
+    # With external versioning, a conflict means the index already has
+    # this version or a newer one, so there's nothing to do.
+    conflict = status == 409 and meta.get('_version_type') == 'external'
+    ok = 200 <= status < 300 or status in ok_statuses or conflict
+    return {
+        'op_type': op_type,
+        '_id': meta.get('_id'),
+        'status': status,
+        'ok': ok,
+        'conflict': conflict,
+        'error': None if ok else error
+    }
+
+
+def chunk_actions(actions, serializer, chunk_size=DEFAULT_CHUNK_SIZE,
+                  max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES):
+    """Serializes bulk actions and groups them into chunks
+
+    :arg actions: iterable of ``(action, source)`` tuples where
+        ``action`` is the action line like ``{'index': {'_id': 1}}``
+        and ``source`` is the document or None if the action has no
+        source line
+    :arg serializer: the serializer to use, usually
+        ``es.transport.serializer``
+    :arg chunk_size: the maximum number of actions in a chunk
+    :arg max_chunk_bytes: the maximum number of bytes in a chunk
+
+    :returns: generator of lists of ``(action, data)`` tuples where
+        ``data`` is the serialized lines for that action
+
+    Each action is serialized once. A single action bigger than
+    ``max_chunk_bytes`` gets a chunk of its own.
+
+    """
+    chunk = []
+    chunk_bytes = 0
+    for action, source in actions:
+        data = serializer.dumps(action) + '\n'
+        if source is not None:
+            data += serializer.dumps(source) + '\n'
+        data_bytes = len(data.encode('utf-8'))
+
+        if chunk and (len(chunk) >= chunk_size or
+                      chunk_bytes + data_bytes > max_chunk_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+
+        chunk.append((action, data))
+        chunk_bytes += data_bytes
+
+    if chunk:
+        yield chunk
+
+
+def send_chunk(es, chunk, summary, index=None, doc_type=None,
+               max_retries=DEFAULT_MAX_RETRIES,
+               initial_backoff=DEFAULT_INITIAL_BACKOFF,
+               max_backoff=DEFAULT_MAX_BACKOFF, ok_statuses=()):
+    """Sends one chunk with retries and records the results
+
+    Items rejected with a 429 or ``EsRejectedExecutionException`` are
+    retried with exponential backoff. So are whole requests that fail
+    with a connection error or a 429. Everything else is recorded in
+    ``summary`` as is.
+
+    See :py:func:`bulk_send` for the arguments.
+
+    """
+    from elasticsearch.exceptions import TransportError
+
+    # Clients that weren't built by get_es() need the patch too.
+    monkeypatch.monkeypatch_es()
+
+    attempt = 0
+    while chunk:
+        if attempt:
+            time.sleep(min(max_backoff, initial_backoff * 2 ** (attempt - 1)))
+
+        body = ''.join(data for action, data in chunk)
+        summary.add([], sent_bytes=len(body.encode('utf-8')))
+        try:
+            resp = es.bulk(body=body, index=index, doc_type=doc_type)
+        except TransportError as exc:
+            if attempt < max_retries and _is_retryable_error(exc):
+                log.warning('Bulk request failed, retrying: {0!r}'.format(exc))
+                summary.add([], retries=len(chunk))
+                attempt += 1
+                continue
+
+            status = exc.status_code
+            if not isinstance(status, int):
+                status = 500
+            summary.add([_item(action, status, six.text_type(exc))
+                         for action, data in chunk])
+            return
+
+        results = []
+        retry = []
+        for (action, data), resp_item in zip(chunk, resp['items']):
+            info = list(resp_item.values())[0]
+            status = info.get('status', 500)
+            if attempt < max_retries and _is_rejected(status, info):
+                retry.append((action, data))
+            else:
+                results.append(_item(action, status, info.get('error'),
+                                     ok_statuses))
+
+        summary.add(results, retries=len(retry))
+        chunk = retry
+        attempt += 1
+
+
+def bulk_send(es, actions, index=None, doc_type=None,
+              chunk_size=DEFAULT_CHUNK_SIZE,
+              max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES, workers=1,
+              max_retries=DEFAULT_MAX_RETRIES,
+              initial_backoff=DEFAULT_INITIAL_BACKOFF,
+              max_backoff=DEFAULT_MAX_BACKOFF, ok_statuses=()):
+    """Sends bulk actions in chunks and returns a summary
+
+    :arg es: the `Elasticsearch` to use
+    :arg actions: iterable of ``(action, source)`` tuples; see
+        :py:func:`chunk_actions`
+    :arg index: the default index for actions
+    :arg doc_type: the default doctype for actions
+    :arg chunk_size: the maximum number of actions per request
+    :arg max_chunk_bytes: the maximum size of a request body in bytes
+    :arg workers: the number of threads sending requests at the same
+        time
+    :arg max_retries: the number of times to retry rejected items
+    :arg initial_backoff: seconds to wait before the first retry; this
+        doubles with every retry
+    :arg max_backoff: the maximum seconds to wait between retries
+    :arg ok_statuses: statuses other than 2xx that count as success;
+        for example, 404 for deletes
+
+    :returns: :py:class:`BulkSummary`
+
+    This doesn't raise for failed items. Check ``summary.errors``.
+
+    """
+    summary = BulkSummary()
+    chunks = chunk_actions(actions, es.transport.serializer,
+                           chunk_size, max_chunk_bytes)
+
+    def send(chunk):
+        send_chunk(es, chunk, summary, index=index, doc_type=doc_type,
+                   max_retries=max_retries, initial_backoff=initial_backoff,
+                   max_backoff=max_backoff, ok_statuses=ok_statuses)
+
+    if workers <= 1:
+        for chunk in chunks:
+            send(chunk)
+        return summary
+
+    # The queue is bounded so we don't serialize everything up front
+    # if the senders can't keep up.
+    work = queue.Queue(maxsize=workers * 2)
+    failures = []
+
+    def sender():
+        while True:
+            chunk = work.get()
+            if chunk is None:
+                return
+            try:
+                send(chunk)
+            except Exception:
+                failures.append(sys.exc_info())
+
+    threads = [threading.Thread(target=sender) for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for chunk in chunks:
+            if failures:
+                break
+            work.put(chunk)
+    finally:
+        for thread in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+    if failures:
+        six.reraise(*failures[0])
+    return summary
+
+
+class _Flush(object):
+    """Marker asking the sender thread to send what it has"""
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class BulkIndexer(object):
+    """Buffers index, update and delete actions and sends them in bulk
+
+    Actions are queued in memory and a background thread sends them
+    with bulk requests when there are ``max_docs`` actions or
+    ``max_bytes`` bytes buffered, or ``interval`` seconds after the
+    first buffered action, whichever comes first.
+
+    :arg es: the `Elasticsearch` to use
+    :arg max_docs: the maximum number of actions per bulk request
+    :arg max_bytes: the maximum size of a bulk request in bytes
+    :arg interval: the maximum number of seconds an action waits in
+        the buffer
+    :arg max_queue: the maximum number of actions waiting to be sent;
+        when the queue is full, adding actions blocks until there's
+        room
+    :arg max_retries: the number of times to retry actions that
+        Elasticsearch rejects because it's too busy
+    :arg on_error: callable that's passed a list of failed items; see
+        :py:class:`BulkSummary`. Defaults to logging them.
+
+    Use it as a context manager to make sure everything gets sent::
+
+        with BulkIndexer(get_es()) as indexer:
+            for obj in objs:
+                indexer.index('blog-index', 'blog-entry',
+                              extract(obj), id_=obj.id)
+
+
+    or make it the process-wide instance that
+    :py:meth:`elasticutils.Indexable.index` and
+    :py:meth:`elasticutils.Indexable.unindex` use::
+
+        set_bulk_indexer(BulkIndexer(get_es()))
+
+
+    Buffered actions are sent when the process exits and, on Python
+    3.7 and later, before it forks. In a forked child, like a Celery
+    prefork worker, the indexer starts over with an empty queue and
+    its own sender thread.
+
+    .. Note::
+
+       Actions are sent asynchronously, so failures are reported to
+       ``on_error`` rather than raised.
+
+    """
+    def __init__(self, es, max_docs=DEFAULT_CHUNK_SIZE,
+                 max_bytes=DEFAULT_MAX_CHUNK_BYTES, interval=1.0,
+                 max_queue=10000, max_retries=DEFAULT_MAX_RETRIES,
+                 on_error=None):
+        self.es = es
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.on_error = on_error or self._log_errors
+
+        self.sent = 0
+        self.failed = 0
+
+        self._serializer = es.transport.serializer
+        self._reset()
+
+        # Weak references so that registering doesn't keep the
+        # indexer alive.
+        ref = weakref.ref(self)
+
+        def flush():
+            indexer = ref()
+            if indexer is not None:
+                indexer.flush()
+
+        def reset():
+            indexer = ref()
+            if indexer is not None:
+                indexer._reset()
+
+        def close():
+            indexer = ref()
+            if indexer is not None:
+                indexer.close()
+
+        atexit.register(close)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=flush, after_in_child=reset)
+
+    def _reset(self):
+        """Starts over with an empty queue and no sender thread"""
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # The sender thread doesn't survive a fork and what's queued
+        # is the parent's to send, so a forked child starts over.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _log_errors(self, items):
+        log.error('Bulk indexer unable to send {0} actions: {1}'.format(
+            len(items), items[:10]))
+
+    def _ensure_started(self):
+        self._check_pid()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def add(self, action, source=None):
+        """Queues a bulk action
+
+        :arg action: the action line like
+            ``{'index': {'_index': 'blog', '_type': 'entry', '_id': 1}}``
+        :arg source: the source line or None if the action doesn't
+            have one
+
+        Blocks if the queue is full.
+
+        """
+        data = self._serializer.dumps(action) + '\n'
+        if source is not None:
+            data += self._serializer.dumps(source) + '\n'
+        self._ensure_started()
+        self._queue.put((action, data, len(data.encode('utf-8'))))
+
+    def index(self, index, doc_type, document, id_=None, routing=None,
+              op_type='index', version=None):
+        """Queues indexing a document
+
+        :arg op_type: ``'index'`` to add or replace the document,
+            ``'create'`` to only add it if it doesn't exist
+        :arg version: if not None, the document is indexed with this
+            external version and skipped if the index has the same or
+            a newer version
+
+        """
+        meta = {'_index': index, '_type': doc_type}
+        if id_ is not None:
+            meta['_id'] = id_
+        if routing is not None:
+            meta['_routing'] = routing
+        if version is not None:
+            meta['_version'] = version
+            meta['_version_type'] = 'external'
+        self.add({op_type: meta}, document)
+
+    def update(self, index, doc_type, id_, doc, upsert=None, routing=None):
+        """Queues a partial update of a document"""
+        meta = {'_index': index, '_type': doc_type, '_id': id_}
+        if routing is not None:
+            meta['_routing'] = routing
+        source = {'doc': doc}
+        if upsert is not None:
+            source['upsert'] = upsert
+        self.add({'update': meta}, source)
+
+    def delete(self, index, doc_type, id_, routing=None):
+        """Queues deleting a document
+
+        Deleting a document that doesn't exist isn't an error.
+
+        """
+        meta = {'_index': index, '_type': doc_type, '_id': id_}
+        if routing is not None:
+            meta['_routing'] = routing
+        self.add({'delete': meta})
+
+    def flush(self):
+        """Sends everything queued so far and waits until it's sent"""
+        self._check_pid()
+        if self._thread is None:
+            return
+        marker = _Flush()
+        self._queue.put(marker)
+        marker.done.wait()
+
+    def close(self):
+        """Sends everything queued and stops the sender thread"""
+        self._check_pid()
+        if self._thread is None:
+            return
+        marker = _Flush(stop=True)
+        self._queue.put(marker)
+        marker.done.wait()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _send(self, batch):
+        summary = BulkSummary()
+        try:
+            send_chunk(self.es, batch, summary, max_retries=self.max_retries)
+        except Exception as exc:
+            summary.add([_item(action, 500, six.text_type(exc))
+                         for action, data in batch])
+
+        errors = [item for item in summary.errors
+                  if not (item['op_type'] == 'delete' and
+                          item['status'] == 404)]
+        self.sent += len(summary) - len(errors)
+        self.failed += len(errors)
+        if errors:
+            try:
+                self.on_error(errors)
+            except Exception:
+                log.exception('Bulk indexer on_error failed')
+
+    def _run(self):
+        # Hold on to the queue this thread was started for, in case
+        # _reset() replaces it.
+        q = self._queue
+        batch = []
+        batch_bytes = 0
+        deadline = None
+
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0, deadline - time.time())
+
+            try:
+                item = q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _Flush):
+                if batch:
+                    self._send(batch)
+                batch, batch_bytes, deadline = [], 0, None
+                item.done.set()
+                if item.stop:
+                    return
+                continue
+
+            if item is not None:
+                action, data, data_bytes = item
+                if batch and batch_bytes + data_bytes > self.max_bytes:
+                    self._send(batch)
+                    batch, batch_bytes, deadline = [], 0, None
+
+                batch.append((action, data))
+                batch_bytes += data_bytes
+                if deadline is None:
+                    deadline = time.time() + self.interval
+
+            # Check the deadline on every item so that a steady
+            # trickle doesn't hold the batch back past the interval.
+            if batch and (item is None or len(batch) >= self.max_docs or
+                          time.time() >= deadline):
+                self._send(batch)
+                batch, batch_bytes, deadline = [], 0, None
+
+
+_bulk_indexer = None
+
+
+def get_bulk_indexer():
+    """Returns the process-wide :py:class:`BulkIndexer` or None"""
+    return _bulk_indexer
+
+
+def set_bulk_indexer(indexer):
+    """Sets the process-wide :py:class:`BulkIndexer`
+
+    :arg indexer: the :py:class:`BulkIndexer` or None to stop using
+        one. The previous one is closed.
+
+    """
+    global _bulk_indexer
+    previous, _bulk_indexer = _bulk_indexer, indexer
+    if previous is not None and previous is not indexer:
+        previous.close()
@@ -0,0 +1,89 @@
+import gzip
+import io
+import socket
+
+from elasticsearch.connection import Urllib3HttpConnection
+from urllib3.connection import HTTPConnection
+
+
+def gzip_compress(data):
+    """Returns ``data`` compressed with gzip
+
+    :arg data: bytes to compress
+
+    """
+    buf = io.BytesIO()
+    # GzipFile isn't a context manager on Python 2.6.
+    fp = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+    try:
+        fp.write(data)
+    finally:
+        fp.close()
+    return buf.getvalue()
+
+
+class _GzipPool(object):
+    """Wraps a urllib3 connection pool and gzips request bodies"""
+    def __init__(self, pool):
+        self._pool = pool
+
+    def urlopen(self, method, url, body=None, headers=None, **kwargs):
+        if body:
+            body = gzip_compress(body)
+            headers = dict(headers or {})
+            headers['content-encoding'] = 'gzip'
+            headers['content-length'] = str(len(body))
+        return self._pool.urlopen(method, url, body, headers=headers,
+                                  **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class HttpConnection(Urllib3HttpConnection):
+    """urllib3 connection with compression and connection pool tuning
+
+    :arg http_compress: if True, compresses request bodies with gzip
+        and asks Elasticsearch for gzipped responses
+
+        .. Note::
+
+           Elasticsearch only compresses responses if
+           ``http.compression`` is enabled in the cluster config.
+
+    :arg maxsize: the maximum number of connections kept open to each
+        host; set this to at least the number of threads that use
+        this connection
+    :arg pool_block: if True, threads wait for a free connection when
+        all ``maxsize`` connections are in use rather than opening
+        throwaway connections
+    :arg keep_alive: if True, enables TCP keep-alive on pooled
+        connections so idle connections aren't silently dropped by
+        firewalls and load balancers
+
+    Any other arguments are passed to `Urllib3HttpConnection`.
+
+    You don't normally create these yourself. Pass the arguments to
+    :py:func:`elasticutils.get_es` instead.
+
+    """
+    def __init__(self, http_compress=False, maxsize=10, pool_block=False,
+                 keep_alive=False, **kwargs):
+        super(HttpConnection, self).__init__(maxsize=maxsize, **kwargs)
+        self.http_compress = http_compress
+        if http_compress:
+            self.headers['accept-encoding'] = 'gzip'
+
+        # The pool is tuned in place so that whatever else
+        # Urllib3HttpConnection set up on it (SSL verification,
+        # certificates) is kept.
+        self.pool.block = pool_block
+        if keep_alive:
+            socket_options = self.pool.conn_kw.get(
+                'socket_options', HTTPConnection.default_socket_options)
+            self.pool.conn_kw['socket_options'] = (
+                list(socket_options) +
+                [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+
+        if http_compress:
+            self.pool = _GzipPool(self.pool)
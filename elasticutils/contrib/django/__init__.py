@@ -5,14 +5,16 @@ from functools import wraps
 import elasticsearch
 
 from django.conf import settings
-from django.shortcuts import render
 from django.utils.decorators import decorator_from_middleware_with_args
 
-from elasticutils import F, InvalidFieldActionError, MLT, NoModelError  # noqa
+from elasticutils import (  # noqa
+    BatchMLT, F, InvalidFieldActionError, MLT, NoModelError)
 from elasticutils import S as BaseS
 from elasticutils import get_es as base_get_es
 from elasticutils import Indexable as BaseIndexable
 from elasticutils import MappingType as BaseMappingType
+from elasticutils import _extract_chunks
+from elasticutils.utils import chunked
 
 
 log = logging.getLogger('elasticutils')
@@ -40,13 +42,32 @@ def get_es(**overrides):
     """
     defaults = {
         'urls': settings.ES_URLS,
-        'timeout': getattr(settings, 'ES_TIMEOUT', 5)
+        'timeout': getattr(settings, 'ES_TIMEOUT', 5),
+        'http_compress': getattr(settings, 'ES_HTTP_COMPRESS', False),
+        'maxsize': getattr(settings, 'ES_POOL_MAXSIZE', None),
+        'pool_block': getattr(settings, 'ES_POOL_BLOCK', False),
+        'keep_alive': getattr(settings, 'ES_KEEP_ALIVE', False),
         }
 
     defaults.update(overrides)
     return base_get_es(**defaults)
 
 
+def close_connections():
+    """Closes the current thread's database connections.
+
+    Django keeps a connection per thread, so this has to be called in
+    the thread that opened them. Pass it as ``cleanup`` to
+    :py:func:`elasticutils.pipeline.run_pipeline` so the stage threads
+    don't leave connections open.
+
+    """
+    from django import db
+
+    for connection in db.connections.all():
+        connection.close()
+
+
 def es_required(fun):
     """Wrap a callable and return None if ES_DISABLED is False.
 
@@ -103,12 +124,16 @@ class ESExceptionMiddleware(object):
 
     def process_request(self, request):
         if getattr(settings, 'ES_DISABLED', False):
+            from django.shortcuts import render
+
             response = render(request, self.disabled_template)
             response.status_code = 501
             return response
 
     def process_exception(self, request, exception):
         if issubclass(exception.__class__, ES_EXCEPTIONS):
+            from django.shortcuts import render
+
             response = render(request, self.error_template,
                               {'error': exception})
             response.status_code = 503
@@ -294,17 +319,100 @@ class Indexable(BaseIndexable):
         """
         return get_es(**overrides)
 
+    @classmethod
+    def get_indexable_queryset(cls):
+        """Returns the queryset of all objects to be indexed.
+
+        Defaults to ``cls.get_model().objects.all()``. Override this to
+        index only some of the objects.
+
+        :returns: queryset of objects to be indexed
+
+        """
+        return cls.get_model().objects.all()
+
     @classmethod
     def get_indexable(cls):
         """Returns the queryset of ids of all things to be indexed.
 
         Defaults to::
 
-            cls.get_model().objects.order_by('id').values_list(
+            cls.get_indexable_queryset().order_by('id').values_list(
                 'id', flat=True)
 
         :returns: iterable of ids of objects to be indexed
 
         """
-        model = cls.get_model()
-        return model.objects.order_by('id').values_list('id', flat=True)
+        return cls.get_indexable_queryset().order_by('id').values_list(
+            'id', flat=True)
+
+    @classmethod
+    def iter_indexable(cls, chunk_size=1000, start_after=None,
+                       last_id=None):
+        """Yields chunks of objects to be indexed in id order.
+
+        This pages through ``get_indexable_queryset()`` with queries
+        like ``WHERE id > last_id ORDER BY id LIMIT chunk_size``, so
+        memory use stays the same no matter how big the table is and
+        the database can scan the primary key index.
+
+        .. Note::
+
+           If you override ``get_indexable()``, this uses it instead:
+           it fetches the ids it returns and then the objects for each
+           chunk of ids.
+
+        :arg chunk_size: the number of objects per chunk
+        :arg start_after: if not None, only objects with ids greater
+            than this are returned; use it to resume
+        :arg last_id: if not None, only objects with ids up to and
+            including this are returned
+
+        :returns: generator of lists of objects
+
+        """
+        if cls.get_indexable.__func__ is not Indexable.get_indexable.__func__:
+            ids = cls.get_indexable()
+            if start_after is not None:
+                ids = (id_ for id_ in ids if id_ > start_after)
+            if last_id is not None:
+                ids = (id_ for id_ in ids if id_ <= last_id)
+            model = cls.get_model()
+            for id_list in chunked(ids, chunk_size):
+                yield list(model.objects.filter(id__in=id_list))
+            return
+
+        qs = cls.get_indexable_queryset().order_by('id')
+        if last_id is not None:
+            qs = qs.filter(id__lte=last_id)
+        while True:
+            page = qs
+            if start_after is not None:
+                page = qs.filter(id__gt=start_after)
+            objs = list(page[:chunk_size])
+            if not objs:
+                return
+            yield objs
+            start_after = objs[-1].id
+
+    @classmethod
+    def get_indexable_documents(cls, chunk_size=100, processes=None):
+        """Returns an iterable of documents for everything indexable.
+
+        Streams the objects with ``iter_indexable()`` in chunks of
+        ``chunk_size`` and extracts their documents with
+        ``extract_documents()``, in ``processes`` child processes if
+        it's set. The processes are started when this is called.
+
+        :returns: iterable of documents
+
+        """
+        if processes:
+            # Don't share the connection with the forked processes.
+            close_connections()
+        chunks = cls.iter_indexable(chunk_size)
+        # Not a generator function, so the processes are started now
+        # rather than by whichever thread first iterates the result.
+        return (document
+                for documents in _extract_chunks(cls, chunks, processes)
+                for document in documents)
@@ -0,0 +1,260 @@
+"""
+Batching of index and unindex tasks triggered by model signals.
+
+Instead of queueing one task per save::
+
+    @receiver(dbsignals.post_save, sender=MyModel)
+    def update_in_index(sender, instance, **kw):
+        from elasticutils.contrib.django import batching
+        batching.queue_index(MyMappingType, [instance.id])
+
+    @receiver(dbsignals.pre_delete, sender=MyModel)
+    def remove_from_index(sender, instance, **kw):
+        from elasticutils.contrib.django import batching
+        batching.queue_unindex(MyMappingType, [instance.id])
+
+
+Ids queued inside a transaction are de-duplicated, only collected
+when it commits and dropped if it rolls back. Ids collected inside
+:py:func:`batched`, or a request handled with
+:py:class:`IndexBatchMiddleware`, are de-duplicated and sent as one
+:py:func:`tasks.index_objects` and one :py:func:`tasks.unindex_objects`
+task per mapping type when it ends. If an id is queued for both, the
+last one wins.
+
+With ``settings.ES_INDEX_DEBOUNCE`` set to a number of seconds, batches
+are held in the process for that long and merged with any other
+batches in that time before the tasks are sent.
+"""
+import atexit
+import contextlib
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+
+log = logging.getLogger('elasticutils')
+
+INDEX = 'index'
+UNINDEX = 'unindex'
+
+_local = threading.local()
+
+# Batches waiting for the debounce window to close.
+_pending = {}
+_pending_lock = threading.Lock()
+_timer = None
+# The process the timer was started in; it doesn't survive a fork.
+_timer_pid = None
+
+
+def _merge(batch, other):
+    for mapping_type, changes in other.items():
+        batch.setdefault(mapping_type, {}).update(changes)
+
+
+def _queue(mapping_type, ids, action, using=None):
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+
+    changes = dict((id_, action) for id_ in ids)
+    if not changes:
+        return
+
+    # Django 1.9+ can run things after the transaction commits. On
+    # older versions, use IndexBatchMiddleware with ATOMIC_REQUESTS so
+    # the batch is sent after the commit.
+    if getattr(transaction, 'on_commit', None) is not None:
+        connection = transaction.get_connection(using)
+        if connection.in_atomic_block:
+            _merge(_transaction_batch(connection), {mapping_type: changes})
+            return
+
+    _collect({mapping_type: changes})
+
+
+def _transaction_batch(connection):
+    """Returns the batch that's collected when the transaction commits
+
+    There's one batch and one ``on_commit`` callback per transaction
+    and connection. If the callback is gone, because a savepoint it
+    was added in rolled back or the transaction is over, this starts
+    a new batch.
+
+    """
+    batches = _local.__dict__.setdefault('transactions', {})
+    batch, callback = batches.get(connection.alias, (None, None))
+    callbacks = [entry[1] for entry in connection.run_on_commit]
+    if callback is not None and callback in callbacks:
+        return batch
+
+    batch = {}
+
+    def callback():
+        if batches.get(connection.alias, (None,))[0] is batch:
+            del batches[connection.alias]
+        _collect(batch)
+
+    batches[connection.alias] = (batch, callback)
+    transaction.on_commit(callback, using=connection.alias)
+    return batch
+
+
+def _collect(batch):
+    stack = getattr(_local, 'batches', None)
+    if stack:
+        _merge(stack[-1], batch)
+    else:
+        _schedule(batch)
+
+
+def _check_pid():
+    global _timer, _timer_pid
+
+    # A forked child has no timer thread, and what's pending is the
+    # parent's to send.
+    if _timer is not None and _timer_pid != os.getpid():
+        _pending.clear()
+        _timer = _timer_pid = None
+
+
+def _schedule(batch):
+    global _timer, _timer_pid
+
+    debounce = getattr(settings, 'ES_INDEX_DEBOUNCE', 0)
+    if not debounce:
+        dispatch(batch)
+        return
+
+    with _pending_lock:
+        _check_pid()
+        _merge(_pending, batch)
+        if _timer is None:
+            _timer = threading.Timer(debounce, flush)
+            _timer.daemon = True
+            _timer.start()
+            _timer_pid = os.getpid()
+
+
+def _start_batch():
+    _local.__dict__.setdefault('batches', []).append({})
+
+
+def _end_batch():
+    stack = _local.batches
+    batch = stack.pop()
+    if stack:
+        _merge(stack[-1], batch)
+    elif batch:
+        _schedule(batch)
+
+
+def queue_index(mapping_type, ids, using=None):
+    """Queues indexing documents of a mapping type.
+
+    :arg mapping_type: the mapping type for these ids
+    :arg ids: the list of ids of things to index
+    :arg using: the database alias whose transaction to wait for
+
+    """
+    _queue(mapping_type, ids, INDEX, using=using)
+
+
+def queue_unindex(mapping_type, ids, using=None):
+    """Queues removing documents of a mapping type from the index.
+
+    :arg mapping_type: the mapping type for these ids
+    :arg ids: the list of ids of things to remove
+    :arg using: the database alias whose transaction to wait for
+
+    """
+    _queue(mapping_type, ids, UNINDEX, using=using)
+
+
+@contextlib.contextmanager
+def batched():
+    """Context manager that collects queued ids and sends them on exit.
+
+    For example::
+
+        with batched():
+            for obj in objs:
+                obj.save()
+
+    Nested blocks send everything when the outermost one exits. The
+    batch is sent even if the block raises an exception: the tasks
+    read the objects from the database, so indexing an object whose
+    change was rolled back doesn't hurt.
+
+    """
+    _start_batch()
+    try:
+        yield
+    finally:
+        _end_batch()
+
+
+def flush():
+    """Sends batches waiting for the debounce window right away."""
+    global _timer, _timer_pid
+
+    with _pending_lock:
+        _check_pid()
+        batch = dict(_pending)
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = _timer_pid = None
+
+    if batch:
+        dispatch(batch)
+
+
+def dispatch(batch):
+    """Sends tasks for a batch.
+
+    :arg batch: dict of mapping type -> dict of id -> ``'index'`` or
+        ``'unindex'``
+
+    """
+    from elasticutils.contrib.django import tasks
+
+    for mapping_type, changes in batch.items():
+        index_ids = sorted(
+            id_ for id_, action in changes.items() if action == INDEX)
+        unindex_ids = sorted(
+            id_ for id_, action in changes.items() if action == UNINDEX)
+
+        log.debug('Dispatching {0}: {1} to index, {2} to unindex'.format(
+            mapping_type.__name__, len(index_ids), len(unindex_ids)))
+        if index_ids:
+            tasks.index_objects.delay(mapping_type, index_ids)
+        if unindex_ids:
+            tasks.unindex_objects.delay(mapping_type, unindex_ids)
+
+
+atexit.register(flush)
+
+
+class IndexBatchMiddleware(object):
+    """Middleware that batches the ids queued during a request.
+
+    Everything queued with :py:func:`queue_index` and
+    :py:func:`queue_unindex` while handling a request is sent when the
+    response goes out.
+
+    """
+
+    def process_request(self, request):
+        _start_batch()
+
+    def process_response(self, request, response):
+        # Responses for requests that didn't go through
+        # process_request, like redirects from earlier middleware,
+        # have no batch.
+        if getattr(_local, 'batches', None):
+            _end_batch()
+        return response
@@ -0,0 +1,215 @@
+import functools
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    from importlib import import_module
+except ImportError:
+    # Python 2.6
+    from django.utils.importlib import import_module
+
+from elasticutils.contrib.django import close_connections
+from elasticutils.pipeline import process_map, run_pipeline
+
+
+log = logging.getLogger('elasticutils')
+
+
+def load_mapping_type(path):
+    """Returns the mapping type class for a dotted path"""
+    module_name, _, name = path.rpartition('.')
+    try:
+        return getattr(import_module(module_name), name)
+    except (ImportError, AttributeError, ValueError):
+        raise CommandError('Unable to import mapping type {0}'.format(path))
+
+
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB'):
+        if count < 1024:
+            return '{0:.1f} {1}'.format(count, unit)
+        count /= 1024.0
+    return '{0:.1f} GB'.format(count)
+
+
+def extract_chunk(mapping_type, objs):
+    """Returns ``(last id, number of objects, documents)`` for a chunk"""
+    return (max(obj.id for obj in objs), len(objs),
+            mapping_type.extract_documents(objs))
+
+
+class Checkpoints(object):
+    """Keeps the last id indexed for each mapping type in a JSON file"""
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                self.data = json.load(fp)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, last_id):
+        self.data[key] = last_id
+        self.save()
+
+    def clear(self, key):
+        self.data.pop(key, None)
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        if not self.data:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        # Write and rename so a kill doesn't leave half a file.
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.data, fp)
+        os.rename(tmp_path, self.path)
+
+
+OPTIONS = (
+    ('--chunk-size', {
+        'dest': 'chunk_size', 'type': int, 'default': 1000,
+        'help': 'Number of objects to index per bulk request.'}),
+    ('--workers', {
+        'dest': 'workers', 'type': int, 'default': 1,
+        'help': 'Number of bulk requests to send at the same time. '
+                'Objects are read chunk-size times workers at a time.'}),
+    ('--processes', {
+        'dest': 'processes', 'type': int, 'default': 0,
+        'help': 'Number of processes to extract documents in. Use this '
+                'when extract_document is CPU-bound.'}),
+    ('--checkpoint', {
+        'dest': 'checkpoint', 'default': '.es_reindex_checkpoint.json',
+        'help': 'File to keep the last id indexed in, so an interrupted '
+                'run can resume. Pass an empty string to turn this off.'}),
+    ('--restart', {
+        'dest': 'restart', 'action': 'store_true', 'default': False,
+        'help': 'Ignore the checkpoint and start from the beginning.'}),
+)
+
+
+class Command(BaseCommand):
+    help = ('Reindexes everything for the given mapping types, for '
+            'example myapp.search.EntryMappingType. Resumes from the '
+            'checkpoint of an interrupted run.')
+    args = '<mapping_type mapping_type ...>'
+
+    if hasattr(BaseCommand, 'option_list'):
+        # Django < 1.8
+        option_list = BaseCommand.option_list + tuple(
+            make_option(name, **dict(kwargs, type=(
+                'int' if kwargs.get('type') is int else kwargs.get('type'))))
+            for name, kwargs in OPTIONS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('mapping_types', nargs='+')
+        for name, kwargs in OPTIONS:
+            parser.add_argument(name, **kwargs)
+
+    def handle(self, *args, **options):
+        paths = options.get('mapping_types') or args
+        if not paths:
+            raise CommandError('Specify at least one mapping type.')
+
+        checkpoints = Checkpoints(options['checkpoint'])
+        for path in paths:
+            if options['restart']:
+                checkpoints.clear(path)
+            self.reindex(path, load_mapping_type(path), checkpoints,
+                         options['chunk_size'], options['workers'],
+                         options.get('processes'))
+
+    def reindex(self, path, mapping_type, checkpoints, chunk_size, workers,
+                processes=None):
+        last_id = checkpoints.get(path)
+        if last_id is not None:
+            self.stdout.write('{0}: resuming after id {1}'.format(
+                path, last_id))
+
+        # Count with the database if get_indexable() returns a
+        # queryset rather than fetching all the ids.
+        indexable = mapping_type.get_indexable()
+        if hasattr(indexable, 'filter'):
+            if last_id is not None:
+                indexable = indexable.filter(id__gt=last_id)
+            total = indexable.count()
+        else:
+            total = len([id_ for id_ in indexable
+                         if last_id is None or id_ > last_id])
+        progress = {'done': 0, 'indexed': 0, 'sent_bytes': 0, 'failed': 0}
+        start = time.time()
+
+        def send(item):
+            chunk_last_id, count, documents = item
+            if documents:
+                # Each chunk has enough documents for a bulk request
+                # per worker.
+                summary = mapping_type.bulk_index(
+                    documents, id_field='id', chunk_size=chunk_size,
+                    workers=workers)
+                progress['indexed'] += summary.succeeded
+                progress['sent_bytes'] += summary.sent_bytes
+                if summary.errors:
+                    progress['failed'] += len(summary.errors)
+                    log.error('Unable to index {0} documents: {1}'.format(
+                        len(summary.errors), summary.errors[:10]))
+
+            progress['done'] += count
+            # Once documents have failed, the checkpoint stays before
+            # them so that the next run retries them.
+            if not progress['failed']:
+                checkpoints.set(path, chunk_last_id)
+            self.report(path, progress['done'], total,
+                        progress['sent_bytes'], time.time() - start)
+
+        # Reading, extracting and sending happen at the same time.
+        chunks = mapping_type.iter_indexable(chunk_size * workers, last_id)
+        extract = functools.partial(extract_chunk, mapping_type)
+        if processes:
+            # The read thread hands chunks to the processes and yields
+            # their results in order.
+            close_connections()
+            source = ('read+extract', process_map(extract, chunks, processes))
+            stages = [('send', send)]
+        else:
+            source = ('read', chunks)
+            stages = [('extract', extract), ('send', send)]
+        stats = run_pipeline(source, stages, cleanup=close_connections)
+
+        mapping_type.refresh_index()
+        self.stdout.write('{0}: indexed {1} of {2} in {3:.1f}s'.format(
+            path, progress['indexed'], total, time.time() - start))
+        if progress['failed']:
+            self.stdout.write(
+                '{0}: {1} documents failed; run again to retry from the '
+                'checkpoint'.format(path, progress['failed']))
+        else:
+            checkpoints.clear(path)
+        for stage in stats:
+            self.stdout.write(
+                '{0}:   {1:<8} busy {2:7.1f}s  waiting {3:7.1f}s'.format(
+                    path, stage.name, stage.busy, stage.waiting))
+
+    def report(self, path, done, total, sent_bytes, elapsed):
+        docs_per_sec = done / elapsed if elapsed else 0.0
+        bytes_per_sec = sent_bytes / elapsed if elapsed else 0.0
+        if docs_per_sec:
+            eta = timedelta(seconds=int((total - done) / docs_per_sec))
+        else:
+            eta = '?'
+        self.stdout.write(
+            '{0}: {1}/{2} ({3:.1f}%) {4:.1f} docs/s {5}/s ETA {6}'.format(
+                path, done, total, 100.0 * done / max(total, 1), docs_per_sec,
+                format_bytes(bytes_per_sec), eta))
@@ -1,8 +1,12 @@
 import logging
+import time
 
 from django.conf import settings
+from celery import chord
 from celery.task import task
 
+from elasticutils.contrib.django import close_connections
+from elasticutils.pipeline import run_pipeline
 from elasticutils.utils import chunked
 
 
@@ -39,9 +43,11 @@ def index_objects(mapping_type, ids, chunk_size=100, es=None, index=None):
     :arg index: The name of the index to use. If you don't specify one
         it'll use `mapping_type.get_index()`.
 
+    :returns: the number of documents indexed
+
     """
     if settings.ES_DISABLED:
-        return
+        return 0
 
     log.debug('Indexing objects {0}-{1}. [{2}]'.format(
             ids[0], ids[-1], len(ids)))
@@ -49,24 +55,198 @@ def index_objects(mapping_type, ids, chunk_size=100, es=None, index=None):
     # Get the model this mapping type is based on.
     model = mapping_type.get_model()
 
-    # Retrieve all the objects that we're going to index and do it in
-    # bulk.
-    for id_list in chunked(ids, chunk_size):
-        documents = []
+    def read():
+        for id_list in chunked(ids, chunk_size):
+            yield list(model.objects.filter(id__in=id_list))
+
+    return _index_chunks(mapping_type, read(), es, index,
+                         pipelined=len(ids) > chunk_size)
+
+
+@task
+def index_range(mapping_type, start_after, last_id, chunk_size=100,
+                es=None, index=None):
+    """Index the documents of a mapping type in a range of ids.
+
+    The objects are read with ``mapping_type.iter_indexable()``, so
+    only ``chunk_size`` of them are in memory at a time.
+    :py:func:`reindex` runs one of these per range.
+
+    :arg mapping_type: the mapping type to index
+    :arg start_after: the range starts after this id; None starts at
+        the beginning
+    :arg last_id: the last id in the range
+    :arg chunk_size: the size of the chunk for bulk indexing
+    :arg es: The `Elasticsearch` to use. If you don't specify an
+        `Elasticsearch`, it'll use `mapping_type.get_es()`.
+    :arg index: The name of the index to use. If you don't specify one
+        it'll use `mapping_type.get_index()`.
+
+    :returns: the number of documents indexed
+
+    """
+    if settings.ES_DISABLED:
+        return 0
+
+    log.debug('Indexing objects after {0} up to {1}'.format(
+            start_after, last_id))
+
+    chunks = mapping_type.iter_indexable(
+        chunk_size, start_after=start_after, last_id=last_id)
+    return _index_chunks(mapping_type, chunks, es, index, pipelined=True)
+
+
+def _index_chunks(mapping_type, chunks, es, index, pipelined):
+    """Extracts and bulk indexes each chunk of objects
+
+    Returns the number of documents indexed.
+
+    """
+    # With more than one chunk, sending a chunk to Elasticsearch
+    # happens at the same time as reading the next one from the
+    # database and extracting its documents. Reading and extracting
+    # stay in this thread so they see its transaction.
+    indexed = [0]
+
+    def read_and_extract():
+        for objs in chunks:
+            yield mapping_type.extract_documents(objs)
+
+    def send(documents):
+        if not documents:
+            return
+        summary = mapping_type.bulk_index(
+            documents, id_field='id', es=es, index=index)
+        indexed[0] += summary.succeeded
+        if summary.errors:
+            log.error('Unable to index {0} documents: {1}'.format(
+                    len(summary.errors), summary.errors[:10]))
+
+    if not pipelined:
+        for documents in read_and_extract():
+            send(documents)
+    else:
+        run_pipeline(
+            ('read+extract', read_and_extract()), [('send', send)],
+            cleanup=close_connections, source_in_caller=True)
+
+    return indexed[0]
+
+
+def _id_ranges(mapping_type, chunk_size):
+    """Yields ``(start_after, last_id, count)`` for each range of ids
+
+    Each range has ``chunk_size`` ids, except maybe the last one.
 
-        for obj in model.objects.filter(id__in=id_list):
-            try:
-                documents.append(mapping_type.extract_document(obj.id, obj))
-            except Exception as exc:
-                log.exception('Unable to extract document {0}: {1}'.format(
-                        obj, repr(exc)))
+    """
+    ids = mapping_type.get_indexable()
+    start_after = None
+    if hasattr(ids, 'filter'):
+        # Walk keyset pages of ids so only one page is in memory.
+        while True:
+            page = ids
+            if start_after is not None:
+                page = ids.filter(id__gt=start_after)
+            id_list = list(page[:chunk_size])
+            if not id_list:
+                return
+            yield start_after, id_list[-1], len(id_list)
+            start_after = id_list[-1]
+    else:
+        for id_list in chunked(sorted(ids), chunk_size):
+            yield start_after, id_list[-1], len(id_list)
+            start_after = id_list[-1]
+
+
+@task
+def reindex(mapping_type, chunk_size=1000, es=None, index=None):
+    """Reindex everything of a mapping type across workers.
+
+    Splits the ids from ``mapping_type.get_indexable()`` into ranges
+    of ``chunk_size`` consecutive ids and runs an
+    :py:func:`index_range` task for each range. When they're all
+    done, :py:func:`reindex_done` refreshes the index and logs
+    totals and throughput.
+
+    Only the range bounds go into the task messages. The bounds are
+    found by paging through the ids ``chunk_size`` at a time, so the
+    ids aren't all loaded at once. If ``get_indexable()`` is
+    overridden to return something other than a queryset, its ids
+    are sorted in memory.
+
+    For example::
+
+        from elasticutils.contrib.django import tasks
+        tasks.reindex.delay(MyMappingType)
+
+
+    :arg mapping_type: the mapping type to reindex
+    :arg chunk_size: the number of ids per :py:func:`index_range`
+        task
+    :arg es: The `Elasticsearch` to use. If you don't specify an
+        `Elasticsearch`, it'll use `mapping_type.get_es()`.
+    :arg index: The name of the index to use. If you don't specify one
+        it'll use `mapping_type.get_index()`.
+
+    :returns: the chord's result
+
+    .. Note::
+
+       This needs a Celery result backend so the final step can
+       collect the results of the chunks.
+
+    """
+    if settings.ES_DISABLED:
+        return
+
+    start = time.time()
+    header = []
+    total = 0
+    for start_after, last_id, count in _id_ranges(mapping_type, chunk_size):
+        header.append(index_range.si(
+            mapping_type, start_after, last_id, es=es, index=index))
+        total += count
+    log.info('Reindexing {0} objects in {1} tasks'.format(
+            total, len(header)))
+
+    callback = reindex_done.s(
+        mapping_type, total=total, start=start, es=es, index=index)
+    return chord(header)(callback)
+
+
+@task
+def reindex_done(results, mapping_type, total, start, es=None, index=None):
+    """Finishes a :py:func:`reindex`.
+
+    Refreshes the index and logs how many documents were indexed and
+    how fast.
+
+    :arg results: the results of the :py:func:`index_objects` tasks
+    :arg total: the number of objects there were to index
+    :arg start: the time the reindex started
+
+    :returns: dict with ``indexed``, ``total``, ``tasks``, ``seconds``
+        and ``docs_per_second`` keys
+
+    """
+    mapping_type.refresh_index(es=es, index=index)
 
-        if documents:
-            mapping_type.bulk_index(documents, id_field='id', es=es, index=index)
+    indexed = sum(results)
+    seconds = time.time() - start
+    report = {
+        'indexed': indexed,
+        'total': total,
+        'tasks': len(results),
+        'seconds': seconds,
+        'docs_per_second': indexed / seconds if seconds else 0.0
+    }
+    log.info('Reindexed {indexed} of {total} objects in {tasks} tasks in '
+             '{seconds:.1f}s ({docs_per_second:.1f} docs/s)'.format(**report))
+    return report
 
 
 @task
-def unindex_objects(mapping_type, ids, es=None, index=None):
+def unindex_objects(mapping_type, ids, es=None, index=None, chunk_size=500):
     """Remove documents of a specified mapping_type from the index.
 
     This allows for asynchronous deleting.
@@ -85,9 +265,13 @@ def unindex_objects(mapping_type, ids, es=None, index=None):
         `Elasticsearch`, it'll use `mapping_type.get_es()`.
     :arg index: The name of the index to use. If you don't specify one
         it'll use `mapping_type.get_index()`.
+    :arg chunk_size: the number of deletes per bulk request
     """
     if settings.ES_DISABLED:
         return
 
-    for id_ in ids:
-        mapping_type.unindex(id_, es=es, index=index)
+    summary = mapping_type.bulk_unindex(
+        ids, es=es, index=index, chunk_size=chunk_size)
+    if summary.errors:
+        log.error('Unable to unindex {0} documents: {1}'.format(
+                len(summary.errors), summary.errors[:10]))
@@ -20,41 +20,62 @@ class Meta(object):
 
 class SearchQuerySet(object):
     # Yes. This is kind of crazy, but ... whatever.
-    def __init__(self, model):
+    def __init__(self, model, steps=None):
         self.model = model
-        self.steps = []
+        self.steps = steps or []
+
+    def _clone(self, step):
+        return SearchQuerySet(self.model, self.steps + [step])
 
     def get(self, pk):
         pk = int(pk)
         return [m for m in _model_cache if m.id == pk][0]
 
-    def filter(self, id__in=None):
-        self.steps.append(('filter', id__in))
-        return self
+    def all(self):
+        return self._clone(('all',))
+
+    def filter(self, id__in=None, id__gt=None, id__lte=None):
+        if id__gt is not None:
+            return self._clone(('filter_gt', id__gt))
+        if id__lte is not None:
+            return self._clone(('filter_lte', id__lte))
+        return self._clone(('filter', id__in))
 
     def order_by(self, *fields):
-        self.steps.append(('order_by', fields))
-        return self
+        return self._clone(('order_by', fields))
 
     def values_list(self, *args, **kwargs):
-        self.steps.append(('values_list', args, kwargs.pop('flat', False)))
-        return self
+        return self._clone(('values_list', args, kwargs.pop('flat', False)))
+
+    def __getitem__(self, key):
+        return self._clone(('slice', key))
+
+    def count(self):
+        return len(list(self))
 
     def __iter__(self):
-        order_by = None
+        order_by_field = None
         values_list = None
-        objs = _model_cache
+        objs = list(_model_cache)
 
         for mem in self.steps:
             if mem[0] == 'filter':
                 objs = [obj for obj in objs if obj.id in mem[1]]
+            elif mem[0] == 'filter_gt':
+                objs = [obj for obj in objs if obj.id > mem[1]]
+            elif mem[0] == 'filter_lte':
+                objs = [obj for obj in objs if obj.id <= mem[1]]
             elif mem[0] == 'order_by':
                 order_by_field = mem[1][0]
             elif mem[0] == 'values_list':
                 values_list = (mem[1], mem[2])
 
-        if order_by:
-            objs.sort(key=getattr(obj, order_by_field))
+        if order_by_field:
+            objs.sort(key=lambda obj: getattr(obj, order_by_field))
+
+        for mem in self.steps:
+            if mem[0] == 'slice':
+                objs = objs[mem[1]]
 
         if values_list:
             # Note: Hard-coded to just id and flat
@@ -66,6 +87,9 @@ class Manager(object):
     def get_query_set(self):
         return SearchQuerySet(self)
 
+    def all(self):
+        return self.get_query_set()
+
     def get(self, pk):
         return self.get_query_set().get(pk)
 
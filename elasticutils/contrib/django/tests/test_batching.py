@@ -0,0 +1,152 @@
+import time
+from unittest import TestCase
+
+from django.conf import settings
+from django.db import transaction
+from nose.tools import eq_
+
+from elasticutils.contrib.django import batching
+from elasticutils.contrib.django.tests import FakeDjangoMappingType
+
+
+class OtherMappingType(FakeDjangoMappingType):
+    pass
+
+
+class BatchingTest(TestCase):
+    def setUp(self):
+        super(BatchingTest, self).setUp()
+        self.dispatched = []
+        self._dispatch = batching.dispatch
+        batching.dispatch = self.dispatched.append
+
+    def tearDown(self):
+        batching.flush()
+        batching.dispatch = self._dispatch
+        settings.ES_INDEX_DEBOUNCE = 0
+        super(BatchingTest, self).tearDown()
+
+    def test_no_batch(self):
+        batching.queue_index(FakeDjangoMappingType, [1])
+        batching.queue_unindex(FakeDjangoMappingType, [2])
+        eq_(self.dispatched, [
+            {FakeDjangoMappingType: {1: 'index'}},
+            {FakeDjangoMappingType: {2: 'unindex'}}
+        ])
+
+    def test_batched(self):
+        with batching.batched():
+            batching.queue_index(FakeDjangoMappingType, [1, 2])
+            batching.queue_index(FakeDjangoMappingType, [2, 3])
+            batching.queue_unindex(FakeDjangoMappingType, [3])
+            batching.queue_index(OtherMappingType, [1])
+            with batching.batched():
+                batching.queue_index(OtherMappingType, [2])
+            eq_(self.dispatched, [])
+
+        eq_(self.dispatched, [{
+            FakeDjangoMappingType: {1: 'index', 2: 'index', 3: 'unindex'},
+            OtherMappingType: {1: 'index', 2: 'index'}
+        }])
+
+    def test_transaction(self):
+        with transaction.atomic():
+            batching.queue_index(FakeDjangoMappingType, [1])
+            batching.queue_index(FakeDjangoMappingType, [1, 2])
+            batching.queue_unindex(FakeDjangoMappingType, [2])
+            eq_(self.dispatched, [])
+        # One dispatch per transaction.
+        eq_(self.dispatched, [
+            {FakeDjangoMappingType: {1: 'index', 2: 'unindex'}}
+        ])
+
+        # The next transaction starts over.
+        del self.dispatched[:]
+        with transaction.atomic():
+            batching.queue_index(FakeDjangoMappingType, [3])
+        eq_(self.dispatched, [{FakeDjangoMappingType: {3: 'index'}}])
+
+        # With a batch, the commits are de-duplicated.
+        del self.dispatched[:]
+        with batching.batched():
+            for i in range(2):
+                with transaction.atomic():
+                    batching.queue_index(FakeDjangoMappingType, [1])
+        eq_(self.dispatched, [{FakeDjangoMappingType: {1: 'index'}}])
+
+    def test_rollback(self):
+        with batching.batched():
+            try:
+                with transaction.atomic():
+                    batching.queue_index(FakeDjangoMappingType, [1])
+                    raise ValueError
+            except ValueError:
+                pass
+            batching.queue_index(FakeDjangoMappingType, [2])
+        eq_(self.dispatched, [{FakeDjangoMappingType: {2: 'index'}}])
+
+    def test_savepoint_rollback(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    batching.queue_index(FakeDjangoMappingType, [1])
+                    raise ValueError
+            except ValueError:
+                pass
+            # The callback for the savepoint is gone, so this starts
+            # a new batch.
+            batching.queue_index(FakeDjangoMappingType, [2])
+            with transaction.atomic():
+                batching.queue_index(FakeDjangoMappingType, [3])
+        eq_(self.dispatched, [
+            {FakeDjangoMappingType: {2: 'index', 3: 'index'}}
+        ])
+
+    def test_debounce_forked(self):
+        settings.ES_INDEX_DEBOUNCE = 60
+        batching.queue_index(FakeDjangoMappingType, [1])
+        timer = batching._timer
+
+        # Pretend this is a child process that inherited the parent's
+        # pending batch but not its timer thread.
+        batching._timer_pid = -1
+        settings.ES_INDEX_DEBOUNCE = 0.05
+        batching.queue_index(FakeDjangoMappingType, [2])
+        assert batching._timer is not timer
+        timer.cancel()
+
+        time.sleep(0.2)
+        eq_(self.dispatched, [{FakeDjangoMappingType: {2: 'index'}}])
+
+    def test_debounce(self):
+        settings.ES_INDEX_DEBOUNCE = 0.05
+        batching.queue_index(FakeDjangoMappingType, [1])
+        with batching.batched():
+            batching.queue_index(FakeDjangoMappingType, [2])
+        eq_(self.dispatched, [])
+
+        time.sleep(0.2)
+        eq_(self.dispatched, [
+            {FakeDjangoMappingType: {1: 'index', 2: 'index'}}
+        ])
+
+    def test_disabled(self):
+        settings.ES_DISABLED = True
+        try:
+            batching.queue_index(FakeDjangoMappingType, [1])
+        finally:
+            settings.ES_DISABLED = False
+        eq_(self.dispatched, [])
+
+    def test_middleware(self):
+        middleware = batching.IndexBatchMiddleware()
+        middleware.process_request(None)
+        batching.queue_index(FakeDjangoMappingType, [1])
+        batching.queue_index(FakeDjangoMappingType, [1])
+        eq_(self.dispatched, [])
+
+        eq_(middleware.process_response(None, 'response'), 'response')
+        eq_(self.dispatched, [{FakeDjangoMappingType: {1: 'index'}}])
+
+        # Responses without a request don't blow up.
+        middleware.process_response(None, 'response')
@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from django import db
+from django.core.management import call_command
+from nose.tools import eq_, assert_raises
+from six import StringIO
+
+from elasticutils.bulk import BulkSummary
+from elasticutils.contrib.django import close_connections
+from elasticutils.contrib.django.tests import (
+    FakeDjangoMappingType, FakeModel, reset_model_cache)
+from elasticutils.pipeline import run_pipeline
+from elasticutils.tests.test_bulk import FakeBulkES
+
+
+class MockMappingType(FakeDjangoMappingType):
+    indexed = []
+    refreshed = 0
+    fail_after = None
+    failing_ids = set()
+
+    @classmethod
+    def bulk_index(cls, documents, **kwargs):
+        if cls.fail_after is not None and len(cls.indexed) >= cls.fail_after:
+            raise KeyboardInterrupt
+        cls.indexed.append([doc['id'] for doc in documents])
+        summary = BulkSummary()
+        summary.add([{'_id': doc['id'], 'ok': doc['id'] not in cls.failing_ids}
+                     for doc in documents], sent_bytes=100)
+        return summary
+
+    @classmethod
+    def refresh_index(cls, es=None, index=None):
+        cls.refreshed += 1
+
+
+MAPPING_TYPE = __name__ + '.MockMappingType'
+
+
+class SlowBulkES(FakeBulkES):
+    """FakeBulkES that keeps track of how many requests overlap"""
+    def __init__(self):
+        super(SlowBulkES, self).__init__()
+        self.active = 0
+        self.max_active = 0
+
+    def bulk(self, body, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        try:
+            return super(SlowBulkES, self).bulk(body, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class OverlapMappingType(FakeDjangoMappingType):
+    es = None
+
+    @classmethod
+    def get_es(cls):
+        return cls.es
+
+    @classmethod
+    def get_fingerprint_store(cls):
+        return None
+
+    @classmethod
+    def refresh_index(cls, es=None, index=None):
+        pass
+
+
+class ReindexCommandTest(TestCase):
+    def setUp(self):
+        reset_model_cache()
+        for i in range(1, 8):
+            FakeModel(id=i, name='viking %d' % i)
+        MockMappingType.indexed = []
+        MockMappingType.refreshed = 0
+        MockMappingType.fail_after = None
+        MockMappingType.failing_ids = set()
+        self.tmpdir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def reindex(self, mapping_type=MAPPING_TYPE, **kwargs):
+        stdout = StringIO()
+        kwargs.setdefault('checkpoint', self.checkpoint)
+        call_command('es_reindex', mapping_type, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def test_reindex(self):
+        output = self.reindex(chunk_size=3)
+        eq_(MockMappingType.indexed, [[1, 2, 3], [4, 5, 6], [7]])
+        eq_(MockMappingType.refreshed, 1)
+        assert 'docs/s' in output
+        assert 'ETA' in output
+        assert 'indexed 7 of 7' in output
+        for stage in ('read', 'extract', 'send'):
+            assert stage + ' ' in output
+        # The checkpoint is gone when it's done.
+        eq_(os.path.exists(self.checkpoint), False)
+
+    def test_workers(self):
+        # Every call gets a chunk for each worker.
+        self.reindex(chunk_size=3, workers=2)
+        eq_(MockMappingType.indexed, [[1, 2, 3, 4, 5, 6], [7]])
+
+    def test_workers_overlap(self):
+        es = SlowBulkES()
+        OverlapMappingType.es = es
+        self.reindex(chunk_size=2, workers=3,
+                     mapping_type=__name__ + '.OverlapMappingType')
+        eq_(sorted(len(request) // 2 for request in es.requests),
+            [1, 2, 2, 2])
+        eq_(es.max_active, 3)
+
+    def test_failures_keep_checkpoint(self):
+        MockMappingType.failing_ids = set([5])
+        output = self.reindex(chunk_size=3)
+        eq_(MockMappingType.indexed, [[1, 2, 3], [4, 5, 6], [7]])
+        assert '1 documents failed' in output
+        # The checkpoint is before the chunk with the failure.
+        eq_(json.load(open(self.checkpoint)), {MAPPING_TYPE: 3})
+
+        MockMappingType.indexed = []
+        MockMappingType.failing_ids = set()
+        self.reindex(chunk_size=3)
+        eq_(MockMappingType.indexed, [[4, 5, 6], [7]])
+        eq_(os.path.exists(self.checkpoint), False)
+
+    def test_resume(self):
+        MockMappingType.fail_after = 2
+        try:
+            self.reindex(chunk_size=3)
+        except KeyboardInterrupt:
+            pass
+        eq_(MockMappingType.indexed, [[1, 2, 3], [4, 5, 6]])
+        eq_(os.path.exists(self.checkpoint), True)
+
+        MockMappingType.indexed = []
+        MockMappingType.fail_after = None
+        output = self.reindex(chunk_size=3)
+        eq_(MockMappingType.indexed, [[7]])
+        assert 'resuming after id 6' in output
+
+    def test_restart(self):
+        MockMappingType.fail_after = 1
+        try:
+            self.reindex(chunk_size=3)
+        except KeyboardInterrupt:
+            pass
+
+        MockMappingType.indexed = []
+        MockMappingType.fail_after = None
+        self.reindex(chunk_size=3, restart=True)
+        eq_(MockMappingType.indexed, [[1, 2, 3], [4, 5, 6], [7]])
+
+    def test_processes(self):
+        output = self.reindex(chunk_size=3, processes=2)
+        eq_(MockMappingType.indexed, [[1, 2, 3], [4, 5, 6], [7]])
+        assert 'read+extract' in output
+
+
+class CloseConnectionsTest(TestCase):
+    def test_stage_threads(self):
+        queried = []
+        cleaned = []
+
+        def query(item):
+            db.connections['default'].cursor().execute('SELECT 1')
+            queried.append(threading.current_thread())
+            return item
+
+        def cleanup():
+            # Closing a connection from another thread raises
+            # DatabaseError, which run_pipeline would raise here.
+            close_connections()
+            cleaned.append(threading.current_thread())
+
+        run_pipeline(('read', iter(range(3))),
+                     [('query', query), ('collect', lambda item: item)],
+                     cleanup=cleanup)
+
+        assert threading.current_thread() not in queried
+        assert queried[0] in cleaned
+        eq_(len(cleaned), 2)
+
+    def test_other_thread_connection(self):
+        # This is what passing db.connection.close as cleanup did.
+        with assert_raises(db.DatabaseError):
+            run_pipeline(('read', iter(range(3))),
+                         [('query', lambda item: item),
+                          ('collect', lambda item: item)],
+                         cleanup=db.connections['default'].close)
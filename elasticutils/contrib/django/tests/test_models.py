@@ -1,3 +1,5 @@
+from unittest import TestCase
+
 from nose.tools import eq_
 
 from elasticutils.contrib.django import S, get_es
@@ -78,3 +80,50 @@ class IndexableTest(ESTestCase):
         # Query it to make sure they're there.
         eq_(len(S(FakeDjangoMappingType).query(name__prefix='odin')), 1)
         eq_(len(S(FakeDjangoMappingType).query(name__prefix='erik')), 1)
+
+
+class IterIndexableTest(TestCase):
+    def setUp(self):
+        reset_model_cache()
+        for i in [5, 1, 3, 2, 4]:
+            FakeModel(id=i, name='viking %d' % i)
+
+    def tearDown(self):
+        reset_model_cache()
+
+    def ids(self, chunks):
+        return [[obj.id for obj in chunk] for chunk in chunks]
+
+    def test_keyset(self):
+        eq_(self.ids(FakeDjangoMappingType.iter_indexable(chunk_size=2)),
+            [[1, 2], [3, 4], [5]])
+        eq_(self.ids(FakeDjangoMappingType.iter_indexable(
+            chunk_size=2, start_after=2)), [[3, 4], [5]])
+        eq_(self.ids(FakeDjangoMappingType.iter_indexable(
+            chunk_size=2, start_after=1, last_id=4)), [[2, 3], [4]])
+
+    def test_indexable_queryset(self):
+        class SomeMappingType(FakeDjangoMappingType):
+            @classmethod
+            def get_indexable_queryset(cls):
+                return FakeModel.objects.filter(id__gt=3)
+
+        eq_(self.ids(SomeMappingType.iter_indexable(chunk_size=10)),
+            [[4, 5]])
+        eq_(list(SomeMappingType.get_indexable()), [4, 5])
+
+    def test_get_indexable_override(self):
+        class SomeMappingType(FakeDjangoMappingType):
+            @classmethod
+            def get_indexable(cls):
+                return [1, 2, 4]
+
+        eq_(self.ids(SomeMappingType.iter_indexable(
+            chunk_size=2, start_after=1)), [[2, 4]])
+        eq_(self.ids(SomeMappingType.iter_indexable(
+            chunk_size=2, start_after=1, last_id=3)), [[2]])
+
+    def test_get_indexable_documents(self):
+        eq_([doc['id'] for doc in
+             FakeDjangoMappingType.get_indexable_documents(chunk_size=2)],
+            [1, 2, 3, 4, 5])
@@ -1,7 +1,11 @@
+import threading
+
 from nose.tools import eq_
 
+from elasticutils.bulk import BulkSummary
 from elasticutils.contrib.django import get_es
-from elasticutils.contrib.django.tasks import index_objects, unindex_objects
+from elasticutils.contrib.django.tasks import (
+    _id_ranges, index_objects, index_range, reindex, unindex_objects)
 from elasticutils.contrib.django.tests import (
     FakeDjangoMappingType, FakeModel, reset_model_cache)
 from elasticutils.contrib.django.estestcase import ESTestCase
@@ -62,6 +66,7 @@ class TestTasks(ESTestCase):
                 cls.bulk_index_count += 1
                 cls.index_kwarg = kwargs.get('index')
                 cls.es_kwarg = kwargs.get('es')
+                return BulkSummary()
 
         index_objects(MockMappingType, [1, 2, 3])
         eq_(MockMappingType.bulk_index_count, 1)
@@ -86,3 +91,61 @@ class TestTasks(ESTestCase):
         index_objects(MockMappingType, [1, 2, 3], es='crazy_es', index='crazy_index')
         eq_(MockMappingType.index_kwarg, 'crazy_index')
         eq_(MockMappingType.es_kwarg, 'crazy_es')
+
+    def test_reindex(self):
+        for i in range(1, 6):
+            FakeModel(id=i, name='viking %d' % i)
+
+        # CELERY_ALWAYS_EAGER is on, so this runs the whole chord.
+        report = reindex(FakeDjangoMappingType, chunk_size=2).get()
+        eq_(report['indexed'], 5)
+        eq_(report['total'], 5)
+        eq_(report['tasks'], 3)
+        assert report['docs_per_second'] > 0
+
+        # The final step refreshed the index.
+        eq_(FakeDjangoMappingType.search().count(), 5)
+
+    def test_id_ranges(self):
+        for i in (1, 2, 3, 5, 8):
+            FakeModel(id=i, name='viking %d' % i)
+
+        eq_(list(_id_ranges(FakeDjangoMappingType, 2)),
+            [(None, 2, 2), (2, 5, 2), (5, 8, 1)])
+
+        class SomeMappingType(FakeDjangoMappingType):
+            @classmethod
+            def get_indexable(cls):
+                return [5, 1, 3]
+
+        eq_(list(_id_ranges(SomeMappingType, 2)),
+            [(None, 3, 2), (3, 5, 1)])
+
+    def test_index_range(self):
+        for i in range(1, 6):
+            FakeModel(id=i, name='viking %d' % i)
+
+        eq_(index_range(FakeDjangoMappingType, 1, 4, chunk_size=2), 3)
+        FakeDjangoMappingType.refresh_index()
+        eq_(sorted(int(doc._id) for doc in FakeDjangoMappingType.search()),
+            [2, 3, 4])
+
+    def test_index_objects_extract_documents(self):
+        for i in range(1, 6):
+            FakeModel(id=i, name='viking %d' % i)
+
+        class BatchMappingType(FakeDjangoMappingType):
+            batches = []
+            threads = set()
+
+            @classmethod
+            def extract_documents(cls, objs):
+                cls.batches.append(sorted(obj.id for obj in objs))
+                cls.threads.add(threading.current_thread())
+                return [obj._doc for obj in objs]
+
+        eq_(index_objects(BatchMappingType, [1, 2, 3, 4, 5], chunk_size=2), 5)
+        eq_(BatchMappingType.batches, [[1, 2], [3, 4], [5]])
+        # Reading and extracting happen in this thread so they see its
+        # transaction.
+        eq_(BatchMappingType.threads, set([threading.current_thread()]))
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import threading
+
+import six
+
+
+def _default(obj):
+    # Serializes dates and the like the way elasticsearch-py does.
+    from elasticsearch.serializer import JSONSerializer
+
+    return JSONSerializer().default(obj)
+
+
+def fingerprint(document):
+    """Returns a fingerprint of a document
+
+    :arg document: the document as returned by ``extract_document()``
+
+    :returns: hex digest that's the same for documents with the same
+        contents regardless of key order
+
+    """
+    data = json.dumps(document, sort_keys=True, separators=(',', ':'),
+                      default=_default)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _key(key):
+    return u'/'.join(six.text_type(part) for part in key)
+
+
+class FingerprintStore(object):
+    """Base class for places to keep document fingerprints
+
+    Keys are ``(index, doctype, id)`` tuples.
+
+    :property field: if set, the fingerprint is stored in this field
+        of the document itself rather than in the store
+
+    """
+    field = None
+
+    def get_many(self, es, keys):
+        """Returns a dict of key -> fingerprint for the keys it has"""
+        raise NotImplementedError
+
+    def set_many(self, fingerprints):
+        """Stores a dict of key -> fingerprint"""
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """Forgets the fingerprints for keys"""
+        raise NotImplementedError
+
+    def clear(self, index, doc_type):
+        """Forgets the fingerprints for all documents of a doctype"""
+        raise NotImplementedError
+
+    def close(self):
+        """Closes the store; it can't be used afterwards"""
+        pass
+
+
+class SQLiteFingerprintStore(FingerprintStore):
+    """Keeps fingerprints in a SQLite database
+
+    :arg path: path of the database file; it's created if it doesn't
+        exist
+
+    """
+    # SQLite limits the number of parameters in a query.
+    batch_size = 500
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS fingerprints '
+                '(key TEXT PRIMARY KEY, fingerprint TEXT)')
+            self._conn.commit()
+
+    def get_many(self, es, keys):
+        keys = dict((_key(key), key) for key in keys)
+        names = list(keys)
+        found = {}
+        with self._lock:
+            for i in range(0, len(names), self.batch_size):
+                batch = names[i:i + self.batch_size]
+                rows = self._conn.execute(
+                    'SELECT key, fingerprint FROM fingerprints '
+                    'WHERE key IN ({0})'.format(','.join('?' * len(batch))),
+                    batch)
+                for name, value in rows:
+                    found[keys[name]] = value
+        return found
+
+    def set_many(self, fingerprints):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO fingerprints VALUES (?, ?)',
+                [(_key(key), value) for key, value in fingerprints.items()])
+            self._conn.commit()
+
+    def delete_many(self, keys):
+        with self._lock:
+            self._conn.executemany(
+                'DELETE FROM fingerprints WHERE key = ?',
+                [(_key(key),) for key in keys])
+            self._conn.commit()
+
+    def clear(self, index, doc_type):
+        prefix = _key((index, doc_type, ''))
+        for char in ('\\', '%', '_'):
+            prefix = prefix.replace(char, '\\' + char)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM fingerprints WHERE key LIKE ? ESCAPE '\\'",
+                (prefix + '%',))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DbmFingerprintStore(FingerprintStore):
+    """Keeps fingerprints in a dbm file
+
+    :arg path: path of the dbm file; it's created if it doesn't exist
+
+    """
+    def __init__(self, path):
+        try:
+            import dbm
+        except ImportError:
+            import anydbm as dbm
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = dbm.open(path, 'c')
+
+    def get_many(self, es, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                name = _key(key).encode('utf-8')
+                if name in self._db:
+                    found[key] = self._db[name].decode('ascii')
+        return found
+
+    def set_many(self, fingerprints):
+        with self._lock:
+            for key, value in fingerprints.items():
+                self._db[_key(key).encode('utf-8')] = value.encode('ascii')
+            self._sync()
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                name = _key(key).encode('utf-8')
+                if name in self._db:
+                    del self._db[name]
+            self._sync()
+
+    def clear(self, index, doc_type):
+        prefix = _key((index, doc_type, '')).encode('utf-8')
+        with self._lock:
+            for name in [name for name in self._db.keys()
+                         if name.startswith(prefix)]:
+                del self._db[name]
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _sync(self):
+        # dbm.dumb only writes its index on sync or close, so without
+        # this a process that doesn't exit cleanly loses everything.
+        if hasattr(self._db, 'sync'):
+            self._db.sync()
+
+
+class DocumentFingerprintStore(FingerprintStore):
+    """Keeps fingerprints in a field of the indexed documents
+
+    This doesn't need any local state, but looking fingerprints up
+    costs a multi-get request per chunk and the field ends up in the
+    document's ``_source``.
+
+    :arg field: the name of the field; map it with
+        ``'index': 'no'`` so it isn't searchable
+
+    """
+    def __init__(self, field='_fingerprint'):
+        self.field = field
+
+    def get_many(self, es, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        resp = es.mget(body={'docs': [
+            {'_index': index, '_type': doc_type, '_id': id_,
+             '_source': [self.field]}
+            for index, doc_type, id_ in keys
+        ]})
+        found = {}
+        for key, doc in zip(keys, resp['docs']):
+            value = (doc.get('_source') or {}).get(self.field)
+            if doc.get('found', doc.get('exists')) and value:
+                found[key] = value
+        return found
+
+    def set_many(self, fingerprints):
+        # The fingerprints are written with the documents.
+        pass
+
+    def delete_many(self, keys):
+        # The fingerprints go away with the documents.
+        pass
+
+    def clear(self, index, doc_type):
+        # The fingerprints go away with the documents.
+        pass
@@ -0,0 +1,225 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import six
+from six.moves import queue
+
+
+#: Delay in seconds used before there are enough latency samples to
+#: compute a percentile.
+DEFAULT_HEDGE_DELAY = 0.05
+
+#: Number of latency samples required before the percentile delay is
+#: used.
+MIN_SAMPLES = 20
+
+
+class HedgeStats(object):
+    """Keeps track of search latencies and hedging outcomes.
+
+    :property requests: number of hedged-mode searches executed
+    :property hedged: number of searches that sent a hedge request
+    :property hedge_wins: number of searches where the hedge request
+        returned first
+    :property latencies: the most recent search latencies in seconds
+
+    Use this to tune the hedge delay. For example::
+
+        from elasticutils.hedging import hedge_stats
+
+        print hedge_stats.hedge_rate, hedge_stats.win_rate
+
+    """
+    def __init__(self, max_samples=1000):
+        self._lock = threading.Lock()
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        """Clears all collected statistics."""
+        with self._lock:
+            self.requests = 0
+            self.hedged = 0
+            self.hedge_wins = 0
+            self.latencies = deque(maxlen=self.max_samples)
+
+    def record(self, latency, hedged, hedge_won):
+        """Records the outcome of a single search."""
+        with self._lock:
+            self.requests += 1
+            if hedged:
+                self.hedged += 1
+            if hedge_won:
+                self.hedge_wins += 1
+            self.latencies.append(latency)
+
+    def percentile(self, pct):
+        """Returns the latency at percentile ``pct`` or None
+
+        Returns None if fewer than ``MIN_SAMPLES`` latencies have been
+        recorded.
+
+        """
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        idx = int(round((pct / 100.0) * (len(samples) - 1)))
+        return samples[idx]
+
+    @property
+    def hedge_rate(self):
+        """Fraction of searches that sent a hedge request."""
+        if not self.requests:
+            return 0.0
+        return float(self.hedged) / self.requests
+
+    @property
+    def win_rate(self):
+        """Fraction of hedge requests that returned first."""
+        if not self.hedged:
+            return 0.0
+        return float(self.hedge_wins) / self.hedged
+
+    def __repr__(self):
+        return '<HedgeStats requests={0} hedged={1} hedge_wins={2}>'.format(
+            self.requests, self.hedged, self.hedge_wins)
+
+
+#: Process-wide statistics used by searches that don't specify their
+#: own.
+hedge_stats = HedgeStats()
+
+
+class _Workers(object):
+    """Reusable daemon threads that run search requests
+
+    A thread is only started when no idle one is available, so
+    searches that return before the hedge delay don't cost a new
+    thread each.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._tasks = queue.Queue()
+        self._idle = 0
+
+    def submit(self, fun, *args):
+        with self._lock:
+            # Threads don't survive a fork, so the child starts over.
+            if self._pid != os.getpid():
+                self._reset()
+            if self._idle:
+                self._idle -= 1
+            else:
+                thread = threading.Thread(target=self._work,
+                                          args=(self._tasks,))
+                # Losers are abandoned, so we don't want them to keep
+                # the process alive.
+                thread.daemon = True
+                thread.start()
+            self._tasks.put((fun, args))
+
+    def _work(self, tasks):
+        while True:
+            fun, args = tasks.get()
+            fun(*args)
+            with self._lock:
+                self._idle += 1
+
+
+_workers = _Workers()
+
+
+def _run(results, name, fun, kwargs):
+    try:
+        ret = fun(**kwargs)
+    except Exception:
+        results.put((name, False, sys.exc_info()))
+    else:
+        results.put((name, True, ret))
+
+
+def hedged_search(es, search_kwargs, delay=None, percentile=95,
+                  preference=None, stats=None):
+    """Executes ``es.search`` with a hedge request
+
+    Sends the search. If it hasn't returned after the hedge delay,
+    sends the same search again with a different ``preference`` so
+    that it's likely served by a different shard copy. The first
+    successful response is returned and the other is discarded.
+
+    :arg es: the `Elasticsearch` to use
+    :arg search_kwargs: dict of arguments for ``es.search``
+    :arg delay: seconds to wait before hedging; if None, uses the
+        ``percentile`` of the latencies recorded in ``stats``
+    :arg percentile: the latency percentile to use as the delay
+    :arg preference: the preference for the hedge request; defaults
+        to a random string which makes Elasticsearch pick a shard
+        copy by hash
+    :arg stats: the :py:class:`HedgeStats` to record to; defaults
+        to ``hedge_stats``
+
+    :returns: the search response
+
+    If both requests fail, raises the exception from the first one.
+
+    If ``search_kwargs`` already has a ``preference``, the search is
+    sent once with it and isn't hedged or recorded.
+
+    Latencies are recorded as seen by the caller, so a search won by
+    the hedge is recorded as the delay plus the hedge's latency.
+
+    """
+    if search_kwargs.get('preference') is not None:
+        # Hedging with another preference would break the one the
+        # caller asked for, and hedging with the same one would hit
+        # the same shard copy.
+        return es.search(**search_kwargs)
+
+    if stats is None:
+        stats = hedge_stats
+
+    if delay is None:
+        delay = stats.percentile(percentile)
+        if delay is None:
+            delay = DEFAULT_HEDGE_DELAY
+
+    if preference is None:
+        preference = 'hedge-' + uuid.uuid4().hex
+
+    start = time.time()
+    results = queue.Queue()
+    _workers.submit(_run, results, 'primary', es.search, search_kwargs)
+
+    hedged = False
+    try:
+        outcome = results.get(timeout=delay)
+    except queue.Empty:
+        hedged = True
+        hedge_kwargs = dict(search_kwargs, preference=preference)
+        _workers.submit(_run, results, 'hedge', es.search, hedge_kwargs)
+        outcome = results.get()
+
+    name, ok, value = outcome
+    if not ok and hedged:
+        # The first one back failed, so we wait for the other one.
+        other = results.get()
+        if other[1]:
+            name, ok, value = other
+
+    # This is the latency the caller saw, so a hedge win includes the
+    # delay.
+    stats.record(time.time() - start, hedged, ok and name == 'hedge')
+
+    if not ok:
+        six.reraise(*value)
+    return value
@@ -1,24 +1,79 @@
+import logging
+import re
+import threading
+import weakref
 from functools import wraps
 
-from elasticsearch import Elasticsearch
+
+log = logging.getLogger('elasticutils')
 
 
 _monkeypatched_es = False
 
+# Elasticsearch -> version tuple of the cluster it talks to
+_server_versions = weakref.WeakKeyDictionary()
+_server_versions_lock = threading.Lock()
+
+
+def get_server_version(es):
+    """Returns the version of the cluster an `Elasticsearch` talks to
+
+    The cluster is asked once per `Elasticsearch` and the answer is
+    cached.
+
+    :arg es: the `Elasticsearch`
+
+    :returns: tuple of ints like ``(1, 2, 1)``
+
+    :raises TransportError: if the cluster couldn't be asked; nothing
+        is cached then
+
+    """
+    with _server_versions_lock:
+        version = _server_versions.get(es)
+    if version is not None:
+        return version
+
+    number = es.info()['version']['number']
+    # Versions can have a suffix, like 1.0.0.Beta2.
+    version = tuple(int(part) for part in re.findall(r'\d+', number)[:3])
+    with _server_versions_lock:
+        _server_versions[es] = version
+    return version
+
+
+def _needs_bulk_fix(es):
+    from elasticsearch.exceptions import TransportError
+
+    try:
+        return get_server_version(es) < (1, 0)
+    except (TransportError, KeyError, TypeError) as exc:
+        # Normalizing is harmless on 1.0+, so do it when in doubt.
+        log.debug('Unable to get the Elasticsearch version: {0!r}'.format(
+            exc))
+        return True
+
 
 def monkeypatch_es():
     """Monkey patch for elasticsearch-py 1.0+ to make it work with ES 0.90
 
     1. tweaks elasticsearch.client.bulk to normalize return status codes
 
+    The bulk responses are only normalized for clients that talk to an
+    ES 0.90 cluster. See :py:func:`get_server_version`.
+
     .. Note::
 
        We can nix this whe we drop support for ES 0.90.
 
     """
+    global _monkeypatched_es
+
     if _monkeypatched_es:
         return
 
+    from elasticsearch import Elasticsearch
+
     def normalize_bulk_return(fun):
         """Set's "ok" based on "status" if "status" exists"""
         @wraps(fun)
@@ -32,9 +87,10 @@ def monkeypatch_es():
                 return item
 
             ret = fun(self, *args, **kwargs)
-            if 'items' in ret:
+            if 'items' in ret and _needs_bulk_fix(self):
                 ret['items'] = [fix_item(item) for item in ret['items']]
             return ret
         return _fixed_bulk
 
     Elasticsearch.bulk = normalize_bulk_return(Elasticsearch.bulk)
+    _monkeypatched_es = True
@@ -0,0 +1,268 @@
+import collections
+import logging
+import sys
+import threading
+import time
+
+import six
+from six.moves import queue
+
+
+log = logging.getLogger('elasticutils')
+
+
+_DONE = object()
+
+
+class StageStats(object):
+    """Timings for one pipeline stage
+
+    :property name: the name of the stage
+    :property items: number of items the stage handled
+    :property busy: seconds spent doing work
+    :property waiting: seconds spent waiting for the previous stage to
+        hand over an item or for the next stage to take one
+
+    A stage that waits a lot for its input is faster than the stage
+    before it; one that waits a lot for its output is faster than the
+    stage after it. The stage with the most busy time is the
+    bottleneck.
+
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def __repr__(self):
+        return (
+            '<StageStats {0}: items={1} busy={2:.3f}s waiting={3:.3f}s>'
+            .format(self.name, self.items, self.busy, self.waiting))
+
+
+class _Aborted(Exception):
+    pass
+
+
+def _put(q, item, stats, abort):
+    start = time.time()
+    while True:
+        if abort.is_set():
+            raise _Aborted
+        try:
+            q.put(item, timeout=0.1)
+            break
+        except queue.Full:
+            pass
+    stats.waiting += time.time() - start
+
+
+def _get(q, stats, abort):
+    start = time.time()
+    while True:
+        if abort.is_set():
+            raise _Aborted
+        try:
+            item = q.get(timeout=0.1)
+            break
+        except queue.Empty:
+            pass
+    stats.waiting += time.time() - start
+    return item
+
+
+def run_pipeline(source, stages, queue_size=2, cleanup=None,
+                 source_in_caller=False):
+    """Runs items through stages that work at the same time
+
+    The source and every stage but the last run in their own thread
+    and hand items to the next stage through a queue that holds at
+    most ``queue_size`` items. The last stage runs in the calling
+    thread. Items go through the stages in order.
+
+    :arg source: ``(name, iterable)``; the iterable is iterated in its
+        own thread, so reading from a database or a file overlaps with
+        the other stages
+    :arg stages: list of ``(name, function)`` tuples; each function
+        takes an item and returns the item for the next stage
+    :arg queue_size: the maximum number of items waiting between two
+        stages; this bounds memory use when a stage is slower than the
+        one before it
+    :arg cleanup: function called with no arguments at the end of
+        each thread the pipeline starts, in that thread, for example
+        to close the database connections the thread opened
+    :arg source_in_caller: if True, the source is iterated in the
+        calling thread and every stage runs in its own thread; use
+        this when reading has to see the calling thread's database
+        transaction
+
+    :returns: list of :py:class:`StageStats`, one for the source and
+        one for each stage
+
+    If a stage or ``cleanup`` raises an exception, the other stages
+    stop and the exception is raised in the calling thread.
+
+    For example::
+
+        stats = run_pipeline(
+            ('read', read_chunks()),
+            [('extract', extract), ('send', send)])
+
+    """
+    source_name, iterable = source
+    stats = [StageStats(source_name)] + [StageStats(name)
+                                          for name, func in stages]
+    queues = [queue.Queue(maxsize=queue_size) for func in stages]
+    abort = threading.Event()
+    failures = []
+
+    def run_source(out_q, stage_stats):
+        try:
+            items = iter(iterable)
+            while True:
+                start = time.time()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    stage_stats.busy += time.time() - start
+                stage_stats.items += 1
+                _put(out_q, item, stage_stats, abort)
+            _put(out_q, _DONE, stage_stats, abort)
+        except _Aborted:
+            pass
+        except Exception:
+            failures.append(sys.exc_info())
+            abort.set()
+
+    def run_stage(func, in_q, out_q, stage_stats):
+        try:
+            while True:
+                item = _get(in_q, stage_stats, abort)
+                if item is _DONE:
+                    if out_q is not None:
+                        _put(out_q, _DONE, stage_stats, abort)
+                    return
+                start = time.time()
+                result = func(item)
+                stage_stats.busy += time.time() - start
+                stage_stats.items += 1
+                if out_q is not None:
+                    _put(out_q, result, stage_stats, abort)
+        except _Aborted:
+            pass
+        except Exception:
+            failures.append(sys.exc_info())
+            abort.set()
+
+    def run_thread(target, *args):
+        try:
+            target(*args)
+        finally:
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception:
+                    failures.append(sys.exc_info())
+                    abort.set()
+
+    jobs = [(run_source, (queues[0], stats[0]))]
+    for i, (name, func) in enumerate(stages):
+        out_q = queues[i + 1] if i + 1 < len(stages) else None
+        jobs.append((run_stage, (func, queues[i], out_q, stats[i + 1])))
+
+    caller_job = jobs.pop(0) if source_in_caller else jobs.pop()
+    threads = [threading.Thread(target=run_thread, args=(target,) + args)
+               for target, args in jobs]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        target, args = caller_job
+        target(*args)
+    except BaseException:
+        abort.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if failures:
+        six.reraise(*failures[0])
+
+    log.debug('Pipeline: {0}'.format(
+        ', '.join('{0} busy {1:.3f}s waiting {2:.3f}s'.format(
+            s.name, s.busy, s.waiting) for s in stats)))
+    return stats
+
+
+def process_map(func, iterable, processes, max_pending=None):
+    """Yields ``func(item)`` for each item, computed in child processes
+
+    This is for CPU-bound work that the GIL keeps on one core, like
+    extracting documents that need a lot of text cleanup. Items are
+    sent to a ``concurrent.futures.ProcessPoolExecutor`` with
+    ``processes`` workers and the results come back in the same order
+    as the items.
+
+    :arg func: function that takes an item; it must be picklable, so
+        it has to be a module-level function (or a
+        ``functools.partial`` of one)
+    :arg iterable: iterable of picklable items, usually chunks
+    :arg processes: the number of child processes
+    :arg max_pending: the maximum number of items sent to the
+        processes whose results haven't been yielded yet; defaults to
+        twice ``processes``
+
+    :returns: generator of results
+
+    .. Note::
+
+       The workers are started when this is called, before the
+       generator is iterated and before anything is read from
+       ``iterable``. So it's safe to iterate the generator in another
+       thread, and the workers don't inherit database connections
+       ``iterable`` opens. They're forked from the calling process on
+       platforms that support it, so close connections opened before
+       calling this.
+
+    """
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        raise RuntimeError(
+            'process_map needs concurrent.futures. On Python 2, install '
+            'the futures package.')
+
+    if max_pending is None:
+        max_pending = processes * 2
+
+    executor = ProcessPoolExecutor(max_workers=processes)
+    # The first task forks all the workers. That has to happen here in
+    # the calling thread: the generator is often iterated by a
+    # run_pipeline thread, and forking while other threads run can
+    # deadlock the children.
+    try:
+        executor.submit(int).result()
+    except Exception:
+        executor.shutdown(wait=True)
+        raise
+    return _process_results(executor, func, iterable, max_pending)
+
+
+def _process_results(executor, func, iterable, max_pending):
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,320 @@
+import json
+import threading
+import time
+from unittest import TestCase
+
+from elasticsearch.exceptions import ConnectionError, TransportError
+from elasticsearch.serializer import JSONSerializer
+from nose.tools import eq_
+
+from elasticutils import Indexable
+from elasticutils.bulk import (
+    BulkIndexer, _Flush, bulk_send, chunk_actions, get_bulk_indexer,
+    set_bulk_indexer)
+
+
+class FakeTransport(object):
+    serializer = JSONSerializer()
+
+
+class FakeAliasIndices(object):
+    def get_alias(self, name=None, ignore=None):
+        return {}
+
+
+class FakeBulkES(object):
+    """Fake Elasticsearch that answers bulk requests
+
+    :arg statuses: dict of id -> list of statuses to return for that
+        id on successive requests; defaults to 201
+
+    """
+    transport = FakeTransport()
+    indices = FakeAliasIndices()
+
+    def __init__(self, statuses=None, request_errors=None):
+        self.statuses = statuses or {}
+        self.request_errors = request_errors or []
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def bulk(self, body, index=None, doc_type=None):
+        lines = [json.loads(line) for line in body.splitlines()]
+        with self.lock:
+            self.requests.append(lines)
+            if self.request_errors:
+                raise self.request_errors.pop(0)
+
+        items = []
+        for line in lines:
+            if len(line) != 1 or list(line)[0] not in (
+                    'index', 'create', 'update', 'delete'):
+                # Source line
+                continue
+            op_type, meta = list(line.items())[0]
+            with self.lock:
+                statuses = self.statuses.get(meta['_id'], [])
+                status = statuses.pop(0) if statuses else 201
+            item = {'_id': meta['_id'], 'status': status}
+            if status == 429:
+                item['error'] = 'EsRejectedExecutionException[rejected]'
+            items.append({op_type: item})
+        return {'took': 1, 'items': items}
+
+
+def index_actions(count):
+    return [({'index': {'_id': i}}, {'id': i, 'text': 'x' * 10})
+            for i in range(count)]
+
+
+class ChunkActionsTest(TestCase):
+    def test_chunk_by_count(self):
+        chunks = list(chunk_actions(index_actions(5), JSONSerializer(),
+                                    chunk_size=2))
+        eq_([len(chunk) for chunk in chunks], [2, 2, 1])
+
+    def test_chunk_by_bytes(self):
+        actions = index_actions(4)
+        size = len(list(chunk_actions(actions[:1], JSONSerializer()))[0][0][1])
+
+        chunks = list(chunk_actions(actions, JSONSerializer(),
+                                    max_chunk_bytes=size * 2))
+        eq_([len(chunk) for chunk in chunks], [2, 2])
+
+        # Actions bigger than max_chunk_bytes get their own chunk.
+        chunks = list(chunk_actions(actions, JSONSerializer(),
+                                    max_chunk_bytes=1))
+        eq_([len(chunk) for chunk in chunks], [1, 1, 1, 1])
+
+    def test_no_source(self):
+        chunks = list(chunk_actions([({'delete': {'_id': 1}}, None)],
+                                    JSONSerializer()))
+        eq_(chunks[0][0][1], '{"delete": {"_id": 1}}\n')
+
+
+class BulkSendTest(TestCase):
+    def test_summary(self):
+        es = FakeBulkES(statuses={2: [400]})
+        summary = bulk_send(es, index_actions(5), chunk_size=2)
+        eq_(len(es.requests), 3)
+        eq_(len(summary), 5)
+        eq_(summary.succeeded, 4)
+        eq_([item['_id'] for item in summary.errors], [2])
+        eq_(summary.sent_bytes,
+            sum(len(json.dumps(line)) + 1
+                for request in es.requests for line in request))
+
+    def test_retry_rejected(self):
+        es = FakeBulkES(statuses={1: [429, 429], 3: [429]})
+        summary = bulk_send(es, index_actions(4), initial_backoff=0)
+        eq_(summary.succeeded, 4)
+        eq_(summary.retries, 3)
+        # One request with everything, one with the two rejected and
+        # one with the one rejected twice.
+        eq_([len(request) // 2 for request in es.requests], [4, 2, 1])
+
+    def test_retries_give_up(self):
+        es = FakeBulkES(statuses={1: [429, 429, 429]})
+        summary = bulk_send(es, index_actions(2), max_retries=2,
+                            initial_backoff=0)
+        eq_([(item['_id'], item['status']) for item in summary.errors],
+            [(1, 429)])
+
+    def test_retry_request_errors(self):
+        es = FakeBulkES(request_errors=[
+            ConnectionError('N/A', 'boom', None),
+            TransportError(429, 'busy', None)])
+        summary = bulk_send(es, index_actions(2), initial_backoff=0)
+        eq_(summary.succeeded, 2)
+        eq_(summary.retries, 4)
+
+    def test_request_error_fails_chunk(self):
+        es = FakeBulkES(request_errors=[TransportError(400, 'bad', None)])
+        summary = bulk_send(es, index_actions(3), chunk_size=2)
+        eq_([item['_id'] for item in summary.errors], [0, 1])
+        eq_(summary.errors[0]['status'], 400)
+        eq_(summary.succeeded, 1)
+
+    def test_workers(self):
+        es = FakeBulkES(statuses={7: [400]})
+        summary = bulk_send(es, index_actions(100), chunk_size=10,
+                            workers=4)
+        eq_(len(es.requests), 10)
+        eq_(summary.succeeded, 99)
+        eq_(sorted(item['_id'] for item in summary.items), list(range(100)))
+
+    def test_ok_statuses(self):
+        es = FakeBulkES(statuses={1: [404]})
+        actions = [({'delete': {'_id': i}}, None) for i in range(2)]
+        eq_(len(bulk_send(es, actions).errors), 1)
+
+        es = FakeBulkES(statuses={1: [404]})
+        eq_(len(bulk_send(es, actions, ok_statuses=(404,)).errors), 0)
+
+    def test_version_conflicts(self):
+        es = FakeBulkES(statuses={1: [409], 2: [409]})
+        actions = [({'index': {'_id': 0, '_version': 5,
+                               '_version_type': 'external'}}, {}),
+                   ({'index': {'_id': 1, '_version': 5,
+                               '_version_type': 'external'}}, {}),
+                   ({'create': {'_id': 2}}, {})]
+        summary = bulk_send(es, actions)
+        eq_(summary.succeeded, 1)
+        eq_(summary.conflicts, 1)
+        # Only conflicts with external versions are fine.
+        eq_([item['_id'] for item in summary.errors], [2])
+
+
+class BulkIndexerTest(TestCase):
+    def test_max_docs(self):
+        es = FakeBulkES()
+        with BulkIndexer(es, max_docs=3, interval=60) as indexer:
+            for i in range(7):
+                indexer.index('test', 'doc', {'id': i}, id_=i)
+        eq_([len(request) // 2 for request in es.requests], [3, 3, 1])
+        eq_(indexer.sent, 7)
+
+    def test_max_bytes(self):
+        es = FakeBulkES()
+        with BulkIndexer(es, max_bytes=150, interval=60) as indexer:
+            for i in range(4):
+                indexer.index('test', 'doc', {'text': 'x' * 50}, id_=i)
+        eq_([len(request) // 2 for request in es.requests], [1, 1, 1, 1])
+
+    def test_interval(self):
+        es = FakeBulkES()
+        indexer = BulkIndexer(es, interval=0.01)
+        indexer.index('test', 'doc', {'id': 1}, id_=1)
+        for i in range(100):
+            if es.requests:
+                break
+            time.sleep(0.01)
+        eq_(len(es.requests), 1)
+        indexer.close()
+
+    def test_interval_trickle(self):
+        es = FakeBulkES()
+        block = threading.Event()
+        bulk = es.bulk
+
+        def slow_bulk(*args, **kwargs):
+            block.wait()
+            return bulk(*args, **kwargs)
+        es.bulk = slow_bulk
+
+        indexer = BulkIndexer(es, interval=0)
+        for i in range(5):
+            indexer.index('test', 'doc', {'id': i}, id_=i)
+        block.set()
+        indexer.close()
+        # Items were waiting in the queue, but each one was past the
+        # deadline as soon as it was taken.
+        eq_([len(request) // 2 for request in es.requests], [1] * 5)
+
+    def test_forked(self):
+        es = FakeBulkES()
+        indexer = BulkIndexer(es, interval=60)
+        indexer.index('test', 'doc', {'id': 1}, id_=1)
+        parent_queue = indexer._queue
+
+        # Pretend this is a child process that inherited an indexer
+        # whose sender thread didn't survive the fork.
+        indexer._pid = -1
+        indexer.index('test', 'doc', {'id': 2}, id_=2)
+        indexer.flush()
+        assert indexer._queue is not parent_queue
+        eq_([line for request in es.requests for line in request
+             if 'id' in line], [{'id': 2}])
+        indexer.close()
+
+        # Stop the "parent's" sender thread.
+        marker = _Flush(stop=True)
+        parent_queue.put(marker)
+        marker.done.wait()
+
+    def test_flush(self):
+        es = FakeBulkES()
+        indexer = BulkIndexer(es, interval=60)
+        indexer.index('test', 'doc', {'id': 1}, id_=1, routing='a')
+        indexer.update('test', 'doc', 2, {'count': 1}, upsert={'count': 0})
+        indexer.delete('test', 'doc', 3)
+        indexer.flush()
+        eq_(es.requests, [[
+            {'index': {'_index': 'test', '_type': 'doc', '_id': 1,
+                       '_routing': 'a'}},
+            {'id': 1},
+            {'update': {'_index': 'test', '_type': 'doc', '_id': 2}},
+            {'doc': {'count': 1}, 'upsert': {'count': 0}},
+            {'delete': {'_index': 'test', '_type': 'doc', '_id': 3}},
+        ]])
+
+        # Flushing with nothing queued doesn't send anything.
+        indexer.flush()
+        eq_(len(es.requests), 1)
+        indexer.close()
+
+    def test_backpressure(self):
+        es = FakeBulkES()
+        block = threading.Event()
+        bulk = es.bulk
+
+        def slow_bulk(*args, **kwargs):
+            block.wait()
+            return bulk(*args, **kwargs)
+        es.bulk = slow_bulk
+
+        indexer = BulkIndexer(es, max_docs=1, max_queue=2, interval=60)
+        added = []
+
+        def producer():
+            for i in range(5):
+                indexer.index('test', 'doc', {'id': i}, id_=i)
+                added.append(i)
+        thread = threading.Thread(target=producer)
+        thread.start()
+        time.sleep(0.05)
+        # One in flight, two queued and the producer is blocked.
+        eq_(len(added), 3)
+
+        block.set()
+        thread.join()
+        indexer.close()
+        eq_(indexer.sent, 5)
+
+    def test_errors(self):
+        failed = []
+        es = FakeBulkES(statuses={1: [400], 2: [404]})
+        with BulkIndexer(es, on_error=failed.extend) as indexer:
+            indexer.index('test', 'doc', {'id': 1}, id_=1)
+            # Deleting something that's gone already is fine.
+            indexer.delete('test', 'doc', 2)
+        eq_([(item['_id'], item['status']) for item in failed], [(1, 400)])
+        eq_((indexer.sent, indexer.failed), (1, 1))
+
+    def test_indexable(self):
+        class FakeIndexable(Indexable):
+            @classmethod
+            def get_index(cls):
+                return 'test'
+
+            @classmethod
+            def get_mapping_type_name(cls):
+                return 'doc'
+
+        es = FakeBulkES()
+        indexer = BulkIndexer(es, interval=60)
+        set_bulk_indexer(indexer)
+        try:
+            eq_(get_bulk_indexer(), indexer)
+            FakeIndexable.index({'id': 1}, id_=1, overwrite_existing=False)
+            FakeIndexable.unindex(2)
+            eq_(es.requests, [])
+            indexer.flush()
+            eq_(es.requests, [[
+                {'create': {'_index': 'test', '_type': 'doc', '_id': 1}},
+                {'id': 1},
+                {'delete': {'_index': 'test', '_type': 'doc', '_id': 2}},
+            ]])
+        finally:
+            set_bulk_indexer(None)
+        eq_(get_bulk_indexer(), None)
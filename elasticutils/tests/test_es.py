@@ -1,8 +1,16 @@
+import gzip
+import io
+import json
+import socket
+import threading
 from unittest import TestCase
 
 from nose.tools import eq_
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from urllib3 import HTTPSConnectionPool
 
 from elasticutils import get_es, _cached_elasticsearch
+from elasticutils.connection import HttpConnection, gzip_compress
 
 
 class ESTest(TestCase):
@@ -62,3 +70,85 @@ class ESTest(TestCase):
         es3 = get_es(max_retries=4, revival_delay=10)
         eq_(len(_cached_elasticsearch), 2)
         assert id(es) != id(es3)
+
+    def test_get_es_tuning_settings(self):
+        """Tuning settings use HttpConnection and affect caching."""
+        es = get_es()
+        assert not isinstance(
+            es.transport.get_connection(), HttpConnection)
+
+        es2 = get_es(http_compress=True, maxsize=20, pool_block=True)
+        eq_(len(_cached_elasticsearch), 2)
+        conn = es2.transport.get_connection()
+        assert isinstance(conn, HttpConnection)
+        eq_(conn.http_compress, True)
+        eq_(conn.pool.block, True)
+        eq_(conn.pool.pool.maxsize, 20)
+
+        es3 = get_es(maxsize=20, http_compress=True, pool_block=True)
+        assert id(es2) == id(es3)
+
+    def test_tuning_keeps_pool(self):
+        """Tuning doesn't replace the pool Urllib3HttpConnection built."""
+        conn = HttpConnection(use_ssl=True, maxsize=5, pool_block=True,
+                              keep_alive=True, http_compress=True)
+        assert isinstance(conn.pool._pool, HTTPSConnectionPool)
+        eq_(conn.pool.block, True)
+        eq_(conn.pool.pool.maxsize, 5)
+        assert ((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in
+                conn.pool.conn_kw['socket_options'])
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['content-length']))
+        if self.headers.get('content-encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        data = json.dumps({'echo': json.loads(body.decode('utf-8')),
+                           'encoding': self.headers.get('content-encoding')})
+        data = data.encode('utf-8')
+        self.send_response(200)
+        if 'gzip' in self.headers.get('accept-encoding', ''):
+            data = gzip_compress(data)
+            self.send_header('content-encoding', 'gzip')
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpConnectionTest(TestCase):
+    def setUp(self):
+        super(HttpConnectionTest, self).setUp()
+        self.server = HTTPServer(('127.0.0.1', 0), GzipHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(HttpConnectionTest, self).tearDown()
+
+    def request(self, **kwargs):
+        conn = HttpConnection(host='127.0.0.1',
+                              port=self.server.server_address[1], **kwargs)
+        status, headers, data = conn.perform_request(
+            'POST', '/_search', body=b'{"query": {}}')
+        eq_(status, 200)
+        return json.loads(data)
+
+    def test_uncompressed(self):
+        eq_(self.request(), {'echo': {'query': {}}, 'encoding': None})
+
+    def test_compressed(self):
+        eq_(self.request(http_compress=True, keep_alive=True),
+            {'echo': {'query': {}}, 'encoding': 'gzip'})
+
+    def test_gzip_compress(self):
+        data = b'{"query": {}}' * 10
+        eq_(gzip.GzipFile(fileobj=io.BytesIO(gzip_compress(data))).read(),
+            data)
@@ -0,0 +1,224 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import Indexable
+from elasticutils.fingerprint import (
+    DbmFingerprintStore, DocumentFingerprintStore, SQLiteFingerprintStore,
+    fingerprint)
+from elasticutils.tests.test_bulk import FakeBulkES
+from elasticutils.tests.test_types import FakeDeleteES
+
+
+class FingerprintTest(TestCase):
+    def test_key_order(self):
+        eq_(fingerprint({'a': 1, 'b': [1, 2]}),
+            fingerprint({'b': [1, 2], 'a': 1}))
+
+    def test_changes(self):
+        assert fingerprint({'a': 1}) != fingerprint({'a': 2})
+
+    def test_dates(self):
+        eq_(fingerprint({'created': datetime(2014, 1, 1)}),
+            fingerprint({'created': datetime(2014, 1, 1)}))
+
+
+class StoreTestMixin(object):
+    def test_store(self):
+        store = self.get_store()
+        key1 = ('index', 'doc', 1)
+        key2 = ('index', 'doc', u'2')
+        eq_(store.get_many(None, [key1, key2]), {})
+
+        store.set_many({key1: 'abc', key2: 'def'})
+        eq_(store.get_many(None, [key1, key2, ('index', 'doc', 3)]),
+            {key1: 'abc', key2: 'def'})
+
+        store.set_many({key1: 'xyz'})
+        store.delete_many([key2])
+        eq_(store.get_many(None, [key1, key2]), {key1: 'xyz'})
+
+    def test_clear(self):
+        store = self.get_store()
+        keys = [('index', 'my_doc', 1), ('index', 'my_doc', 2),
+                ('index', 'other', 1), ('index', 'my_doc_2', 1),
+                ('index', 'myxdoc', 1)]
+        store.set_many(dict((key, 'abc') for key in keys))
+
+        store.clear('index', 'my_doc')
+        eq_(sorted(store.get_many(None, keys)), sorted(keys[2:]))
+
+
+class SQLiteFingerprintStoreTest(StoreTestMixin, TestCase):
+    def get_store(self):
+        return SQLiteFingerprintStore(':memory:')
+
+
+class SyncCountingDb(dict):
+    syncs = 0
+
+    def sync(self):
+        self.syncs += 1
+
+
+class DbmFingerprintStoreTest(StoreTestMixin, TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_store(self):
+        return DbmFingerprintStore(os.path.join(self.tmpdir, 'fingerprints'))
+
+    def test_reopen(self):
+        key = ('index', 'doc', 1)
+        store = self.get_store()
+        store.set_many({key: 'abc'})
+        store.close()
+        eq_(self.get_store().get_many(None, [key]), {key: 'abc'})
+
+    def test_sync(self):
+        store = self.get_store()
+        store.close()
+        store._db = SyncCountingDb()
+        key = ('index', 'doc', 1)
+        store.set_many({key: 'abc'})
+        store.delete_many([key])
+        store.clear('index', 'doc')
+        eq_(store._db.syncs, 3)
+
+
+class FakeMgetES(FakeBulkES):
+    def __init__(self, sources):
+        super(FakeMgetES, self).__init__()
+        self.sources = sources
+
+    def mget(self, body):
+        docs = []
+        for doc in body['docs']:
+            source = self.sources.get(doc['_id'])
+            docs.append({'_id': doc['_id'], 'found': source is not None,
+                         '_source': source})
+        return {'docs': docs}
+
+
+class DocumentFingerprintStoreTest(TestCase):
+    def test_get_many(self):
+        es = FakeMgetES({1: {'_fingerprint': 'abc'}, 2: {}})
+        store = DocumentFingerprintStore()
+        keys = [('index', 'doc', 1), ('index', 'doc', 2),
+                ('index', 'doc', 3)]
+        eq_(store.get_many(es, keys), {('index', 'doc', 1): 'abc'})
+
+
+store = SQLiteFingerprintStore(':memory:')
+
+
+class FingerprintedIndexable(Indexable):
+    @classmethod
+    def get_index(cls):
+        return 'test'
+
+    @classmethod
+    def get_mapping_type_name(cls):
+        return 'doc'
+
+    @classmethod
+    def get_fingerprint_store(cls):
+        return store
+
+
+class BulkIndexSkipTest(TestCase):
+    def setUp(self):
+        store.delete_many([('test', 'doc', i) for i in range(10)])
+
+    def sent_ids(self, es):
+        return [line['index']['_id'] for request in es.requests
+                for line in request if 'index' in line]
+
+    def test_skip_unchanged(self):
+        documents = [{'id': i, 'title': 'Post %d' % i} for i in range(4)]
+
+        es = FakeBulkES()
+        summary = FingerprintedIndexable.bulk_index(documents, es=es)
+        eq_((summary.succeeded, summary.skipped), (4, 0))
+
+        documents[1]['title'] = 'Edited'
+        es = FakeBulkES()
+        summary = FingerprintedIndexable.bulk_index(documents, es=es)
+        eq_(self.sent_ids(es), [1])
+        eq_((summary.succeeded, summary.skipped), (1, 3))
+        eq_(summary.skip_ratio, 0.75)
+
+        # skip_unchanged=False sends everything.
+        es = FakeBulkES()
+        FingerprintedIndexable.bulk_index(
+            documents, es=es, skip_unchanged=False)
+        eq_(self.sent_ids(es), [0, 1, 2, 3])
+
+    def test_failed_documents_are_retried(self):
+        documents = [{'id': i} for i in range(2)]
+
+        es = FakeBulkES(statuses={1: [400]})
+        FingerprintedIndexable.bulk_index(documents, es=es)
+
+        es = FakeBulkES()
+        summary = FingerprintedIndexable.bulk_index(documents, es=es)
+        eq_(self.sent_ids(es), [1])
+        eq_(summary.skipped, 1)
+
+    def test_version_conflicts_are_skipped(self):
+        class VersionedIndexable(FingerprintedIndexable):
+            @classmethod
+            def get_version(cls, document):
+                return document['version']
+
+        documents = [{'id': i, 'version': 1} for i in range(2)]
+        es = FakeBulkES(statuses={1: [409]})
+        summary = VersionedIndexable.bulk_index(documents, es=es)
+        eq_(summary.conflicts, 1)
+
+        # The index has the same or a newer version of 1, so it isn't
+        # sent again until it changes.
+        es = FakeBulkES()
+        summary = VersionedIndexable.bulk_index(documents, es=es)
+        eq_(self.sent_ids(es), [])
+        eq_(summary.skipped, 2)
+
+    def test_unindex_forgets(self):
+        documents = [{'id': i} for i in range(3)]
+        FingerprintedIndexable.bulk_index(documents, es=FakeBulkES())
+        FingerprintedIndexable.bulk_unindex([0, 1], es=FakeBulkES())
+
+        es = FakeBulkES()
+        FingerprintedIndexable.bulk_index(documents, es=es)
+        eq_(self.sent_ids(es), [0, 1])
+
+    def test_unindex_by_query_forgets(self):
+        documents = [{'id': i} for i in range(3)]
+        FingerprintedIndexable.bulk_index(documents, es=FakeBulkES())
+
+        FingerprintedIndexable.unindex_by_query(
+            {'match_all': {}}, es=FakeDeleteES())
+
+        es = FakeBulkES()
+        FingerprintedIndexable.bulk_index(documents, es=es)
+        eq_(self.sent_ids(es), [0, 1, 2])
+
+    def test_document_store(self):
+        class DocumentIndexable(FingerprintedIndexable):
+            @classmethod
+            def get_fingerprint_store(cls):
+                return DocumentFingerprintStore()
+
+        documents = [{'id': 1}, {'id': 2}]
+        es = FakeMgetES({1: {'_fingerprint': fingerprint({'id': 1})}})
+        summary = DocumentIndexable.bulk_index(documents, es=es)
+        eq_(summary.skipped, 1)
+        eq_(es.requests, [[{'index': {'_id': 2}},
+                           {'id': 2, '_fingerprint': fingerprint({'id': 2})}]])
@@ -0,0 +1,112 @@
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_
+
+from elasticutils import S
+from elasticutils.hedging import HedgeStats, MIN_SAMPLES, hedged_search
+
+
+class FakeES(object):
+    """Fake Elasticsearch whose search latency depends on preference"""
+    def __init__(self, slow=0.0, fast=0.0, fail_primary=False):
+        self.slow = slow
+        self.fast = fast
+        self.fail_primary = fail_primary
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        if 'preference' in kwargs:
+            time.sleep(self.fast)
+            return {'took': 1, 'from': 'hedge'}
+        time.sleep(self.slow)
+        if self.fail_primary:
+            raise ValueError('primary failed')
+        return {'took': 1, 'from': 'primary'}
+
+
+class HedgedSearchTest(TestCase):
+    def test_no_hedge_when_fast(self):
+        es = FakeES()
+        stats = HedgeStats()
+        ret = hedged_search(es, {'body': {}}, delay=1.0, stats=stats)
+        eq_(ret['from'], 'primary')
+        eq_(len(es.calls), 1)
+        eq_(stats.requests, 1)
+        eq_(stats.hedged, 0)
+
+    def test_hedge_wins(self):
+        es = FakeES(slow=0.5)
+        stats = HedgeStats()
+        ret = hedged_search(es, {'body': {}}, delay=0.01,
+                            preference='_local', stats=stats)
+        eq_(ret['from'], 'hedge')
+        eq_(es.calls[1]['preference'], '_local')
+        eq_(stats.hedged, 1)
+        eq_(stats.hedge_wins, 1)
+        eq_(stats.win_rate, 1.0)
+
+    def test_hedge_win_latency_includes_delay(self):
+        es = FakeES(slow=0.5, fast=0.05)
+        stats = HedgeStats()
+        hedged_search(es, {'body': {}}, delay=0.1, stats=stats)
+        eq_(stats.hedge_wins, 1)
+        assert stats.latencies[0] >= 0.15, stats.latencies[0]
+
+    def test_no_hedge_with_preference(self):
+        es = FakeES(slow=0.1)
+        stats = HedgeStats()
+        ret = hedged_search(es, {'body': {}, 'preference': '_primary'},
+                            delay=0.01, stats=stats)
+        eq_(ret['from'], 'hedge')
+        eq_(es.calls, [{'body': {}, 'preference': '_primary'}])
+        eq_(stats.requests, 0)
+
+    def test_threads_are_reused(self):
+        es = FakeES()
+        hedged_search(es, {'body': {}}, delay=1.0, stats=HedgeStats())
+        time.sleep(0.05)
+        count = threading.active_count()
+        for i in range(5):
+            hedged_search(es, {'body': {}}, delay=1.0, stats=HedgeStats())
+            time.sleep(0.05)
+        eq_(threading.active_count(), count)
+
+    def test_primary_wins_after_hedge(self):
+        es = FakeES(slow=0.05, fast=0.5)
+        stats = HedgeStats()
+        ret = hedged_search(es, {'body': {}}, delay=0.01, stats=stats)
+        eq_(ret['from'], 'primary')
+        eq_(stats.hedged, 1)
+        eq_(stats.hedge_wins, 0)
+
+    def test_failed_primary_falls_back_to_hedge(self):
+        es = FakeES(slow=0.05, fast=0.1, fail_primary=True)
+        ret = hedged_search(es, {'body': {}}, delay=0.01, stats=HedgeStats())
+        eq_(ret['from'], 'hedge')
+
+    def test_percentile(self):
+        stats = HedgeStats()
+        eq_(stats.percentile(95), None)
+        for i in range(MIN_SAMPLES):
+            stats.record(float(i), False, False)
+        eq_(stats.percentile(0), 0.0)
+        eq_(stats.percentile(100), float(MIN_SAMPLES - 1))
+
+
+class HedgeSTest(TestCase):
+    def test_hedge_doesnt_change_body(self):
+        s = S().query(foo='bar')
+        eq_(s.hedge(delay=0.1).build_search(), s.build_search())
+
+    def test_hedge_options(self):
+        s = S().hedge(delay=0.1, preference='_local')
+        s.build_search()
+        eq_(s.hedge_options['delay'], 0.1)
+        eq_(s.hedge_options['preference'], '_local')
+
+        s = s.hedge(False)
+        s.build_search()
+        eq_(s.hedge_options, None)
@@ -1,7 +1,9 @@
-from nose.tools import eq_
+from unittest import TestCase
 
-from elasticutils import MLT
-from elasticutils.tests import ESTestCase
+from nose.tools import eq_, assert_raises
+
+from elasticutils import MLT, BadSearch, BatchMLT, S
+from elasticutils.tests import ESTestCase, require_version
 
 
 class MoreLikeThisTest(ESTestCase):
@@ -79,3 +81,89 @@ class MoreLikeThisTest(ESTestCase):
         mlt = MLT(1, self.get_s().filter(tag='gross'), ['foo'],
                   min_term_freq=1, min_doc_freq=1)
         eq_(len(mlt), 0)
+
+    @require_version('1.3')
+    def test_batch_mlt(self):
+        mlt = BatchMLT([1, 6], self.get_s(), ['foo'],
+                       min_term_freq=1, min_doc_freq=1)
+        eq_(len(mlt[1]), 4)
+        eq_(len(mlt[6]), 1)
+
+        mlt = BatchMLT([1, 6], self.get_s().filter(tag='awesome'), ['foo'],
+                       min_term_freq=1, min_doc_freq=1)
+        eq_([(id_, len(results)) for id_, results in mlt.items()],
+            [(1, 1), (6, 0)])
+
+    @require_version('1.3')
+    def test_s_more_like_this(self):
+        s = self.get_s().more_like_this(
+            1, fields=['foo'], min_term_freq=1, min_doc_freq=1)
+        eq_(len(s), 4)
+        eq_(len(s.filter(tag='boring')), 2)
+
+    @require_version('1.5')
+    def test_s_more_like_this_artificial_doc(self):
+        eq_(len(self.get_s().more_like_this(
+            {'foo': 'notbar'}, fields=['foo'], min_term_freq=1,
+            min_doc_freq=1)), 2)
+
+
+class FakeMsearchES(object):
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def msearch(self, body):
+        self.requests.append(body)
+        return {'responses': self.responses}
+
+
+def fake_response(*ids):
+    return {'took': 1, 'hits': {'total': len(ids), 'hits': [
+        {'_id': str(id_), '_type': 'doc', '_source': {'id': id_}}
+        for id_ in ids]}}
+
+
+class BatchMLTTest(TestCase):
+    def test_bad_mlt(self):
+        self.assertRaises(ValueError, lambda: BatchMLT([1]))
+        self.assertRaises(ValueError, lambda: BatchMLT([1], index='foo'))
+
+    def test_one_request(self):
+        es = FakeMsearchES([fake_response(3, 4), fake_response()])
+        mlt = BatchMLT([1, 2], mlt_fields=['foo'], index='idx',
+                       doctype='doc', es=es, min_term_freq=1, search_size=5)
+        eq_(list(mlt), [1, 2])
+        eq_([doc._id for doc in mlt[1]], ['3', '4'])
+        eq_(len(mlt[2]), 0)
+        eq_(mlt[1].count, 2)
+
+        header = {'index': 'idx', 'type': 'doc'}
+        eq_(es.requests, [[
+            header,
+            {'query': {'more_like_this': {
+                'ids': [1], 'fields': ['foo'], 'min_term_freq': 1}},
+             'size': 5},
+            header,
+            {'query': {'more_like_this': {
+                'ids': [2], 'fields': ['foo'], 'min_term_freq': 1}},
+             'size': 5},
+        ]])
+
+    def test_s(self):
+        s = S().indexes('idx').doctypes('doc').query(
+            title__match='spam').filter(tag='awesome')
+        mlt = BatchMLT([1], s, ['foo'])
+        eq_(mlt.build_body(), [
+            {'index': 'idx', 'type': 'doc'},
+            {'query': {'bool': {'must': [
+                {'more_like_this': {'ids': [1], 'fields': ['foo']}},
+                {'match': {'title': 'spam'}}]}},
+             'filter': {'term': {'tag': 'awesome'}}}
+        ])
+
+    def test_error(self):
+        es = FakeMsearchES([fake_response(), {'error': 'boom'}])
+        mlt = BatchMLT([1, 2], index='idx', doctype='doc', es=es)
+        with assert_raises(BadSearch):
+            mlt.items()
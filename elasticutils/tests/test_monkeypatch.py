@@ -1,5 +1,10 @@
+from unittest import TestCase
+
+from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JSONSerializer
 from nose.tools import eq_
 
+from elasticutils import monkeypatch
 from elasticutils.tests import ESTestCase
 
 
@@ -83,3 +88,50 @@ class MonkeyPatchTest(ESTestCase):
         eq_(len(self.get_s()), 2)
         eq_(self.get_s().filter(color='blue')[0]._id, '1')
         eq_(self.get_s().filter(color='red')[0]._id, '2')
+
+
+class FakeTransport(object):
+    version = '0.90.13'
+
+    def __init__(self, hosts, **kwargs):
+        self.serializer = JSONSerializer()
+        self.requests = []
+
+    def perform_request(self, method, url, params=None, body=None):
+        self.requests.append((method, url))
+        if url == '/':
+            return 200, {'version': {'number': self.version}}
+        return 200, {'items': [{'index': {'_id': '1', 'ok': True}}]}
+
+
+class ServerVersionTest(TestCase):
+    def setUp(self):
+        # elasticutils patches when it builds the first Elasticsearch.
+        monkeypatch.monkeypatch_es()
+
+    def test_patched_once(self):
+        bulk = Elasticsearch.bulk
+        monkeypatch.monkeypatch_es()
+        eq_(Elasticsearch.bulk, bulk)
+
+    def test_cached(self):
+        es = Elasticsearch(transport_class=FakeTransport)
+        FakeTransport.version = '1.0.0.Beta2'
+        eq_(monkeypatch.get_server_version(es), (1, 0, 0))
+        eq_(monkeypatch.get_server_version(es), (1, 0, 0))
+        eq_(es.transport.requests, [('GET', '/')])
+
+    def test_bulk_090(self):
+        FakeTransport.version = '0.90.13'
+        es = Elasticsearch(transport_class=FakeTransport)
+        eq_(es.bulk([{'index': {'_id': 1}}, {}])['items'],
+            [{'index': {'_id': '1', 'ok': True, 'status': 201}}])
+
+    def test_bulk_1x(self):
+        FakeTransport.version = '1.2.1'
+        es = Elasticsearch(transport_class=FakeTransport)
+        eq_(es.bulk([{'index': {'_id': 1}}, {}])['items'],
+            [{'index': {'_id': '1', 'ok': True}}])
+        es.bulk([{'index': {'_id': 1}}, {}])
+        eq_([url for method, url in es.transport.requests],
+            ['/_bulk', '/', '/_bulk'])
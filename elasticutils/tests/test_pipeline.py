@@ -0,0 +1,143 @@
+import multiprocessing
+import threading
+import time
+from unittest import TestCase
+
+from nose.tools import eq_, assert_raises
+
+from elasticutils.pipeline import process_map, run_pipeline
+
+
+def square(x):
+    if x < 0:
+        raise ValueError(x)
+    return x * x
+
+
+class RunPipelineTest(TestCase):
+    def test_order_and_stats(self):
+        results = []
+        stats = run_pipeline(
+            ('read', iter(range(10))),
+            [('double', lambda x: x * 2), ('collect', results.append)])
+        eq_(results, [x * 2 for x in range(10)])
+        eq_([(s.name, s.items) for s in stats],
+            [('read', 10), ('double', 10), ('collect', 10)])
+
+    def test_overlap(self):
+        def slow(x):
+            time.sleep(0.02)
+            return x
+
+        def read():
+            for i in range(5):
+                time.sleep(0.02)
+                yield i
+
+        start = time.time()
+        stats = run_pipeline(('read', read()),
+                             [('a', slow), ('b', slow)])
+        # Sequentially this would take 0.3s.
+        assert time.time() - start < 0.25
+        for s in stats:
+            assert s.busy >= 0.09, s
+
+    def test_bounded_queues(self):
+        read_count = []
+        release = threading.Event()
+
+        def read():
+            for i in range(100):
+                read_count.append(i)
+                yield i
+
+        def slow(x):
+            release.wait()
+
+        thread = threading.Thread(target=run_pipeline, args=(
+            ('read', read()), [('slow', slow)]), kwargs={'queue_size': 2})
+        thread.start()
+        time.sleep(0.1)
+        # One in the slow stage, two in the queue and one waiting to
+        # be put.
+        assert len(read_count) <= 4, len(read_count)
+        release.set()
+        thread.join()
+        eq_(len(read_count), 100)
+
+    def test_errors(self):
+        def read():
+            for i in range(100):
+                yield i
+
+        def fail(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+
+        with assert_raises(ValueError):
+            run_pipeline(('read', read()), [('fail', fail), ('id', id)])
+
+        def fail_read():
+            yield 1
+            raise KeyError
+
+        with assert_raises(KeyError):
+            run_pipeline(('read', fail_read()), [('id', id)])
+
+    def test_cleanup(self):
+        cleaned = []
+        run_pipeline(('read', iter(range(3))), [('a', id), ('b', id)],
+                     cleanup=lambda: cleaned.append(
+                         threading.current_thread().name))
+        # The source and the first stage run in threads.
+        eq_(len(cleaned), 2)
+        assert threading.current_thread().name not in cleaned
+
+    def test_cleanup_errors(self):
+        def cleanup():
+            raise ValueError
+
+        with assert_raises(ValueError):
+            run_pipeline(('read', iter(range(3))), [('a', id), ('b', id)],
+                         cleanup=cleanup)
+
+    def test_source_in_caller(self):
+        threads = {}
+
+        def read():
+            for i in range(3):
+                threads.setdefault('read', threading.current_thread())
+                yield i
+
+        def record(name):
+            def stage(x):
+                threads.setdefault(name, threading.current_thread())
+                return x
+            return stage
+
+        results = []
+        run_pipeline(('read', read()),
+                     [('a', record('a')), ('b', record('b')),
+                      ('collect', results.append)],
+                     source_in_caller=True)
+        eq_(results, [0, 1, 2])
+        eq_(threads['read'], threading.current_thread())
+        assert threads['a'] != threading.current_thread()
+        assert threads['b'] != threads['a']
+
+
+class ProcessMapTest(TestCase):
+    def test_order(self):
+        eq_(list(process_map(square, range(20), processes=2, max_pending=3)),
+            [x * x for x in range(20)])
+
+    def test_errors(self):
+        with assert_raises(ValueError):
+            list(process_map(square, [1, -1, 2], processes=2))
+
+    def test_workers_start_at_call(self):
+        before = len(multiprocessing.active_children())
+        results = process_map(square, range(4), processes=2)
+        eq_(len(multiprocessing.active_children()), before + 2)
+        eq_(list(results), [0, 1, 4, 9])
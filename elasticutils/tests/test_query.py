@@ -120,6 +120,217 @@ class STest(TestCase):
         eq_(S(FakeMappingType).get_doctypes(), ['doctype123'])
 
 
+class FakeES(object):
+    """Records search calls and returns empty results"""
+    def __init__(self):
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'took': 1, 'hits': {'total': 0, 'hits': []}}
+
+    def suggest(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.suggest_response
+
+
+class RecordingS(S):
+    es_ = None
+
+    def _clone(self, next_step=None):
+        new = super(RecordingS, self)._clone(next_step)
+        new.es_ = self.es_
+        return new
+
+    def get_es(self, default_builder=None):
+        return self.es_
+
+
+class SearchKwargsTest(TestCase):
+    def get_search_kwargs(self, s):
+        s.es_ = FakeES()
+        s.raw()
+        return s.es_.calls[0]
+
+    def test_routing(self):
+        s = RecordingS(FakeMappingType)
+        assert 'routing' not in self.get_search_kwargs(s)
+
+        kwargs = self.get_search_kwargs(s.routing(1))
+        eq_(kwargs['routing'], '1')
+
+        kwargs = self.get_search_kwargs(s.routing('a', 'b'))
+        eq_(kwargs['routing'], 'a,b')
+
+        # Last one wins.
+        kwargs = self.get_search_kwargs(s.routing('a').routing('b'))
+        eq_(kwargs['routing'], 'b')
+
+    def test_preference(self):
+        s = RecordingS(FakeMappingType)
+        assert 'preference' not in self.get_search_kwargs(s)
+
+        kwargs = self.get_search_kwargs(s.preference('user123'))
+        eq_(kwargs['preference'], 'user123')
+
+        # Doesn't affect the body.
+        eq_(s.preference('user123').build_search(), {})
+
+
+class TrimResponseTest(TestCase):
+    def get_filter_path(self, s, method='raw'):
+        s.es_ = FakeES()
+        getattr(s, method)()
+        params = s.es_.calls[0].get('params', {})
+        return params.get('filter_path')
+
+    def test_off_by_default(self):
+        eq_(self.get_filter_path(RecordingS()), None)
+        eq_(self.get_filter_path(RecordingS().trim_response(False)), None)
+
+    def test_objects(self):
+        s = RecordingS().trim_response()
+        eq_(self.get_filter_path(s),
+            'took,hits.total,hits.hits._id,hits.hits._source,'
+            'hits.hits.fields')
+
+    def test_values_list(self):
+        s = RecordingS().trim_response().values_list('id', 'name')
+        eq_(self.get_filter_path(s),
+            'took,hits.total,hits.hits._id,hits.hits.fields')
+
+        # With no fields, results fall back to _id and _type.
+        s = RecordingS().trim_response().values_dict()
+        eq_(self.get_filter_path(s),
+            'took,hits.total,hits.hits._id,hits.hits.fields,'
+            'hits.hits._type')
+
+    def test_metadata_when_asked_for(self):
+        s = (RecordingS().trim_response().values_list('id')
+             .explain().highlight('name').facet('tag'))
+        eq_(self.get_filter_path(s),
+            'took,hits.total,hits.hits._id,hits.hits.fields,'
+            'hits.hits._explanation,hits.hits.highlight,facets')
+
+    def test_count(self):
+        s = RecordingS().trim_response()
+        eq_(self.get_filter_path(s, 'count'), 'hits.total')
+
+    def test_explicit(self):
+        s = RecordingS().trim_response('hits.hits._id')
+        eq_(self.get_filter_path(s), 'hits.hits._id')
+
+
+class SourceFilteringTest(TestCase):
+    def test_only(self):
+        eq_(S().only('id', 'title').build_search(),
+            {'_source': {'include': ['id', 'title']}})
+
+        # Last one wins.
+        eq_(S().only('id').only('title').build_search(),
+            {'_source': {'include': ['title']}})
+
+        # None clears it.
+        eq_(S().only('id').only(None).build_search(), {})
+
+    def test_defer(self):
+        eq_(S().defer('body').build_search(),
+            {'_source': {'exclude': ['body']}})
+
+        # Calls are cumulative.
+        eq_(S().defer('body').defer('notes', 'body').build_search(),
+            {'_source': {'exclude': ['body', 'notes']}})
+
+        # None clears it.
+        eq_(S().defer('body').defer(None).build_search(), {})
+
+    def test_only_and_defer(self):
+        eq_(S().only('user.*').defer('user.bio').build_search(),
+            {'_source': {'include': ['user.*'], 'exclude': ['user.bio']}})
+
+
+class MoreLikeThisTest(TestCase):
+    def test_ids(self):
+        eq_(S().more_like_this(1, fields=['title'], min_term_freq=1)
+            .build_search(),
+            {'query': {'more_like_this': {
+                'ids': [1], 'fields': ['title'], 'min_term_freq': 1}}})
+
+        eq_(S().more_like_this([1, 2]).build_search(),
+            {'query': {'more_like_this': {'ids': [1, 2]}}})
+
+    def test_docs(self):
+        eq_(S().more_like_this([1, {'_id': 2, '_type': 'other'},
+                                {'title': 'Firefox'}]).build_search(),
+            {'query': {'more_like_this': {'docs': [
+                {'_id': 1}, {'_id': 2, '_type': 'other'},
+                {'doc': {'title': 'Firefox'}}]}}})
+
+    def test_combined(self):
+        s = (S().query(title__match='firefox').filter(product='desktop')
+             .more_like_this(1)[:5])
+        eq_(s.build_search(), {
+            'query': {'bool': {'must': [
+                {'more_like_this': {'ids': [1]}},
+                {'match': {'title': 'firefox'}}]}},
+            'filter': {'term': {'product': 'desktop'}},
+            'size': 5})
+
+        # Last one wins.
+        eq_(S().more_like_this(1).more_like_this(2).build_search(),
+            {'query': {'more_like_this': {'ids': [2]}}})
+
+
+class SuggestTest(TestCase):
+    def test_suggesters(self):
+        s = (S().suggest('terms', 'mary')
+             .suggest('phrases', 'mary had', field='name', type='phrase')
+             .suggest('titles', 'ma', field='name_complete',
+                      type='completion', size=3))
+        eq_(s.build_search(), {'suggest': {
+            'terms': {'text': 'mary', 'term': {'field': '_all'}},
+            'phrases': {'text': 'mary had', 'phrase': {'field': 'name'}},
+            'titles': {'text': 'ma', 'completion': {
+                'field': 'name_complete', 'size': 3}}}})
+
+    def test_suggest_only(self):
+        es = FakeES()
+        es.suggest_response = {
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'terms': [
+                {'text': 'mary', 'offset': 0, 'length': 4, 'options': [
+                    {'text': 'mark', 'score': 0.75, 'freq': 1},
+                    {'text': 'mart', 'score': 0.75, 'freq': 1}]},
+                {'text': 'lamb', 'offset': 5, 'length': 4, 'options': [
+                    {'text': 'lamp', 'score': 0.75, 'freq': 2}]}],
+            'titles': [
+                {'text': 'ma', 'offset': 0, 'length': 2, 'options': []}]}
+        s = (RecordingS().indexes('test').doctypes('doc')
+             .query(name__match='mary').filter(id=1)
+             .suggest('terms', 'mary lamb', field='name')
+             .suggest('titles', 'ma', field='name_complete',
+                      type='completion')
+             .routing(2))
+        s.es_ = es
+
+        eq_(s.suggest_only(), {'terms': ['mark', 'mart', 'lamp'],
+                               'titles': []})
+        # Only the suggest clauses are sent, not the query or filter.
+        eq_(es.calls, [{
+            'body': {
+                'terms': {'text': 'mary lamb', 'term': {'field': 'name'}},
+                'titles': {'text': 'ma',
+                           'completion': {'field': 'name_complete'}}},
+            'index': ['test'],
+            'params': {'routing': '2'}}])
+
+    def test_suggest_only_without_suggestions(self):
+        s = RecordingS().query(name__match='mary')
+        s.es_ = FakeES()
+        eq_(s.suggest_only(), {})
+        eq_(s.es_.calls, [])
+
+
 class QTest(TestCase):
     def test_q_should(self):
         q = Q(foo__match='abc', bar__match='def', should=True)
@@ -1550,6 +1761,38 @@ class SearchTypeTest(ESTestCase):
         eq_(len(s[:1]), 2)
 
 
+class RoutingTest(ESTestCase):
+    mapping = SearchTypeTest.mapping
+
+    @classmethod
+    def setup_class(cls):
+        super(RoutingTest, cls).setup_class()
+        cls.cleanup_index()
+        cls.create_index(settings={
+            'number_of_shards': 2,
+        }, mappings=cls.mapping)
+        cls.index_data([
+            {'id': 1, 'shard': 1, 'text': 'asdf'},
+            {'id': 2, 'shard': 2, 'text': 'asdf'},
+        ])
+        cls.refresh()
+
+    def test_routing(self):
+        eq_(len(self.get_s()), 2)
+
+        # Routing picks shards, so we filter, too.
+        s = self.get_s().routing(1).filter(shard=1)
+        eq_([r['id'] for r in s], [1])
+        s = self.get_s().routing(2).filter(shard=2)
+        eq_([r['id'] for r in s], [2])
+
+        eq_(self.get_s().routing(1, 2).count(), 2)
+
+    def test_preference(self):
+        eq_(len(self.get_s().preference('_local')), 2)
+        eq_(len(self.get_s().preference('user123')), 2)
+
+
 class ValuesTest(ESTestCase):
     def test_values_list_chaining(self):
         s = self.get_s()
@@ -1637,6 +1880,12 @@ class SuggestionTest(ESTestCase):
         options = [o['text'] for o in suggestions['mysuggest'][0]['options']]
         eq_(options, ['mark'])
 
+    @require_version('0.90')
+    def test_suggest_only(self):
+        s = (self.get_s().query(name__match='mary')
+                         .suggest('mysuggest', 'mary', field='name'))
+        eq_(s.suggest_only(), {'mysuggest': ['mark']})
+
 
 def test_to_python():
     def check_to_python(obj, expected):
@@ -4,7 +4,7 @@ import pickle
 from nose.tools import eq_
 
 from elasticutils import S, DefaultMappingType, NoModelError, MappingType
-from elasticutils.tests import ESTestCase
+from elasticutils.tests import ESTestCase, require_version
 
 
 model_cache = []
@@ -77,6 +77,38 @@ class TestResultsWithData(ESTestCase):
         searcher = list(self.get_s(FakeMappingType).query(foo='bar'))
         assert isinstance(searcher[0], FakeMappingType)
 
+    @require_version('1.0')
+    def test_only(self):
+        """With only, typed results have just those fields."""
+        results = list(self.get_s(FakeMappingType)
+                       .query(foo='bar')
+                       .only('id', 'tag'))
+        assert isinstance(results[0], FakeMappingType)
+        eq_(sorted(results[0]), ['id', 'tag'])
+        eq_(results[0].tag, 'awesome')
+
+    @require_version('1.0')
+    def test_defer(self):
+        """With defer, typed results don't have those fields."""
+        results = list(self.get_s(FakeMappingType)
+                       .query(foo='bar')
+                       .defer('foo', 'width'))
+        eq_(sorted(results[0]), ['id', 'tag'])
+
+    @require_version('1.6')
+    def test_trim_response(self):
+        """Trimmed responses have values but no unused metadata."""
+        s = self.get_s().query(foo='bar').trim_response()
+        eq_(s.count(), 1)
+
+        results = list(s.values_list('foo'))
+        eq_(list(results[0]), [[u'bar']])
+        eq_(results[0]._id, u'1')
+        eq_(results[0].es_meta.score, None)
+
+        results = list(s)
+        eq_(results[0].tag, u'awesome')
+
     def test_values_dict_no_fields(self):
         """With values_dict, return list of dicts."""
         searcher = list(self.get_s().query(foo='bar').values_dict())
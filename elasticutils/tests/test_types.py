@@ -1,8 +1,14 @@
-from nose.tools import eq_
+from unittest import TestCase
 
+from elasticsearch.exceptions import ConflictError
+from nose.tools import eq_, assert_raises
+
+import elasticutils
 from elasticutils import get_es
-from elasticutils import S, MappingType, Indexable
-from elasticutils.tests import ESTestCase
+from elasticutils import S, MappingType, Indexable, ReindexError
+from elasticutils.fingerprint import SQLiteFingerprintStore
+from elasticutils.tests import ESTestCase, require_version
+from elasticutils.tests.test_bulk import FakeBulkES
 
 
 class FakeModel(object):
@@ -107,7 +113,9 @@ class ModelTest(ESTestCase):
             documents.append(
                 FakeMappingType.extract_document(obj_id=obj.id, obj=obj))
 
-        FakeMappingType.bulk_index(documents, id_field='id')
+        summary = FakeMappingType.bulk_index(documents, id_field='id')
+        eq_(summary.succeeded, 2)
+        eq_(summary.errors, [])
         FakeMappingType.refresh_index()
             
         s = S(FakeMappingType)
@@ -115,6 +123,17 @@ class ModelTest(ESTestCase):
         eq_(sorted([res.title for res in s.execute()]),
             ['First post!', 'Second post!'])
 
+    def test_bulk_index_chunks_and_workers(self):
+        documents = [{'id': i, 'title': 'Post %d' % i, 'tags': ['blog']}
+                     for i in range(50)]
+
+        summary = FakeMappingType.bulk_index(
+            documents, chunk_size=7, max_chunk_bytes=1024, workers=3)
+        eq_(summary.succeeded, 50)
+        FakeMappingType.refresh_index()
+
+        eq_(S(FakeMappingType).count(), 50)
+
     def test_unindex(self):
         obj1 = FakeModel(id=1, title='First post!', tags=['blog', 'post'])
         FakeMappingType.index(
@@ -132,3 +151,555 @@ class ModelTest(ESTestCase):
 
         s = S(FakeMappingType)
         eq_(s.count(), 0)
+
+    def test_routing(self):
+        class RoutedMappingType(FakeMappingType):
+            @classmethod
+            def get_routing(cls, document):
+                return document['tags'][0]
+
+        obj1 = FakeModel(id=1, title='First post!', tags=['blog', 'post'])
+        obj2 = FakeModel(id=2, title='Second post!', tags=['news', 'post'])
+        RoutedMappingType.index(
+            RoutedMappingType.extract_document(obj_id=obj1.id, obj=obj1),
+            id_=obj1.id)
+        RoutedMappingType.bulk_index(
+            [RoutedMappingType.extract_document(obj_id=obj2.id, obj=obj2)])
+        RoutedMappingType.refresh_index()
+
+        es = RoutedMappingType.get_es()
+        doc = es.get(index=RoutedMappingType.get_index(),
+                     doc_type=RoutedMappingType.get_mapping_type_name(),
+                     id=2, routing='news')
+        eq_(doc['_source']['title'], obj2.title)
+
+        eq_(S(RoutedMappingType).routing('blog', 'news').count(), 2)
+
+        RoutedMappingType.unindex(id_=obj1.id, routing='blog')
+        RoutedMappingType.refresh_index()
+        eq_(S(RoutedMappingType).count(), 1)
+
+    def test_version(self):
+        class VersionedMappingType(FakeMappingType):
+            @classmethod
+            def get_version(cls, document):
+                return document['version']
+
+        doc = {'id': 1, 'title': 'New', 'version': 2}
+        VersionedMappingType.index(doc, id_=1)
+        VersionedMappingType.index(dict(doc, title='Old', version=1), id_=1)
+        summary = VersionedMappingType.bulk_index(
+            [dict(doc, title='Old', version=1)])
+        eq_(summary.conflicts, 1)
+        eq_(summary.errors, [])
+        VersionedMappingType.refresh_index()
+
+        es = VersionedMappingType.get_es()
+        doc = es.get(index=VersionedMappingType.get_index(),
+                     doc_type=VersionedMappingType.get_mapping_type_name(),
+                     id=1)
+        eq_(doc['_source']['title'], 'New')
+        eq_(doc['_version'], 2)
+
+    @require_version('1.0')
+    def test_update(self):
+        FakeMappingType.index({'id': 1, 'title': 'First', 'votes': 1}, id_=1)
+        FakeMappingType.update(1, {'title': 'Edited'})
+        FakeMappingType.update(2, {'votes': 1}, upsert={'id': 2, 'votes': 0})
+        summary = FakeMappingType.bulk_increment({1: {'votes': 2},
+                                                  2: {'votes': 1}})
+        eq_(summary.succeeded, 2)
+        FakeMappingType.refresh_index()
+
+        es = FakeMappingType.get_es()
+        doc = es.get(index=FakeMappingType.get_index(),
+                     doc_type=FakeMappingType.get_mapping_type_name(), id=1)
+        eq_(doc['_source'], {'id': 1, 'title': 'Edited', 'votes': 3})
+        doc = es.get(index=FakeMappingType.get_index(),
+                     doc_type=FakeMappingType.get_mapping_type_name(), id=2)
+        eq_(doc['_source'], {'id': 2, 'votes': 1})
+
+    def test_reindex_mode(self):
+        es = FakeMappingType.get_es()
+        index = FakeMappingType.get_index()
+
+        def settings():
+            resp = es.indices.get_settings(index=index, flat_settings=True)
+            return resp[index]['settings']
+
+        original = settings()
+        with FakeMappingType.reindex_mode(optimize=True):
+            eq_(settings()['index.refresh_interval'], '-1')
+            eq_(settings()['index.number_of_replicas'], '0')
+            FakeMappingType.index({'id': 1, 'title': 'First post!'}, id_=1)
+
+        eq_(settings()['index.number_of_replicas'],
+            original['index.number_of_replicas'])
+        # The index is refreshed on exit.
+        eq_(S(FakeMappingType).count(), 1)
+
+    def test_rebuild_index(self):
+        alias = ESTestCase.index_name + '_alias'
+
+        class AliasedMappingType(FakeMappingType):
+            @classmethod
+            def get_index(cls):
+                return alias
+
+        es = AliasedMappingType.get_es()
+        FakeModel(id=1, title='First post!', tags=['blog', 'post'])
+        FakeModel(id=2, title='Second post!', tags=['blog', 'post'])
+        try:
+            first = AliasedMappingType.rebuild_index()
+            eq_(list(es.indices.get_alias(name=alias)), [first])
+            eq_(S(AliasedMappingType).count(), 2)
+
+            FakeModel(id=3, title='Third post!', tags=['blog', 'post'])
+            second = AliasedMappingType.rebuild_index()
+            eq_(list(es.indices.get_alias(name=alias)), [second])
+            eq_(es.indices.exists(index=first), False)
+            eq_(S(AliasedMappingType).count(), 3)
+        finally:
+            es.indices.delete(index=alias + '_*', ignore=404)
+
+    def test_bulk_unindex(self):
+        documents = [{'id': i, 'title': 'Post %d' % i, 'tags': ['blog']}
+                     for i in range(5)]
+        FakeMappingType.bulk_index(documents)
+        FakeMappingType.refresh_index()
+
+        # 42 isn't in the index, which is fine.
+        summary = FakeMappingType.bulk_unindex([0, 1, 42], chunk_size=2)
+        eq_(summary.succeeded, 3)
+        eq_(summary.errors, [])
+        FakeMappingType.refresh_index()
+        eq_(S(FakeMappingType).count(), 3)
+
+    def test_unindex_by_query(self):
+        FakeMappingType.bulk_index([
+            {'id': 1, 'title': 'First post!', 'tags': ['blog']},
+            {'id': 2, 'title': 'Second post!', 'tags': ['news']},
+            {'id': 3, 'title': 'Third post!', 'tags': ['news']},
+        ])
+        FakeMappingType.refresh_index()
+
+        FakeMappingType.unindex_by_query(
+            S(FakeMappingType).filter(tags='news'))
+        FakeMappingType.refresh_index()
+        eq_([doc.id for doc in S(FakeMappingType)], [1])
+
+
+class FakeIndicesClient(object):
+    def __init__(self, calls, settings):
+        self.calls = calls
+        self.settings = settings
+
+    def get_settings(self, index, flat_settings):
+        return dict((name, {'settings': dict(settings)})
+                    for name, settings in self.settings.items())
+
+    def put_settings(self, index, body):
+        self.calls.append(('put_settings', index, body))
+        self.settings[index].update(body)
+
+    def refresh(self, index):
+        self.calls.append(('refresh', index))
+
+    def optimize(self, index, **kwargs):
+        self.calls.append(('optimize', index, kwargs))
+
+
+class FakeIndicesES(object):
+    def __init__(self, settings):
+        self.calls = []
+        self.indices = FakeIndicesClient(self.calls, settings)
+
+
+class ReindexModeTest(TestCase):
+    def test_settings_restored(self):
+        es = FakeIndicesES({
+            'test_1': {'index.number_of_replicas': '2'},
+            'test_2': {'index.number_of_replicas': '1',
+                       'index.refresh_interval': '30s'},
+        })
+        with FakeMappingType.reindex_mode(es=es, index='test'):
+            eq_(sorted(call[1] for call in es.calls), ['test_1', 'test_2'])
+            for call in es.calls:
+                eq_(call[2], {'index.refresh_interval': '-1',
+                              'index.number_of_replicas': '0'})
+            del es.calls[:]
+
+        eq_(es.indices.settings, {
+            'test_1': {'index.number_of_replicas': '2',
+                       'index.refresh_interval': '1s'},
+            'test_2': {'index.number_of_replicas': '1',
+                       'index.refresh_interval': '30s'},
+        })
+        eq_(es.calls[-1], ('refresh', 'test'))
+
+    def test_optimize(self):
+        es = FakeIndicesES({'test': {'index.number_of_replicas': '1'}})
+        with FakeMappingType.reindex_mode(es=es, index='test',
+                                          optimize=True, max_num_segments=1):
+            pass
+        eq_(es.calls[-2:], [('refresh', 'test'),
+                            ('optimize', 'test', {'max_num_segments': 1})])
+
+    def test_restored_on_error(self):
+        es = FakeIndicesES({'test': {'index.number_of_replicas': '1'}})
+        try:
+            with FakeMappingType.reindex_mode(es=es, index='test',
+                                              optimize=True):
+                raise ValueError
+        except ValueError:
+            pass
+        eq_(es.indices.settings['test']['index.number_of_replicas'], '1')
+        # Don't optimize a half-built index.
+        eq_(es.calls[-1], ('refresh', 'test'))
+
+
+class FakeRebuildIndicesClient(object):
+    def __init__(self, calls, aliases):
+        self.calls = calls
+        # alias -> list of indexes
+        self.aliases = {'test': list(aliases)}
+
+    def get_alias(self, name, **kwargs):
+        self.calls.append(('get_alias', None))
+        return dict((index, {'aliases': {name: {}}})
+                    for index in self.aliases.get(name, []))
+
+    def put_alias(self, index, name, **kwargs):
+        self.calls.append(('put_alias', index))
+        self.aliases.setdefault(name, []).append(index)
+
+    def delete_alias(self, index, name, **kwargs):
+        self.calls.append(('delete_alias', index))
+        self.aliases[name].remove(index)
+
+    def update_aliases(self, body):
+        self.calls.append(('update_aliases', None))
+        self.calls.append(body)
+        for action in body['actions']:
+            for op, params in action.items():
+                indexes = self.aliases.setdefault(params['alias'], [])
+                if op == 'add':
+                    indexes.append(params['index'])
+                else:
+                    indexes.remove(params['index'])
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((name, kwargs.get('index')))
+            if name == 'get_settings':
+                return {kwargs['index']: {'settings': {}}}
+            if name == 'exists':
+                return False
+        return method
+
+
+class FakeRebuildES(FakeBulkES):
+    def __init__(self, aliases=(), **kwargs):
+        super(FakeRebuildES, self).__init__(**kwargs)
+        self.indices = FakeRebuildIndicesClient(self.requests, aliases)
+
+    def index(self, **kwargs):
+        self.requests.append(('index', kwargs['index']))
+
+    def delete(self, **kwargs):
+        self.requests.append(('delete', kwargs['index'], kwargs.get('ignore')))
+
+
+class RebuildIndexTest(TestCase):
+    def setUp(self):
+        es = self.es = FakeRebuildES(aliases=['test_old'])
+        store = self.store = SQLiteFingerprintStore(':memory:')
+
+        class RebuildMappingType(FakeMappingType):
+            @classmethod
+            def get_index(cls):
+                return 'test'
+
+            @classmethod
+            def get_es(cls):
+                return es
+
+            @classmethod
+            def get_fingerprint_store(cls):
+                return store
+
+            @classmethod
+            def get_indexable_documents(cls):
+                yield {'id': 1}
+                # Writes while the rebuild is running go to both, in
+                # any process.
+                elasticutils._rebuilding.clear()
+                cls.index({'id': 2}, id_=2)
+                cls.unindex(3)
+                yield {'id': 2}
+
+        self.mapping_type = RebuildMappingType
+        # Look the rebuild alias up on every write.
+        self.check_interval = elasticutils.REBUILD_CHECK_INTERVAL
+        elasticutils.REBUILD_CHECK_INTERVAL = 0
+
+    def tearDown(self):
+        elasticutils.REBUILD_CHECK_INTERVAL = self.check_interval
+        elasticutils._rebuilding.clear()
+
+    def test_rebuild(self):
+        doc_type = self.mapping_type.get_mapping_type_name()
+        self.store.set_many({('test', doc_type, 5): 'abc'})
+
+        new_index = self.mapping_type.rebuild_index()
+        assert new_index.startswith('test_')
+
+        requests = self.es.requests
+        eq_(requests[:2], [('create', new_index), ('put_alias', new_index)])
+        eq_(requests.index(('index', 'test')) + 1,
+            requests.index(('index', new_index)))
+        eq_(requests.index(('delete', 'test', None)) + 1,
+            requests.index(('delete', new_index, 404)))
+        eq_([{'index': {'_id': 1}}, {'id': 1},
+             {'index': {'_id': 2}}, {'id': 2}],
+            [r for r in requests if isinstance(r, list)][0])
+        eq_(requests[-2:], [
+            {'actions': [
+                {'remove': {'index': 'test_old', 'alias': 'test'}},
+                {'add': {'index': new_index, 'alias': 'test'}},
+                {'remove': {'index': new_index,
+                            'alias': 'test_rebuilding'}}]},
+            ('delete', 'test_old')
+        ])
+
+        # Once it's done, writes only go to the alias.
+        eq_(self.mapping_type.get_write_indexes(), ['test'])
+
+        # The fingerprints for the alias are gone and none were kept
+        # for the new index.
+        eq_(self.store.get_many(None, [('test', doc_type, 5)]), {})
+        eq_(self.store.get_many(None, [(new_index, doc_type, 1)]), {})
+
+    def test_other_process(self):
+        self.es.indices.aliases['test_rebuilding'] = ['test_1']
+        eq_(self.mapping_type.get_write_indexes(), ['test', 'test_1'])
+
+        # It's cached for REBUILD_CHECK_INTERVAL.
+        elasticutils.REBUILD_CHECK_INTERVAL = 60
+        self.es.indices.aliases['test_rebuilding'] = []
+        eq_(self.mapping_type.get_write_indexes(), ['test', 'test_1'])
+        elasticutils._rebuilding.clear()
+        eq_(self.mapping_type.get_write_indexes(), ['test'])
+
+    def test_errors(self):
+        self.es.statuses = {2: [400]}
+        with assert_raises(ReindexError):
+            self.mapping_type.rebuild_index()
+
+        requests = self.es.requests
+        assert ('update_aliases', None) not in requests
+        # Writes stop going to the new index before it's deleted.
+        eq_(requests[-2][0], 'delete_alias')
+        eq_(requests[-1][0], 'delete')
+        assert requests[-1][1].startswith('test_')
+        eq_(self.mapping_type.get_write_indexes(), ['test'])
+
+
+class FakeDeleteES(FakeBulkES):
+    def __init__(self, version='1.2.1', **kwargs):
+        super(FakeDeleteES, self).__init__(**kwargs)
+        self.version = version
+
+    def info(self):
+        return {'version': {'number': self.version}}
+
+    def delete_by_query(self, **kwargs):
+        self.requests.append(kwargs)
+        return {}
+
+
+class UnindexTest(TestCase):
+    def test_bulk_unindex(self):
+        es = FakeBulkES(statuses={2: [404], 3: [500]})
+        summary = FakeMappingType.bulk_unindex(
+            [1, 2, 3], es=es, routing='a', chunk_size=2)
+        eq_(es.requests, [
+            [{'delete': {'_id': 1, '_routing': 'a'}},
+             {'delete': {'_id': 2, '_routing': 'a'}}],
+            [{'delete': {'_id': 3, '_routing': 'a'}}],
+        ])
+        eq_([item['_id'] for item in summary.errors], [3])
+
+    def test_unindex_by_query(self):
+        es = FakeDeleteES()
+        FakeMappingType.unindex_by_query(
+            S().query(title__match='spam').filter(tenant=5), es=es,
+            routing=5)
+        eq_(es.requests, [{
+            'index': FakeMappingType.get_index(),
+            'doc_type': FakeMappingType.get_mapping_type_name(),
+            'routing': 5,
+            'body': {'query': {'filtered': {
+                'query': {'match': {'title': 'spam'}},
+                'filter': {'term': {'tenant': 5}}}}}
+        }])
+
+        del es.requests[:]
+        FakeMappingType.unindex_by_query({'match_all': {}}, es=es)
+        eq_(es.requests[0]['body'], {'query': {'match_all': {}}})
+
+    def test_unindex_by_query_090(self):
+        # ES 0.90 takes the bare query.
+        es = FakeDeleteES(version='0.90.13')
+        FakeMappingType.unindex_by_query({'match_all': {}}, es=es)
+        eq_(es.requests[0]['body'], {'match_all': {}})
+
+
+class VersionedMappingType(FakeMappingType):
+    @classmethod
+    def get_version(cls, document):
+        return document.get('version')
+
+
+class FakeConflictES(FakeBulkES):
+    def index(self, **kwargs):
+        self.requests.append(kwargs)
+        if kwargs.get('version', 0) < 3:
+            raise ConflictError(409, 'VersionConflictEngineException', {})
+        return {}
+
+
+class VersionTest(TestCase):
+    def test_bulk_index(self):
+        es = FakeBulkES(statuses={2: [409]})
+        summary = VersionedMappingType.bulk_index(
+            [{'id': 1, 'version': 5}, {'id': 2, 'version': 5}, {'id': 3}],
+            es=es)
+        eq_([line for line in es.requests[0] if 'index' in line], [
+            {'index': {'_id': 1, '_version': 5,
+                       '_version_type': 'external'}},
+            {'index': {'_id': 2, '_version': 5,
+                       '_version_type': 'external'}},
+            {'index': {'_id': 3}}])
+        eq_((summary.succeeded, summary.conflicts), (2, 1))
+        eq_(summary.errors, [])
+
+    def test_index(self):
+        es = FakeConflictES()
+        VersionedMappingType.index({'id': 1, 'version': 5}, id_=1, es=es)
+        eq_(es.requests[-1]['version'], 5)
+        eq_(es.requests[-1]['version_type'], 'external')
+
+        # Conflicts are skipped.
+        VersionedMappingType.index({'id': 1, 'version': 5}, id_=1, es=es,
+                                   version=2)
+        eq_(es.requests[-1]['version'], 2)
+
+        # Unless there's no version.
+        with assert_raises(ConflictError):
+            FakeMappingType.index({'id': 1}, id_=1, es=es)
+
+
+class FakeUpdateES(FakeBulkES):
+    def __init__(self, sources=None, **kwargs):
+        super(FakeUpdateES, self).__init__(**kwargs)
+        self.sources = sources or {}
+        self.updates = []
+
+    def update(self, **kwargs):
+        self.updates.append(kwargs)
+
+    def mget(self, index, doc_type, body):
+        docs = []
+        for doc in body['docs']:
+            version, source = self.sources.get(doc['_id'], (None, None))
+            docs.append({'_id': str(doc['_id']), 'found': source is not None,
+                         '_version': version, '_source': source})
+        return {'docs': docs}
+
+
+class UpdateTest(TestCase):
+    def test_update(self):
+        es = FakeUpdateES()
+        FakeMappingType.update(1, {'votes': 5}, upsert={'votes': 0},
+                               es=es, routing='a')
+        eq_(es.updates, [{
+            'index': FakeMappingType.get_index(),
+            'doc_type': FakeMappingType.get_mapping_type_name(),
+            'id': 1, 'routing': 'a',
+            'body': {'doc': {'votes': 5}, 'upsert': {'votes': 0}}}])
+
+    def test_bulk_update(self):
+        es = FakeBulkES(statuses={2: [404]})
+        summary = FakeMappingType.bulk_update(
+            [{'id': 1, 'votes': 5}, {'id': 2, 'votes': 1}], es=es)
+        eq_(es.requests, [[
+            {'update': {'_id': 1}}, {'doc': {'votes': 5}},
+            {'update': {'_id': 2}}, {'doc': {'votes': 1}}]])
+        eq_([item['_id'] for item in summary.errors], [2])
+
+        es = FakeBulkES()
+        FakeMappingType.bulk_update([{'id': 1, 'votes': 5}], upsert=True,
+                                    es=es)
+        eq_(es.requests[0][1], {'doc': {'votes': 5}, 'doc_as_upsert': True})
+
+    def test_bulk_increment(self):
+        es = FakeUpdateES(sources={1: (3, {'votes': 10}), 2: (1, {})},
+                          statuses={1: [409]})
+        summary = FakeMappingType.bulk_increment(
+            {1: {'votes': 2}, 2: {'votes': 1, 'views': 5}, 3: {'votes': 1}},
+            es=es)
+        eq_(sorted(es.requests[0][1::2], key=repr), [
+            {'doc': {'views': 5, 'votes': 1}}, {'doc': {'votes': 12}}])
+        # The conflict was read and sent again.
+        eq_(es.requests[1], [{'update': {'_id': 1, '_version': 3}},
+                             {'doc': {'votes': 12}}])
+        eq_(summary.succeeded, 2)
+        eq_([(item['_id'], item['status']) for item in summary.errors],
+            [(3, 404)])
+
+    def test_bulk_increment_gives_up(self):
+        es = FakeUpdateES(sources={1: (3, {'votes': 10})},
+                          statuses={1: [409, 409]})
+        summary = FakeMappingType.bulk_increment({1: {'votes': 1}}, es=es,
+                                                 max_conflicts=1)
+        eq_(len(es.requests), 2)
+        eq_([item['status'] for item in summary.errors], [409])
+
+
+class ExtractDocumentsTest(TestCase):
+    def tearDown(self):
+        FakeModel.reset()
+
+    def test_extract_documents(self):
+        objs = [FakeModel(id=1, title='First post!', tags=['blog']),
+                FakeModel(id=2, title='Second post!', tags=['blog']),
+                FakeModel(id=3)]
+        # The one without a title and tags is left out.
+        eq_([doc['id'] for doc in FakeMappingType.extract_documents(objs)],
+            [1, 2])
+
+    def test_get_indexable_documents(self):
+        class BatchMappingType(FakeMappingType):
+            batches = []
+
+            @classmethod
+            def extract_documents(cls, objs):
+                cls.batches.append([obj.id for obj in objs])
+                return [{'id': obj.id} for obj in objs]
+
+        for i in range(5):
+            FakeModel(id=i, title='Post', tags=[])
+
+        documents = list(BatchMappingType.get_indexable_documents(
+            chunk_size=2))
+        eq_(sorted(doc['id'] for doc in documents), list(range(5)))
+        eq_([len(batch) for batch in BatchMappingType.batches], [2, 2, 1])
+
+    def test_get_indexable_documents_processes(self):
+        for i in range(1, 6):
+            FakeModel(id=i, title='Post %d' % i, tags=['blog'])
+
+        eq_(list(FakeMappingType.get_indexable_documents(
+            chunk_size=2, processes=2)),
+            list(FakeMappingType.get_indexable_documents(chunk_size=2)))
@@ -1,9 +1,6 @@
 from itertools import islice
 
 
-from elasticsearch.serializer import JSONSerializer
-
-
 def to_json(data):
     """Convert Python structure to JSON used by Elasticsearch
 
@@ -27,6 +24,8 @@ def to_json(data):
     '{"query": {"match": {"message": "test message"}}}'
 
     """
+    from elasticsearch.serializer import JSONSerializer
+
     return JSONSerializer().dumps(data)
 
 